@@ -0,0 +1,553 @@
+"""
+에이전트 실행 로직 (Streamlit과 무관한 부분)
+
+app_KOR.py가 공유 이벤트 루프에서 실행하는 코루틴과 도구 결과 변환 함수를 모아 둔 모듈입니다.
+st.* 를 호출하지 않으므로 앱 밖(벤치마크 등)에서도 같은 코드 경로를 그대로 실행할 수 있습니다.
+
+- process_query: 사용자 질문 하나를 에이전트로 처리 (스트리밍 콜백은 get_streaming_callback으로 생성)
+- run_initial_tools_and_summarize: 날씨/일정/이메일 도구를 동시에 호출해 초기 인사말 생성
+"""
+import asyncio
+import json
+import os
+import time
+
+import anyio
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage
+from langchain_core.messages.ai import AIMessageChunk
+from langchain_core.messages.tool import ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langchain_teddynote.messages import astream_graph
+
+from metrics import MetricsCallbackHandler, track_query
+from tracing import TracingCallbackHandler, get_tracer
+
+load_dotenv()
+
+# --- 도구 결과 표시 --- START
+# GSuite 도구는 압축 JSON 레코드({"status", "count", "items", "next_cursor", "message"})를 반환하고, 표시는 앱이 담당한다.
+TOOL_FIELD_LABELS = {
+    "id": "ID", "threadId": "스레드 ID", "from": "발신자", "to": "수신자", "subject": "제목", "date": "날짜",
+    "snippet": "내용 미리보기", "labels": "라벨", "summary": "제목", "start": "시작", "location": "장소",
+    "description": "설명", "link": "링크", "attendees": "참석자",
+}
+
+
+def parse_tool_result(content):
+    """도구 결과 문자열을 JSON으로 한 번만 해석합니다. (JSON이 아니면 문자열 그대로 반환)"""
+    if not isinstance(content, str):
+        return content
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return content
+
+
+def _format_cell(value, escape_pipe=True):
+    if isinstance(value, list):
+        value = ", ".join(str(item) for item in value)
+    value = str(value).replace("\n", " ")
+    return value.replace("|", "\\|") if escape_pipe else value
+
+
+def tool_result_to_markdown(result):
+    """파싱된 도구 결과를 채팅 기록 표시용 마크다운으로 변환합니다. (레코드 목록은 표로 표시)"""
+    if isinstance(result, dict) and isinstance(result.get("items"), list):
+        if not result["items"]:
+            return result.get("message", "결과가 없습니다.")
+        columns = []
+        for item in result["items"]:
+            columns.extend(key for key in item if key not in columns)
+        lines = [
+            "| " + " | ".join(TOOL_FIELD_LABELS.get(column, column) for column in columns) + " |",
+            "|" + "---|" * len(columns),
+        ]
+        lines.extend("| " + " | ".join(_format_cell(item.get(column, "")) for column in columns) + " |" for item in result["items"])
+        if result.get("next_cursor"):
+            lines.append(f"\n_결과가 더 있습니다. (다음 페이지 커서: `{result['next_cursor']}`)_")
+        return "\n".join(lines)
+    if isinstance(result, (dict, list)):
+        return f"```json\n{json.dumps(result, indent=2, ensure_ascii=False)}\n```"
+    return f"```text\n{result}\n```"
+
+
+def tool_result_to_text(content):
+    """
+    도구 결과를 LLM 프롬프트에 넣을 간결한 텍스트로 변환합니다.
+    레코드 목록은 한 줄에 하나씩 값만 나열하고, 결과가 없으면 message를 반환합니다.
+    """
+    result = parse_tool_result(content)
+    if isinstance(result, dict) and isinstance(result.get("items"), list):
+        if not result["items"]:
+            return result.get("message", "")
+        return "\n".join(
+            "- " + " / ".join(_format_cell(value, escape_pipe=False) for key, value in item.items() if key != "id")
+            for item in result["items"]
+        )
+    return content
+# --- 도구 결과 표시 --- END
+
+
+# --- 사용자 정의 예외 --- START
+class StopStreamAndRerun(Exception):
+    """콜백에서 스트림 중단 및 rerun 필요 신호를 보내기 위한 예외"""
+    pass
+# --- 사용자 정의 예외 --- END
+
+
+# --- 초기 인사말 도구 동시 호출 설정 --- START
+# 전체 마감 시간(초): 이 시간 안에 끝난 도구 결과만으로 인사말을 만든다.
+GREETING_TOOLS_DEADLINE = float(os.getenv("GREETING_TOOLS_DEADLINE", "8"))
+# 도구별 타임아웃(초)
+GREETING_TOOL_TIMEOUT = float(os.getenv("GREETING_TOOL_TIMEOUT", "6"))
+
+
+async def run_tools_concurrently(tool_calls, deadline=None, per_tool_timeout=None, tool_timings=None):
+    """
+    여러 도구를 동시에 호출하고, 마감 시간 안에 끝난 결과만 모아 반환합니다.
+
+    매개변수:
+        tool_calls: {이름: (도구, 인자 딕셔너리)} 형태의 호출 목록
+        deadline: 전체 마감 시간(초). None이면 GREETING_TOOLS_DEADLINE 사용
+        per_tool_timeout: 도구별 타임아웃(초). None이면 GREETING_TOOL_TIMEOUT 사용
+        tool_timings: 전달되면 도구별 시작/종료 시각과 상태를 기록할 딕셔너리
+
+    반환값:
+        dict: {이름: 결과 문자열}. 실패/타임아웃/마감 초과한 도구는 None
+    """
+    if deadline is None:
+        deadline = GREETING_TOOLS_DEADLINE
+    if per_tool_timeout is None:
+        per_tool_timeout = GREETING_TOOL_TIMEOUT
+
+    started_at = time.perf_counter()
+    timings = {}
+    greeting_span = get_tracer().start_span("greeting_tools", "request", tools=list(tool_calls))
+
+    async def call_tool(name, tool, args):
+        timings[name] = {"start": time.perf_counter() - started_at, "end": None, "status": "running"}
+        tool_span = get_tracer().start_span(tool.name, "tool", parent=greeting_span, source="greeting")
+        try:
+            result = await asyncio.wait_for(tool.ainvoke(args), timeout=per_tool_timeout)
+            timings[name]["status"] = "ok"
+            return str(result)
+        except asyncio.TimeoutError:
+            print(f"ERROR invoking {name} tool: timed out after {per_tool_timeout}s")
+            timings[name]["status"] = "timeout"
+        except Exception as e:
+            print(f"ERROR invoking {name} tool: {e}")
+            timings[name]["status"] = "error"
+        finally:
+            timings[name]["end"] = time.perf_counter() - started_at
+            if timings[name]["status"] != "ok":
+                # 마감 시간으로 취소된 도구는 running 상태로 남음
+                tool_span.set_error("cancelled" if timings[name]["status"] == "running" else timings[name]["status"])
+            tool_span.end()
+        return None
+
+    tasks = {name: asyncio.create_task(call_tool(name, tool, args)) for name, (tool, args) in tool_calls.items()}
+    results = {}
+    if tasks:
+        done, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        # 마감 시간을 넘긴 도구는 취소하고 부분 결과만 사용
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for name, task in tasks.items():
+            if task in done:
+                results[name] = task.result()
+            else:
+                results[name] = None
+                timings[name]["status"] = "deadline"
+
+    total = time.perf_counter() - started_at
+    greeting_span.end()
+    if tool_timings is not None:
+        tool_timings.update({"total": total, "tools": timings})
+    print(f"DEBUG: Greeting tools finished in {total:.2f}s: {timings}")
+    return results
+# --- 초기 인사말 도구 동시 호출 설정 --- END
+
+
+# --- 초기 인사말 스트리밍 --- START
+# true면 인사말을 llm.astream으로 받아 토큰이 도착하는 대로 화면에 표시한다.
+GREETING_STREAMING = os.getenv("GREETING_STREAMING", "true").lower() == "true"
+
+
+async def generate_greeting_text(llm, prompt, stream_buffer=None):
+    """
+    LLM으로 인사말을 생성합니다.
+
+    stream_buffer(리스트)가 주어지고 스트리밍 모드가 켜져 있으면 llm.astream으로 받은 토큰을
+    get_streaming_callback과 같은 방식으로 누적합니다. 화면 표시는 스크립트 스레드가 담당합니다.
+    """
+    if stream_buffer is None or not GREETING_STREAMING:
+        response = await llm.ainvoke(prompt)
+        return response.content
+
+    async for chunk in llm.astream(prompt):
+        if isinstance(chunk.content, str) and chunk.content:
+            stream_buffer.append(chunk.content)
+    return "".join(stream_buffer)
+# --- 초기 인사말 스트리밍 --- END
+
+
+async def run_initial_tools_and_summarize(llm, client, google_authenticated, stream_buffer=None, tool_timings=None):
+    """
+    앱 시작 시 필요한 도구를 호출하고 결과를 구조화하여 요약하고,
+    사용 가능한 기능을 안내하는 환영 메시지를 생성합니다.
+    Google 인증 상태에 따라 분기하여 처리합니다.
+    공유 이벤트 루프에서 실행되므로 필요한 세션 상태(llm, client, google_authenticated)는 인자로 받습니다.
+    stream_buffer가 주어지면 환영 메시지를 생성되는 대로 누적합니다.
+    """
+    initial_greeting = "안녕하세요! 당신만의 비서 나비입니다. 무엇을 도와드릴까요? 🦋" # 기본 인사말
+    weather_result = "날씨 정보를 가져오는 데 실패했어요."
+    # calendar_result와 email_result는 인증 상태 분기 내에서 초기화
+
+    try:
+        # LLM 모델 준비 확인 (공통)
+        if llm is None:
+            print("DEBUG: LLM model not found in session state for greeting generation.")
+            # LLM 없으면 기본 인사말 바로 반환 (기능 안내 포함)
+            return """안녕하세요! 비서 나비입니다 🦋
+정보 요약 기능을 사용하려면 LLM 설정이 필요해요.
+
+**제가 도와드릴 수 있는 일:**
+* 날씨 질문, 간단한 대화
+* (Google 계정 연동 시) 이메일 및 캘린더 관련 기능
+
+무엇을 도와드릴까요?"""
+
+        # MCP 클라이언트 및 기본 도구 준비 확인 (공통)
+        if not client:
+            print("DEBUG: MCP Client not ready for initial summary.")
+            # MCP 클라이언트 없으면 기본 인사말 반환
+            return """안녕하세요! 비서 나비입니다 🦋
+도구 서버에 연결할 수 없어 정보 조회가 불가능해요.
+
+**제가 도와드릴 수 있는 일:**
+* 간단한 대화
+
+무엇을 도와드릴까요?"""
+        
+        tools = client.get_tools()
+        weather_tool = next((t for t in tools if t.name == 'get_weather'), None)
+
+        # --- Google 인증 상태에 따른 분기 --- START
+        if google_authenticated:
+            # --- 인증된 사용자 로직 --- START
+            calendar_result = "가장 가까운 일정을 가져오는 데 실패했어요."
+            email_result = "중요한 이메일을 확인하는 데 실패했어요."
+            list_events_tool = next((t for t in tools if t.name == 'list_events_tool'), None)
+            list_emails_tool = next((t for t in tools if t.name == 'list_emails_tool'), None)
+
+            # 1~3. 날씨, 가장 가까운 일정, 최근 10개 이메일을 동시에 조회
+            tool_calls = {}
+            if weather_tool: tool_calls["weather"] = (weather_tool, {})
+            else: weather_result = "날씨 도구를 찾을 수 없어요."
+            if list_events_tool: tool_calls["calendar"] = (list_events_tool, {"max_results": 1})
+            else: calendar_result = "캘린더 도구를 찾을 수 없어요."
+            if list_emails_tool: tool_calls["email"] = (list_emails_tool, {"max_results": 10})
+            else: email_result = "이메일 도구를 찾을 수 없어요."
+
+            results = await run_tools_concurrently(tool_calls, tool_timings=tool_timings)
+
+            if results.get("weather") is not None:
+                weather_result = results["weather"]
+
+            if "calendar" in results:
+                calendar_result = results["calendar"]
+                if calendar_result is not None:
+                    calendar_result = tool_result_to_text(calendar_result)
+                if calendar_result is None:
+                    calendar_result = "일정 확인 중 오류 발생."
+                elif not calendar_result or "다가오는 일정이 없습니다" in calendar_result or "일정을 찾을 수 없습니다" in calendar_result:
+                    calendar_result = "가장 가까운 예정된 일정이 없어요. 여유로운 하루를 보내세요!"
+                elif "Google 계정 인증이 필요합니다" in calendar_result: calendar_result = "Google 계정 연동 오류."
+
+            if "email" in results:
+                email_result = results["email"]
+                if email_result is not None:
+                    email_result = tool_result_to_text(email_result)
+                if email_result is None:
+                    email_result = "이메일 확인 중 오류 발생."
+                elif not email_result or "메일을 찾을 수 없습니다" in email_result: email_result = "최근 도착 메일 없음."
+
+            # 4. LLM 프롬프트 (인증 사용자)
+            prompt = f"""당신은 사용자 비서 '나비'입니다. 다음 정보를 바탕으로 사용자에게 **정중하면서도 친근하고 도움이 되는 어조**로, 구조화된 환영 인사를 **'~습니다' 체**로 생성해주세요. **과도한 격식 표현(~님, 친애하는 등)이나 너무 가벼운 말투(반말, 속어)는 피해주세요.**
+
+**환영 인사 구조:**
+1. **정중하고 친근한** 인사말 (예: "안녕하세요! 당신의 스마트 비서, 나비입니다. 🦋" 또는 "오늘 하루, 나비와 함께 가볍게 시작해 보세요! 🦋")
+2. **오늘의 정보 요약** 섹션 (날씨, 가장 가까운 일정, 중요 이메일 요약 - 각 항목은 주어진 정보를 바탕으로 **정중하고 친근하게** 생성)
+3. **제가 도와드릴 수 있는 일** 섹션 (아래 목록 전체 안내, **명확하고 친절하게**)
+    * 이메일: 새 메일 확인, 특정 메일 검색, 이메일 작성 및 보내기
+    * 캘린더: 일정 확인, 새로운 일정 추가
+    * 날씨: 현재 날씨 질문
+    * 기타: 간단한 대화나 궁금한 점 질문하기
+4. **도움을 제안하는** 마무리 인사 (예: "무엇을 도와드릴까요?" 또는 "어떤 작업을 시작할까요?")
+
+**주어진 정보:**
+[날씨] {weather_result}
+[일정] {calendar_result}
+[최근 이메일 목록] {email_result}
+
+**정중하면서도 친근한 '~습니다' 체로 구조화된 환영 인사를 작성해주세요:**
+"""
+            try:
+                print("DEBUG: Invoking LLM for authenticated user greeting...")
+                initial_greeting = await generate_greeting_text(llm, prompt, stream_buffer)
+                print(f"DEBUG: Generated authenticated greeting: {initial_greeting}")
+            except Exception as e:
+                print(f"ERROR generating authenticated greeting with LLM: {e}")
+                initial_greeting = f"""안녕하세요! 비서 나비입니다 🦋
+
+**오늘의 정보 요약:**
+* 날씨: {weather_result}
+* 가까운 일정: {calendar_result}
+* 이메일: {email_result} (요약 실패)
+
+**제가 도와드릴 수 있는 일:**
+* 이메일: 확인, 검색, 작성/전송
+* 캘린더: 일정 확인, 새 일정 추가
+* 날씨: 현재 날씨 질문
+* 기타: 간단한 대화
+
+무엇을 도와드릴까요?"""
+            # --- 인증된 사용자 로직 --- END
+        
+        else:
+            # --- 미인증 사용자 로직 --- START
+            # 1. 날씨 정보 (미인증 사용자)
+            if weather_tool:
+                results = await run_tools_concurrently({"weather": (weather_tool, {})}, tool_timings=tool_timings)
+                if results.get("weather") is not None:
+                    weather_result = results["weather"]
+            else: weather_result = "날씨 도구를 찾을 수 없어요."
+            
+            # 2. LLM 프롬프트 (미인증 사용자)
+            prompt = f"""당신은 사용자 비서 '나비'입니다. 다음 정보를 바탕으로 사용자에게 **정중하면서도 친근하고 도움이 되는 어조**로, 구조화된 환영 인사를 **'~습니다' 체**로 생성해주세요. **과도한 격식 표현(~님, 친애하는 등)이나 너무 가벼운 말투(반말, 속어)는 피해주세요.**
+
+**환영 인사 구조:**
+1. **정중하고 친근한** 인사말 (예: "안녕하세요! 당신의 스마트 비서, 나비입니다. 🦋")
+2. **오늘의 날씨 정보** 섹션 (주어진 날씨 정보 요약, **정중하고 친근하게**)
+3. **Google 계정 연동 안내** 섹션 (연동 시 이메일/캘린더 기능 사용 가능함을 **명확하고 친절하게** 안내)
+4. **현재 도와드릴 수 있는 일** 섹션 (아래 목록 안내, **명확하고 친절하게**)
+    * 날씨: 현재 날씨 질문
+    * 기타: 간단한 대화나 궁금한 점 질문하기
+5. **도움을 제안하는** 마무리 인사 (예: "무엇을 도와드릴까요?")
+
+**주어진 정보:**
+[날씨] {weather_result}
+
+**정중하면서도 친근한 '~습니다' 체로 구조화된 환영 인사를 작성해주세요:**
+"""
+            try:
+                print("DEBUG: Invoking LLM for unauthenticated user greeting...")
+                initial_greeting = await generate_greeting_text(llm, prompt, stream_buffer)
+                print(f"DEBUG: Generated unauthenticated greeting: {initial_greeting}")
+            except Exception as e:
+                print(f"ERROR generating unauthenticated greeting with LLM: {e}")
+                initial_greeting = f"""안녕하세요! 비서 나비입니다 🦋
+
+**오늘의 날씨:**
+* {weather_result}
+
+**Google 계정을 연동하시면** 이메일 확인 및 작성, 캘린더 일정 관리 기능도 사용할 수 있어요!
+
+**현재 도와드릴 수 있는 일:**
+* 날씨 질문
+* 간단한 대화
+
+무엇을 도와드릴까요?"""
+            # --- 미인증 사용자 로직 --- END
+        # --- Google 인증 상태에 따른 분기 --- END
+
+    except Exception as e:
+        print(f"ERROR during initial tool run and summary: {e}")
+        # 전체 프로세스 오류 시 기본 인사말 (공통)
+        initial_greeting = """안녕하세요! 비서 나비입니다 🦋 정보를 준비하는 중 문제가 발생했어요.
+
+**제가 도와드릴 수 있는 일:**
+* 날씨 질문, 간단한 대화
+* (Google 계정 연동 시) 이메일 및 캘린더 관련 기능
+
+필요하신 도움이 있다면 말씀해주세요!"""
+
+    return initial_greeting
+
+
+def get_streaming_callback(ui_state):
+    """
+    에이전트 스트림 콜백을 생성합니다.
+
+    콜백은 공유 이벤트 루프 스레드에서 호출되므로 st.* 를 직접 호출하지 않습니다.
+    응답 텍스트는 accumulated_text에 누적되어 스크립트 스레드가 화면에 표시하고,
+    폼 표시 플래그는 ui_state 딕셔너리에 기록되어 실행이 끝난 뒤 세션 상태에 반영됩니다.
+    """
+    accumulated_text = []
+    tool_results = []
+    formatted_tool_results_for_history = [] # 히스토리 저장용은 유지
+
+    def callback_func(message: dict):
+        nonlocal accumulated_text, tool_results, formatted_tool_results_for_history
+        message_content = message.get("content", None)
+
+        if isinstance(message_content, AIMessageChunk):
+            # 에이전트 텍스트 처리 (텍스트 누적 및 UI 업데이트)
+            if hasattr(message_content, "content") and isinstance(message_content.content, str):
+                 accumulated_text.append(message_content.content) # UI 업데이트는 스크립트 스레드에서 수행
+
+            # 도구 호출 청크 처리 (폼 트리거 로직 유지)
+            if hasattr(message_content, 'tool_call_chunks') and message_content.tool_call_chunks:
+                for chunk in message_content.tool_call_chunks:
+                    tool_name = chunk.get('name')
+                    tool_args_str = chunk.get('args', '')
+
+                    # 빈 인수 감지 및 폼 트리거 로직 (이전과 동일)
+                    if tool_name in ["send_email_tool", "create_event_tool"]:
+                        is_empty_args = False
+                        if not tool_args_str or tool_args_str == '{}': is_empty_args = True
+                        else:
+                            try:
+                                parsed_args = json.loads(tool_args_str)
+                                if isinstance(parsed_args, dict) and not parsed_args: is_empty_args = True
+                            except json.JSONDecodeError: pass
+                        if is_empty_args:
+                            print(f"DEBUG (Callback): Detected empty args for {tool_name}. Checking context...")
+                            
+                            # --- 폼 제출 직후 상태 확인 로직 --- START
+                            if ui_state.get("just_submitted_form", False):
+                                print("DEBUG (Callback): 'just_submitted_form' flag is True. Ignoring empty tool call and resetting flag.")
+                                ui_state["just_submitted_form"] = False # 플래그 리셋
+                                # 폼을 띄우지 않고 넘어감
+                            else:
+                                # 폼 제출 직후가 아닐 경우, 폼 띄우기 로직 실행
+                                print(f"DEBUG (Callback): Triggering form for {tool_name} (not immediately after form submission).")
+                                if tool_name == "send_email_tool": ui_state["show_email_form_area"] = True
+                                elif tool_name == "create_event_tool": ui_state["show_calendar_form_area"] = True
+                                ui_state["rerun_needed"] = True
+                                raise StopStreamAndRerun()
+                            # --- 폼 제출 직후 상태 확인 로직 --- END
+                            
+                            # 사용자 의도 확인 로직 제거됨
+
+        elif isinstance(message_content, ToolMessage):
+            # ToolMessage 처리: 내부 저장 + history용 포맷만 수행
+            tool_result_str = str(message_content.content)
+            tool_name = message_content.name
+            print(f"DEBUG (Callback): Received ToolMessage for {tool_name}. Storing and formatting for history.")
+
+            # 결과 내부 저장 (JSON은 한 번만 해석해 저장/표시에 함께 사용)
+            result_data = parse_tool_result(tool_result_str)
+            tool_results.append(result_data)
+
+            # 결과 포맷팅 (history 저장용: 레코드 목록은 표, 그 밖의 JSON/텍스트는 코드 블록)
+            formatted_result = tool_result_to_markdown(result_data)
+
+            # 포맷된 결과를 history 저장용 리스트에 추가
+            result_info = f"**결과 ({tool_name}):**\n{formatted_result}"
+            formatted_tool_results_for_history.append(result_info)
+
+        return None
+
+    return callback_func, accumulated_text, tool_results, formatted_tool_results_for_history
+
+
+async def process_query(query, agent, thread_id, callback_bundle, timeout_seconds=300):
+    """
+    사용자 질문 하나를 request 추적 구간으로 감싸 처리합니다. (LangGraph 노드, 모델/도구 호출이 하위 구간으로 기록됨)
+    """
+    async with get_tracer().span("process_query", "request", thread_id=thread_id, query_chars=len(query)) as request_span:
+        with track_query() as query_outcome:  # 처리 중 질문 수, 결과별 질문 수, 처리 시간 지표
+            result = await _process_query(query, agent, thread_id, callback_bundle, timeout_seconds)
+            if isinstance(result[0], dict) and "error" in result[0]:
+                request_span.set_error(result[0]["error"])
+                query_outcome["status"] = "error"
+            return result
+
+
+async def _process_query(query, agent, thread_id, callback_bundle, timeout_seconds=300):
+    """
+    사용자 질문을 처리하고 응답을 생성합니다.
+    공유 이벤트 루프에서 실행되며, 스트리밍 결과는 callback_bundle(get_streaming_callback 반환값)로 전달됩니다.
+    # 폼 제출 후에는 요약된 시스템 메시지를 주입합니다. -> 제거
+    """
+    try:
+        if agent:
+            streaming_callback, accumulated_text_obj, final_tool_results, formatted_tool_results_for_history = (
+                callback_bundle
+            )
+            response = None 
+            final_text = "" 
+            
+            # # 폼 제출 후 전달될 초기 메시지 구성 -> 제거
+            # messages_to_send = [] 
+            # if "pending_initial_messages" in st.session_state:
+            #     pending_messages = st.session_state.pop("pending_initial_messages") 
+            #     try:
+            #         messages_to_send = [...]
+            #         print(f"DEBUG: Injecting pending messages: ...")
+            #     except Exception as msg_e:
+            #         print(f"ERROR converting pending messages: {msg_e}")
+            #         messages_to_send = []
+
+            # 현재 사용자 쿼리만 HumanMessage로 구성
+            messages_to_send = [HumanMessage(content=query)]
+            print(f"DEBUG: Final messages being sent to agent: {[m.type for m in messages_to_send]}")
+
+            try:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    loop = asyncio.new_event_loop()
+                    asyncio.set_event_loop(loop)
+
+                async with anyio.create_task_group() as tg:
+                    # --- 수정: StopStreamAndRerun 예외 처리 블록을 TaskGroup 내부로 이동 --- START
+                    try:
+                        response = await asyncio.wait_for(
+                            astream_graph(
+                                agent,
+                                {"messages": messages_to_send}, # 현재 사용자 입력만 전달
+                                callback=streaming_callback,
+                                config=RunnableConfig(
+                                    recursion_limit=200,
+                                    thread_id=thread_id, # 세션별 thread_id로 공유 에이전트의 대화 상태 분리
+                                    max_concurrency=1,
+                                    callbacks=[TracingCallbackHandler(), MetricsCallbackHandler()], # 노드/모델/도구 호출 구간, LLM 토큰 사용량 기록
+                                ),
+                            ),
+                            timeout=timeout_seconds,
+                        )
+                        await asyncio.sleep(2) # UI 업데이트 후 약간의 지연 복구
+                        final_text = "".join(accumulated_text_obj).strip()
+                    except StopStreamAndRerun:
+                        # 콜백에서 스트림 중단 요청 감지 (TaskGroup 내에서 처리)
+                        print("DEBUG (process_query in TG): StopStreamAndRerun caught. Stream stopped early for rerun.")
+                        final_text = "".join(accumulated_text_obj).strip()
+                        response = {} # 빈 응답으로 설정
+                    # --- 수정: StopStreamAndRerun 예외 처리 블록을 TaskGroup 내부로 이동 --- END
+
+            except asyncio.TimeoutError:
+                error_msg = f"⏱️ 요청 시간이 {timeout_seconds}초를 초과했습니다."
+                return {"error": error_msg}, error_msg, [], []
+            except Exception as e:
+                # StopStreamAndRerun 외의 다른 예외
+                error_msg = f"처리 중 오류 발생: {str(e)}"
+                return {"error": error_msg}, error_msg, [], []
+
+            print(f"DEBUG: Final agent text output (before history append): '{final_text}'")
+
+            return response, final_text, final_tool_results, formatted_tool_results_for_history
+        else:
+            return (
+                {"error": "🚫 에이전트가 초기화되지 않았습니다."},
+                "🚫 에이전트가 초기화되지 않았습니다.",
+                [],
+                []
+            )
+    except Exception as e:
+        import traceback
+        error_msg = f"❌ 쿼리 처리 중 오류 발생: {str(e)}\n{traceback.format_exc()}"
+        return {"error": error_msg}, error_msg, [], []
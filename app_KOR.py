@@ -1,48 +1,45 @@
 import streamlit as st
-import asyncio
 import nest_asyncio
 import json
-import anyio
 import os
+import time
 from pathlib import Path
 import pickle
 
 # # nest_asyncio 적용: 이미 실행 중인 이벤트 루프 내에서 중첩 호출 허용 -> 주석 처리
 # nest_asyncio.apply()
 
-# 전역 이벤트 루프 생성 및 재사용
-if "event_loop" not in st.session_state:
-    try:
-        loop = asyncio.get_running_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    st.session_state.event_loop = loop
-
 # # anyio 백엔드 설정 -> 주석 처리
 # os.environ["ANYIO_BACKEND"] = "asyncio"
 
 from langgraph.prebuilt import create_react_agent
-from langchain_core.messages import HumanMessage
 from dotenv import load_dotenv
 from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_teddynote.messages import astream_graph, random_uuid
-from langchain_core.messages.ai import AIMessageChunk
-from langchain_core.messages.tool import ToolMessage
+from langchain_teddynote.messages import random_uuid
 from langchain_core.messages import SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.runnables import RunnableConfig
 from langchain_upstage import ChatUpstage
 
 # Google 인증 관련 모듈 임포트
 from google_auth import (
     create_oauth_flow, get_authorization_url, fetch_token, 
     save_credentials, load_credentials, is_authenticated,
-    build_gmail_service, build_calendar_service
+    get_gmail_service, get_calendar_service, clear_service_cache, get_account_email
 )
 from calendar_utils import create_calendar_event
 from gmail_utils import send_email
 from datetime import datetime
+from mcp_config import MCP_SERVERS, build_client_config
+from mcp_pool import MCPClientPool, wait_with_updates
+from briefing_store import BriefingScheduler, BriefingStore, build_briefing_prompt
+from history_compactor import HistoryCompactor, TokenCounter
+from checkpoint_store import checkpointer_stats, create_checkpointer, load_conversation, set_thread_owner
+from tracing import get_tracer
+from metrics import (
+    ACTIVE_SESSIONS, MCP_POOL_RUNNING, MCP_SUBPROCESSES, REGISTRY, SESSIONS_INITIALIZED,
+    count_child_processes, start_metrics_server
+)
+# 에이전트 실행 로직 (공유 이벤트 루프에서 실행, st.* 를 호출하지 않음)
+from agent_runtime import get_streaming_callback, process_query, run_initial_tools_and_summarize
 
 # 환경 변수 로드 (.env 파일에서 API 키 등의 설정을 가져옴)
 load_dotenv(override=True)
@@ -51,6 +48,239 @@ load_dotenv(override=True)
 # 브라우저 탭에 표시될 제목과 아이콘이다.
 st.set_page_config(page_title="나만의 비서 나비", page_icon="🦋", layout="wide")
 
+# --- 공유 MCP 클라이언트 풀 --- START
+# 모든 브라우저 세션이 MCP 서버 프로세스와 에이전트를 공유한다. 대화 상태는 세션별 thread_id로 분리된다.
+AGENT_PROMPT = """You are an intelligent and helpful assistant using tools. Respond in Korean.
+
+                    **Available Tools:** You have tools for:
+                    *   Weather: `get_weather` (mode="current" for current weather, mode="forecast" for a 5-day forecast)
+                    *   Gmail: `list_emails_tool`, `search_emails_tool`, `send_email_tool`, `modify_email_tool`
+                    *   Google Calendar: `list_events_tool`, `create_event_tool`
+                    *   Web Search: `perplexity_search`
+
+                    **VERY IMPORTANT RULES (Tool Usage):**
+                    1. You MUST **ONLY** use the tools listed in 'Available Tools'.
+                    2. **NEVER** attempt to use tools that are not listed.
+                    3. **Web Search (`perplexity_search`) Usage - STRICT RULE:**
+                        *   You **MUST NOT** use the `perplexity_search` tool unless the user's message contains **explicit search keywords** like "검색해줘", "찾아줘", "알아봐줘", "search for", "find information about", etc.
+                        *   For **ANY** other type of query, including definitions (like "잘했어가 뭐야?"), explanations, general conversation, or questions answerable from common knowledge, you **MUST respond directly without using any tools**, especially `perplexity_search`.
+                        *   Prioritize direct, tool-less responses **unless** an explicit search command is given.
+                    4. If the user's request is unrelated to the available tools (following the strict search rule above) or can be answered without tools, respond directly.
+
+                    **CRITICAL RULE for Specific Phrases (Form Trigger):**
+                    - If the user's message is EXACTLY "일정 추가" or "일정 추가해" or "add event", the correct first step is to use the `create_event_tool` with empty arguments `{}`. **Do not ask for details first.**
+                    - If the user's message is EXACTLY "메일 보내줘" or "이메일 작성" or "send email", the correct first step is to use the `send_email_tool` with empty arguments `{}`. **Do not ask for details first.**
+                    - The system will handle prompting for details via a form after these specific calls.
+
+                    **Other Requests:**
+                    For any other request (following the specific rules above), identify the correct tool from 'Available Tools' or answer directly if appropriate. Use the provided details if available when calling tools.
+
+                    **Handling Tool Results (ToolMessage):**
+                    - Incorporate tool results into your final response clearly and helpfully.
+                    """
+
+
+@st.cache_resource
+def get_history_compactor():
+    """
+    에이전트가 모델을 호출할 때마다 대화 기록을 토큰 예산에 맞게 줄이는 압축기를 반환합니다.
+    (예산/유지할 턴 수 등은 AGENT_HISTORY_* 환경 변수로 설정, 대화별 프롬프트 토큰 수를 기록)
+    토크나이저는 앱 시작 시 백그라운드에서 불러오기 시작해, 첫 질문이 공유 이벤트 루프에서 다운로드를 기다리지 않게 합니다.
+    """
+    token_counter = TokenCounter()
+    token_counter.start_loading()
+    return HistoryCompactor(AGENT_PROMPT, token_counter=token_counter)
+
+
+get_history_compactor()
+
+
+@st.cache_resource
+def get_checkpointer():
+    """
+    에이전트 대화 상태를 저장하는 체크포인터를 반환합니다.
+    (기본값은 SQLite 파일 저장소로, 오래 쓰지 않은 대화를 TTL/LRU로 정리하고 앱을 다시 시작해도 대화를 이어갈 수 있음. AGENT_CHECKPOINT* 환경 변수로 설정)
+    """
+    return create_checkpointer()
+
+
+def create_agent(tools):
+    """
+    공유 도구 목록으로 ReAct 에이전트와 LLM 모델을 생성합니다.
+    시스템 프롬프트는 대화 기록 압축기(get_history_compactor)를 통해 전달됩니다.
+
+    반환값:
+        (agent, model)
+    """
+    model = ChatUpstage(
+        model="solar-pro",
+        temperature=0.0,
+        max_tokens=20000
+    )
+    agent = create_react_agent(
+        model,
+        tools,
+        checkpointer=get_checkpointer(),
+        prompt=get_history_compactor(),
+    )
+    return agent, model
+
+
+@st.cache_resource
+def get_mcp_pool():
+    """프로세스 전체에서 공유하는 MCP 클라이언트 풀을 반환합니다."""
+    return MCPClientPool(
+        client_factory=lambda: MultiServerMCPClient(build_client_config()),
+        agent_factory=create_agent,
+        idle_timeout=float(os.getenv("MCP_POOL_IDLE_TIMEOUT", "300")),
+        session_ttl=float(os.getenv("MCP_POOL_SESSION_TTL", "300")),
+    )
+
+
+mcp_pool = get_mcp_pool()
+
+
+def make_app_metrics_collector(pool):
+    """
+    /metrics 수집 직전에 공유 MCP 풀의 세션 수/실행 여부와 MCP 하위 프로세스 수를 지표로 옮기는 수집 함수를 만듭니다.
+    수집은 지표 서버 스레드에서 실행되므로 st.cache_resource 함수(get_mcp_pool)를 거치지 않고 풀 인스턴스를 직접 잡아 둔다.
+    """
+    def collect_app_metrics():
+        pool_stats = pool.stats(timeout=2)
+        ACTIVE_SESSIONS.set(pool_stats["active_sessions"])
+        MCP_POOL_RUNNING.set(1 if pool_stats["running"] else 0)
+        # stdio 전송에서는 MCP 서버가 이 프로세스의 하위 프로세스로 실행됨 (sse에서는 0)
+        subprocesses = count_child_processes([os.path.basename(server["script"]) for server in MCP_SERVERS.values()])
+        if subprocesses is not None:
+            MCP_SUBPROCESSES.set(subprocesses)
+
+    return collect_app_metrics
+
+
+@st.cache_resource
+def get_metrics_server():
+    """
+    앱 프로세스의 지표를 METRICS_HOST:METRICS_PORT의 /metrics로 노출하는 HTTP 서버를 한 번만 시작합니다.
+    (활성 세션, MCP 하위 프로세스 수, 처리 중인 질문 수, 질문 처리 시간, LLM 토큰 사용량, 캐시 적중률, 프로세스 메모리)
+    """
+    REGISTRY.register_collector("app", make_app_metrics_collector(mcp_pool))
+    return start_metrics_server()
+
+
+get_metrics_server()
+
+
+def run_async(coro, on_update=None):
+    """
+    코루틴을 공유 이벤트 루프에서 실행하고 결과를 반환합니다.
+    공유 루프는 별도 스레드에서 돌기 때문에 코루틴 안에서는 st.* 를 호출하지 않고,
+    화면 갱신이 필요하면 on_update 콜백(스크립트 스레드에서 주기적으로 호출됨)을 사용한다.
+    """
+    return wait_with_updates(mcp_pool.submit(coro), on_update)
+# --- 공유 MCP 클라이언트 풀 --- END
+
+# --- Perplexity 스트리밍 검색 --- START
+# MCP 어댑터는 도구 실행 중 알림을 전달하지 않으므로, 화면에 바로 보여줄 검색은 pplx_utils 스트리밍을 공유 루프에서 직접 사용한다.
+PPLX_STREAMING = os.getenv("PPLX_STREAMING", "true").lower() == "true"
+try:
+    from pplx_utils import PerplexityError, ask_perplexity_async, stream_perplexity_async
+except ValueError as e:  # PERPLEXITY_API_KEY 미설정 시 MCP 도구 호출로 대체
+    print(f"ERROR: Perplexity streaming unavailable, falling back to MCP tool: {e}")
+    ask_perplexity_async = stream_perplexity_async = None
+
+    class PerplexityError(Exception):
+        """pplx_utils를 불러오지 못했을 때 MCP 검색 도구의 오류 응답에 사용하는 예외"""
+
+
+def stream_search(query, placeholder, search_tool=None, use_cache=True):
+    """
+    Perplexity 검색 결과를 도착하는 대로 placeholder에 표시하고 전체 결과를 반환합니다.
+    스트리밍을 쓸 수 없으면 MCP 검색 도구(search_tool)로 한 번에 받아 표시합니다.
+
+    매개변수:
+        query: 검색 질의
+        placeholder: 결과를 표시할 st.empty() 등
+        search_tool: 스트리밍 불가 시 사용할 perplexity_search 도구
+        use_cache: 응답 캐시 사용 여부 (새로고침 시 False)
+    반환값:
+        str: 전체 검색 결과
+    예외:
+        PerplexityError: 검색이 실패한 경우 (중간까지 표시된 결과는 지움)
+    """
+    if not PPLX_STREAMING or stream_perplexity_async is None:
+        if search_tool is None:
+            raise RuntimeError("Perplexity 검색 도구를 찾을 수 없습니다.")
+        result = run_async(search_tool.ainvoke({"query": query}))
+        if result.startswith("❌"):
+            raise PerplexityError(result)
+        placeholder.markdown(result)
+        return result
+
+    chunks = []
+
+    async def consume():
+        async for delta in stream_perplexity_async(query, use_cache=use_cache):
+            chunks.append(delta)
+        return "".join(chunks)
+
+    def render_stream():
+        if chunks:
+            placeholder.markdown("".join(chunks) + "▌")
+
+    try:
+        result = run_async(consume(), on_update=render_stream)
+    except PerplexityError:
+        placeholder.empty()
+        raise
+    placeholder.markdown(result)
+    return result
+# --- Perplexity 스트리밍 검색 --- END
+
+# --- 관심 분야 브리핑 스케줄러 --- START
+# 브리핑은 Streamlit 스크립트 실행과 별도로 공유 이벤트 루프의 asyncio 작업이 주기적으로 미리 생성해 SQLite에 저장한다.
+# 보고서 탭은 저장된 최신 브리핑을 바로 보여주고, 새로고침 시에만 즉시 다시 생성한다.
+INTERESTS_FILE = "interests.pickle"
+BRIEFING_SCHEDULER_ENABLED = os.getenv("BRIEFING_SCHEDULER_ENABLED", "true").lower() == "true"
+
+
+def read_interests_file():
+    """저장된 관심 분야를 읽습니다. (스케줄러 스레드에서도 호출하므로 st.* 를 사용하지 않음)"""
+    try:
+        with open(INTERESTS_FILE, "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return ""
+    except Exception as e:
+        print(f"ERROR (BriefingScheduler): Failed to read {INTERESTS_FILE}: {e}")
+        return ""
+
+
+@st.cache_resource
+def get_briefing_store():
+    """프로세스 전체에서 공유하는 브리핑 저장소를 반환합니다."""
+    return BriefingStore(os.getenv("BRIEFING_DB_PATH", "briefings.sqlite3"))
+
+
+@st.cache_resource
+def get_briefing_scheduler():
+    """브리핑 스케줄러를 공유 이벤트 루프에서 시작하고 반환합니다. (비활성화 또는 Perplexity 사용 불가 시 None)"""
+    if not BRIEFING_SCHEDULER_ENABLED or ask_perplexity_async is None:
+        return None
+    scheduler = BriefingScheduler(
+        store=get_briefing_store(),
+        search=ask_perplexity_async,
+        interests_loader=read_interests_file,
+        interval=float(os.getenv("BRIEFING_REFRESH_INTERVAL", "3600")),
+    )
+    mcp_pool.submit(scheduler.run_forever())
+    return scheduler
+
+
+briefing_store = get_briefing_store()
+briefing_scheduler = get_briefing_scheduler()
+# --- 관심 분야 브리핑 스케줄러 --- END
+
+
 # --- 탭 생성 --- START
 tab1, tab2 = st.tabs(["🦋 나비 비서", "🔍 관심분야 보고서"])
 # --- 탭 생성 --- END
@@ -134,9 +364,7 @@ with tab1:
         st.session_state.mcp_client = None  # MCP 클라이언트 객체 저장 공간
 
         ### 구글 인증 관련
-        st.session_state.google_authenticated = False  # Google 인증 상태
-        st.session_state.gmail_service = None  # Gmail 서비스 객체
-        st.session_state.calendar_service = None  # 캘린더 서비스 객체
+        st.session_state.google_authenticated = False  # Google 인증 상태 (서비스 객체는 google_auth의 공유 레지스트리에서 가져옴)
 
         # 폼 표시 상태 변수 초기화
         st.session_state.show_email_form_area = False
@@ -151,8 +379,6 @@ with tab1:
         st.session_state.last_briefed_interests = None # 마지막 브리핑된 관심 분야
 
     # --- 관심 분야 저장/로드 함수 --- START
-    INTERESTS_FILE = "interests.pickle"
-
     def save_interests(interests):
         """사용자 관심 분야를 pickle 파일에 저장합니다."""
         try:
@@ -190,50 +416,44 @@ with tab1:
         st.session_state.user_interests = load_interests()
     # --- 앱 시작 시 관심 분야 로드 --- END
 
-    # --- 백그라운드 브리핑 생성 함수 --- START
-    async def generate_briefing_background():
-        """백그라운드에서 관심 분야 브리핑을 생성하고 세션 상태에 저장합니다."""
-        interests = st.session_state.get("user_interests", "")
-        if not interests:
-            print("DEBUG (Background Briefing): No interests set, skipping briefing generation.")
-            return
-
-        print(f"DEBUG (Background Briefing): Starting briefing generation for: {interests}")
-        # 세션 초기화 완료 및 클라이언트 존재 확인
-        if not st.session_state.get("session_initialized") or not st.session_state.get("mcp_client"):
-            print("ERROR (Background Briefing): Session or MCP client not ready.")
-            # 결과 비우기 (이전 결과가 남아있을 수 있으므로)
-            st.session_state.briefing_result = "시스템 준비 중 오류로 브리핑을 생성할 수 없습니다."
-            return
+    # --- 브리핑 즉시 생성 함수 --- START
+    def generate_briefing(interests, placeholder, search_tool=None, source="on_demand", use_cache=True):
+        """
+        관심 분야 브리핑을 placeholder에 스트리밍으로 생성하고, 결과를 브리핑 저장소와 작업 기록에 남깁니다.
+        (주기적인 생성은 briefing_scheduler가 담당하고, 이 함수는 저장된 브리핑이 없거나 새로고침할 때 사용)
 
+        매개변수:
+            interests: 관심 분야 문자열
+            placeholder: 결과를 표시할 st.empty()
+            search_tool: 스트리밍 불가 시 사용할 perplexity_search 도구
+            source: 작업 기록에 남길 실행 경로
+            use_cache: 응답 캐시 사용 여부 (새로고침 시 False)
+        반환값:
+            str: 생성된 브리핑 (실패 시 작업 기록에 실패로 남기고 예외를 다시 발생시킴)
+        """
+        started_at = time.time()
+        started = time.perf_counter()
         try:
-            client = st.session_state.mcp_client
-            tools = client.get_tools()
-            search_tool = next((t for t in tools if t.name in ['pplx_search', 'perplexity_search']), None)
-
-            if not search_tool:
-                print("ERROR (Background Briefing): Perplexity search tool not found.")
-                st.session_state.briefing_result = "검색 도구를 찾을 수 없어 브리핑 생성에 실패했습니다."
-                return
-
-            search_prompt = f"Summarize the latest developments and key information about: {interests}. Provide a concise overview suitable for a briefing."
-            result = await search_tool.ainvoke({"query": search_prompt})
-            st.session_state.briefing_result = result
-            print(f"DEBUG (Background Briefing): Briefing generation complete for: {interests}")
-
+            result = stream_search(build_briefing_prompt(interests), placeholder, search_tool, use_cache=use_cache)
         except Exception as e:
-            print(f"ERROR (Background Briefing): Failed to generate briefing for {interests}: {e}")
-            st.session_state.briefing_result = f"오류로 인해 브리핑 생성에 실패했습니다: {e}"
-    # --- 백그라운드 브리핑 생성 함수 --- END
+            duration = time.perf_counter() - started
+            briefing_store.log_job(interests, source, started_at, duration, str(e))
+            print(f"DEBUG (Briefing): {source} briefing for '{interests}' failed in {duration:.2f}s")
+            raise
+        duration = time.perf_counter() - started
+
+        briefing_store.save_briefing(interests, result, duration, source)
+        briefing_store.log_job(interests, source, started_at, duration, None)
+        print(f"DEBUG (Briefing): {source} briefing for '{interests}' done in {duration:.2f}s")
+        return result
+    # --- 브리핑 즉시 생성 함수 --- END
 
     def initialize_google_services():
         """
-        Google 서비스(Gmail, 캘린더)를 초기화합니다.
+        Google 서비스(Gmail, 캘린더)를 공유 서비스 레지스트리에 준비하고 인증 상태를 표시합니다.
+        (서비스 객체는 세션에 저장하지 않고, 필요할 때 get_gmail_service/get_calendar_service로 가져옴)
         """
-        if is_authenticated():
-            credentials = load_credentials()
-            st.session_state.gmail_service = build_gmail_service(credentials)
-            st.session_state.calendar_service = build_calendar_service(credentials)
+        if is_authenticated() and get_gmail_service() and get_calendar_service():
             st.session_state.google_authenticated = True
             return True
         return False
@@ -248,207 +468,71 @@ with tab1:
              print("DEBUG: Google services pre-initialization failed (likely token issue).")
     # --- Google 서비스 사전 초기화 (토큰 파일 존재 시) --- END
 
+    # --- 대화 이어가기 (thread_id를 URL에 유지) --- START
     if "thread_id" not in st.session_state:
-        st.session_state.thread_id = random_uuid()
+        # 새로고침이나 앱 재시작 후에도 URL의 thread로 저장된 대화를 이어감
+        # (URL은 공유될 수 있으므로 같은 Google 계정으로 인증된 세션에서 그 계정이 만든 대화만 불러옴)
+        saved_thread_id = st.query_params.get("thread")
+        owner = get_account_email() if saved_thread_id and st.session_state.google_authenticated else None
+        restored_history = load_conversation(get_checkpointer(), saved_thread_id, owner) if owner else []
+        if restored_history:
+            st.session_state.thread_id = saved_thread_id
+            st.session_state.history = restored_history
+            print(f"DEBUG: Resumed thread {saved_thread_id} with {len(restored_history)} messages.")
+        else:
+            st.session_state.thread_id = random_uuid()
+    # 폼 제출 등으로 thread_id가 바뀌면 URL도 갱신
+    if st.query_params.get("thread") != st.session_state.thread_id:
+        st.query_params["thread"] = st.session_state.thread_id
+    # --- 대화 이어가기 (thread_id를 URL에 유지) --- END
+
+    # --- 공유 MCP 풀 임대 연장 --- START
+    if "pool_session_id" not in st.session_state:
+        st.session_state.pool_session_id = random_uuid()
+    # 임대가 만료되었거나 풀이 유휴 종료된 경우 다시 초기화
+    if st.session_state.session_initialized and not mcp_pool.touch(st.session_state.pool_session_id):
+        print("DEBUG: MCP pool lease expired. Re-initializing session.")
+        st.session_state.session_initialized = False
+    # --- 공유 MCP 풀 임대 연장 --- END
 
     ### Google 인증 관련 상수
     REDIRECT_URI = os.getenv("REDIRECT_URI")
 
-    # --- 사용자 정의 예외 --- START
-    class StopStreamAndRerun(Exception):
-        """콜백에서 스트림 중단 및 rerun 필요 신호를 보내기 위한 예외"""
-        pass
-    # --- 사용자 정의 예외 --- END
-
-    async def run_initial_tools_and_summarize():
+    # --- 초기 인사말 스트리밍 --- START
+    def generate_initial_greeting():
         """
-        앱 시작 시 필요한 도구를 호출하고 결과를 구조화하여 요약하고,
-        사용 가능한 기능을 안내하는 환영 메시지를 생성합니다.
-        Google 인증 상태에 따라 분기하여 처리합니다.
+        초기 인사말을 생성합니다. 생성 중에는 임시 채팅 말풍선에 인사말을 스트리밍하고,
+        완료되면 말풍선을 지워 대화 기록(history[0])으로 다시 표시되도록 합니다.
+        (준비 안내는 첫 토큰이 도착할 때까지만 말풍선 안에 표시하고, 이후에는 스트리밍 중인 인사말로 바뀜)
         """
-        initial_greeting = "안녕하세요! 당신만의 비서 나비입니다. 무엇을 도와드릴까요? 🦋" # 기본 인사말
-        weather_result = "날씨 정보를 가져오는 데 실패했어요."
-        # calendar_result와 email_result는 인증 상태 분기 내에서 초기화
-
-        with st.spinner("🦋 비서 '나비'가 오늘의 정보를 준비하고 있어요..."):
-            try:
-                # LLM 모델 준비 확인 (공통)
-                llm = None
-                if hasattr(st.session_state, 'llm_model') and st.session_state.llm_model is not None:
-                    llm = st.session_state.llm_model
-                else:
-                    print("DEBUG: LLM model not found in session state for greeting generation.")
-                    # LLM 없으면 기본 인사말 바로 반환 (기능 안내 포함)
-                    return """안녕하세요! 비서 나비입니다 🦋
-정보 요약 기능을 사용하려면 LLM 설정이 필요해요.
-
-**제가 도와드릴 수 있는 일:**
-* 날씨 질문, 간단한 대화
-* (Google 계정 연동 시) 이메일 및 캘린더 관련 기능
-
-무엇을 도와드릴까요?"""
-
-                # MCP 클라이언트 및 기본 도구 준비 확인 (공통)
-                if not st.session_state.mcp_client:
-                    print("DEBUG: MCP Client not ready for initial summary.")
-                    # MCP 클라이언트 없으면 기본 인사말 반환
-                    return """안녕하세요! 비서 나비입니다 🦋
-도구 서버에 연결할 수 없어 정보 조회가 불가능해요.
-
-**제가 도와드릴 수 있는 일:**
-* 간단한 대화
-
-무엇을 도와드릴까요?"""
-                
-                client = st.session_state.mcp_client
-                tools = client.get_tools()
-                weather_tool = next((t for t in tools if t.name == 'get_weather'), None)
-
-                # --- Google 인증 상태에 따른 분기 --- START
-                if st.session_state.google_authenticated:
-                    # --- 인증된 사용자 로직 --- START
-                    calendar_result = "가장 가까운 일정을 가져오는 데 실패했어요."
-                    email_result = "중요한 이메일을 확인하는 데 실패했어요."
-                    list_events_tool = next((t for t in tools if t.name == 'list_events_tool'), None)
-                    list_emails_tool = next((t for t in tools if t.name == 'list_emails_tool'), None)
-
-                    # 1. 날씨 정보 (인증 사용자)
-                    if weather_tool:
-                        try:
-                            result = await weather_tool.ainvoke({})
-                            weather_result = str(result)
-                        except Exception as e: print(f"ERROR invoking get_weather (auth): {e}")
-                    else: weather_result = "날씨 도구를 찾을 수 없어요."
-
-                    # 2. 가장 가까운 일정 (인증 사용자)
-                    if list_events_tool:
-                        try:
-                            result = await list_events_tool.ainvoke({"max_results": 1})
-                            calendar_result = str(result)
-                            if not calendar_result or "다가오는 일정이 없습니다" in calendar_result or "일정을 찾을 수 없습니다" in calendar_result:
-                                calendar_result = "가장 가까운 예정된 일정이 없어요. 여유로운 하루를 보내세요!"
-                            elif "Google 계정 인증이 필요합니다" in calendar_result: calendar_result = "Google 계정 연동 오류."
-                        except Exception as e:
-                            print(f"ERROR invoking list_events_tool (auth): {e}")
-                            calendar_result = "일정 확인 중 오류 발생."
-                    else: calendar_result = "캘린더 도구를 찾을 수 없어요."
-
-                    # 3. 최근 10개 이메일 (인증 사용자, LLM 요약용)
-                    if list_emails_tool:
-                        try:
-                            result = await list_emails_tool.ainvoke({"max_results": 10})
-                            email_result = str(result)
-                            if not email_result or "메일을 찾을 수 없습니다" in email_result: email_result = "최근 도착 메일 없음."
-                        except Exception as e:
-                            print(f"ERROR invoking list_emails_tool (auth): {e}")
-                            email_result = "이메일 확인 중 오류 발생."
-                    else: email_result = "이메일 도구를 찾을 수 없어요."
-
-                    # 4. LLM 프롬프트 (인증 사용자)
-                    prompt = f"""당신은 사용자 비서 '나비'입니다. 다음 정보를 바탕으로 사용자에게 **정중하면서도 친근하고 도움이 되는 어조**로, 구조화된 환영 인사를 **'~습니다' 체**로 생성해주세요. **과도한 격식 표현(~님, 친애하는 등)이나 너무 가벼운 말투(반말, 속어)는 피해주세요.**
-
-**환영 인사 구조:**
-1. **정중하고 친근한** 인사말 (예: "안녕하세요! 당신의 스마트 비서, 나비입니다. 🦋" 또는 "오늘 하루, 나비와 함께 가볍게 시작해 보세요! 🦋")
-2. **오늘의 정보 요약** 섹션 (날씨, 가장 가까운 일정, 중요 이메일 요약 - 각 항목은 주어진 정보를 바탕으로 **정중하고 친근하게** 생성)
-3. **제가 도와드릴 수 있는 일** 섹션 (아래 목록 전체 안내, **명확하고 친절하게**)
-    * 이메일: 새 메일 확인, 특정 메일 검색, 이메일 작성 및 보내기
-    * 캘린더: 일정 확인, 새로운 일정 추가
-    * 날씨: 현재 날씨 질문
-    * 기타: 간단한 대화나 궁금한 점 질문하기
-4. **도움을 제안하는** 마무리 인사 (예: "무엇을 도와드릴까요?" 또는 "어떤 작업을 시작할까요?")
-
-**주어진 정보:**
-[날씨] {weather_result}
-[일정] {calendar_result}
-[최근 이메일 목록] {email_result}
-
-**정중하면서도 친근한 '~습니다' 체로 구조화된 환영 인사를 작성해주세요:**
-"""
-                    try:
-                        print("DEBUG: Invoking LLM for authenticated user greeting...")
-                        response = await llm.ainvoke(prompt)
-                        initial_greeting = response.content
-                        print(f"DEBUG: Generated authenticated greeting: {initial_greeting}")
-                    except Exception as e:
-                        print(f"ERROR generating authenticated greeting with LLM: {e}")
-                        initial_greeting = f"""안녕하세요! 비서 나비입니다 🦋
-
-**오늘의 정보 요약:**
-* 날씨: {weather_result}
-* 가까운 일정: {calendar_result}
-* 이메일: {email_result} (요약 실패)
-
-**제가 도와드릴 수 있는 일:**
-* 이메일: 확인, 검색, 작성/전송
-* 캘린더: 일정 확인, 새 일정 추가
-* 날씨: 현재 날씨 질문
-* 기타: 간단한 대화
-
-무엇을 도와드릴까요?"""
-                    # --- 인증된 사용자 로직 --- END
-                
-                else:
-                    # --- 미인증 사용자 로직 --- START
-                    # 1. 날씨 정보 (미인증 사용자)
-                    if weather_tool:
-                        try:
-                            result = await weather_tool.ainvoke({})
-                            weather_result = str(result)
-                        except Exception as e: print(f"ERROR invoking get_weather (unauth): {e}")
-                    else: weather_result = "날씨 도구를 찾을 수 없어요."
-                    
-                    # 2. LLM 프롬프트 (미인증 사용자)
-                    prompt = f"""당신은 사용자 비서 '나비'입니다. 다음 정보를 바탕으로 사용자에게 **정중하면서도 친근하고 도움이 되는 어조**로, 구조화된 환영 인사를 **'~습니다' 체**로 생성해주세요. **과도한 격식 표현(~님, 친애하는 등)이나 너무 가벼운 말투(반말, 속어)는 피해주세요.**
-
-**환영 인사 구조:**
-1. **정중하고 친근한** 인사말 (예: "안녕하세요! 당신의 스마트 비서, 나비입니다. 🦋")
-2. **오늘의 날씨 정보** 섹션 (주어진 날씨 정보 요약, **정중하고 친근하게**)
-3. **Google 계정 연동 안내** 섹션 (연동 시 이메일/캘린더 기능 사용 가능함을 **명확하고 친절하게** 안내)
-4. **현재 도와드릴 수 있는 일** 섹션 (아래 목록 안내, **명확하고 친절하게**)
-    * 날씨: 현재 날씨 질문
-    * 기타: 간단한 대화나 궁금한 점 질문하기
-5. **도움을 제안하는** 마무리 인사 (예: "무엇을 도와드릴까요?")
-
-**주어진 정보:**
-[날씨] {weather_result}
-
-**정중하면서도 친근한 '~습니다' 체로 구조화된 환영 인사를 작성해주세요:**
-"""
-                    try:
-                        print("DEBUG: Invoking LLM for unauthenticated user greeting...")
-                        response = await llm.ainvoke(prompt)
-                        initial_greeting = response.content
-                        print(f"DEBUG: Generated unauthenticated greeting: {initial_greeting}")
-                    except Exception as e:
-                        print(f"ERROR generating unauthenticated greeting with LLM: {e}")
-                        initial_greeting = f"""안녕하세요! 비서 나비입니다 🦋
-
-**오늘의 날씨:**
-* {weather_result}
-
-**Google 계정을 연동하시면** 이메일 확인 및 작성, 캘린더 일정 관리 기능도 사용할 수 있어요!
-
-**현재 도와드릴 수 있는 일:**
-* 날씨 질문
-* 간단한 대화
-
-무엇을 도와드릴까요?"""
-                    # --- 미인증 사용자 로직 --- END
-                # --- Google 인증 상태에 따른 분기 --- END
-
-            except Exception as e:
-                print(f"ERROR during initial tool run and summary: {e}")
-                # 전체 프로세스 오류 시 기본 인사말 (공통)
-                initial_greeting = """안녕하세요! 비서 나비입니다 🦋 정보를 준비하는 중 문제가 발생했어요.
-
-**제가 도와드릴 수 있는 일:**
-* 날씨 질문, 간단한 대화
-* (Google 계정 연동 시) 이메일 및 캘린더 관련 기능
-
-필요하신 도움이 있다면 말씀해주세요!"""
+        greeting_area = st.empty()
+        with greeting_area.container():
+            with st.chat_message("assistant"):
+                text_placeholder = st.empty()
+                text_placeholder.caption("🦋 비서 '나비'가 오늘의 정보를 준비하고 있어요...")
+        stream_buffer = []
+        tool_timings = {}
 
-        return initial_greeting
+        def render_stream():
+            if stream_buffer:
+                text_placeholder.markdown("".join(stream_buffer))
 
+        try:
+            greeting = run_async(
+                run_initial_tools_and_summarize(
+                    st.session_state.get("llm_model"),
+                    st.session_state.mcp_client,
+                    st.session_state.google_authenticated,
+                    stream_buffer=stream_buffer,
+                    tool_timings=tool_timings,
+                ),
+                on_update=render_stream,
+            )
+            st.session_state.greeting_tool_timings = tool_timings
+            return greeting
+        finally:
+            greeting_area.empty()
+    # --- 초기 인사말 스트리밍 --- END
 
     def print_message():
         """
@@ -464,6 +548,9 @@ with tab1:
             elif message["role"] == "assistant":
                 with st.chat_message("assistant"):
                     st.markdown(message["content"]) # 메시지 본문 표시
+                    # 이 턴에서 모델에 보낸 프롬프트 토큰 수 (대화 기록 압축 후/전)
+                    if message.get("prompt_tokens"):
+                        st.caption(f"🧮 프롬프트 토큰 {message['prompt_tokens']['after']:,} (압축 전 {message['prompt_tokens']['before']:,})")
                     # 도구 결과가 저장되어 있으면 본문 아래에 마크다운으로 표시 (Expander 대신)
                     if "tool_output" in message and message["tool_output"]:
                         st.markdown("\n---\n**🔧 도구 실행 결과:**") # 구분선 및 제목 추가
@@ -472,254 +559,62 @@ with tab1:
             #     ...
 
 
-    def get_streaming_callback(text_placeholder):
-        accumulated_text = []
-        tool_results = []
-        formatted_tool_results_for_history = [] # 히스토리 저장용은 유지
-
-        def callback_func(message: dict):
-            nonlocal accumulated_text, tool_results, formatted_tool_results_for_history
-            message_content = message.get("content", None)
-
-            if isinstance(message_content, AIMessageChunk):
-                # 에이전트 텍스트 처리 (텍스트 누적 및 UI 업데이트)
-                if hasattr(message_content, "content") and isinstance(message_content.content, str):
-                     accumulated_text.append(message_content.content)
-                     complete_response = "".join(accumulated_text)
-                     text_placeholder.markdown(complete_response) # UI 업데이트 복구
-
-                # 도구 호출 청크 처리 (폼 트리거 로직 유지)
-                if hasattr(message_content, 'tool_call_chunks') and message_content.tool_call_chunks:
-                    for chunk in message_content.tool_call_chunks:
-                        tool_name = chunk.get('name')
-                        tool_args_str = chunk.get('args', '')
-
-                        # 빈 인수 감지 및 폼 트리거 로직 (이전과 동일)
-                        if tool_name in ["send_email_tool", "create_event_tool"]:
-                            is_empty_args = False
-                            if not tool_args_str or tool_args_str == '{}': is_empty_args = True
-                            else:
-                                try:
-                                    parsed_args = json.loads(tool_args_str)
-                                    if isinstance(parsed_args, dict) and not parsed_args: is_empty_args = True
-                                except json.JSONDecodeError: pass
-                            if is_empty_args:
-                                print(f"DEBUG (Callback): Detected empty args for {tool_name}. Checking context...")
-                                
-                                # --- 폼 제출 직후 상태 확인 로직 --- START
-                                if st.session_state.get("just_submitted_form", False):
-                                    print("DEBUG (Callback): 'just_submitted_form' flag is True. Ignoring empty tool call and resetting flag.")
-                                    st.session_state.just_submitted_form = False # 플래그 리셋
-                                    # 폼을 띄우지 않고 넘어감
-                                else:
-                                    # 폼 제출 직후가 아닐 경우, 폼 띄우기 로직 실행
-                                    print(f"DEBUG (Callback): Triggering form for {tool_name} (not immediately after form submission).")
-                                    if tool_name == "send_email_tool": st.session_state.show_email_form_area = True
-                                    elif tool_name == "create_event_tool": st.session_state.show_calendar_form_area = True
-                                    st.session_state.rerun_needed = True
-                                    raise StopStreamAndRerun()
-                                # --- 폼 제출 직후 상태 확인 로직 --- END
-                                
-                                # 사용자 의도 확인 로직 제거됨
-
-            elif isinstance(message_content, ToolMessage):
-                # ToolMessage 처리: 내부 저장 + history용 포맷만 수행
-                tool_result_str = str(message_content.content)
-                tool_name = message_content.name
-                print(f"DEBUG (Callback): Received ToolMessage for {tool_name}. Storing and formatting for history.")
-
-                # 결과 내부 저장
-                try:
-                    result_data = json.loads(tool_result_str)
-                    tool_results.append(result_data)
-                except json.JSONDecodeError:
-                    tool_results.append(tool_result_str)
-
-                # 결과 포맷팅 (history 저장용 - 기존과 동일)
-                formatted_result = ""
-                try: 
-                    parsed_res = json.loads(tool_result_str)
-                    formatted_result = f"```json\n{json.dumps(parsed_res, indent=2, ensure_ascii=False)}\n```"
-                except json.JSONDecodeError: 
-                    formatted_result = f"```text\n{tool_result_str}\n```"
-
-                # 포맷된 결과를 history 저장용 리스트에 추가
-                result_info = f"**결과 ({tool_name}):**\n{formatted_result}"
-                formatted_tool_results_for_history.append(result_info)
-
-            return None
-
-        return callback_func, accumulated_text, tool_results, formatted_tool_results_for_history
-
-
-    async def process_query(query, text_placeholder, timeout_seconds=300):
+    def run_query(query, text_placeholder, timeout_seconds=300):
         """
-        사용자 질문을 처리하고 응답을 생성합니다.
-        # 폼 제출 후에는 요약된 시스템 메시지를 주입합니다. -> 제거
+        사용자 질문을 공유 이벤트 루프에서 처리하고, 생성 중인 응답을 text_placeholder에 스트리밍합니다.
+        콜백이 기록한 폼 표시 플래그는 실행이 끝난 뒤 세션 상태에 반영합니다.
         """
-        try:
-            if st.session_state.agent:
-                streaming_callback, accumulated_text_obj, final_tool_results, formatted_tool_results_for_history = (
-                    get_streaming_callback(text_placeholder)
-                )
-                response = None 
-                final_text = "" 
-                
-                # # 폼 제출 후 전달될 초기 메시지 구성 -> 제거
-                # messages_to_send = [] 
-                # if "pending_initial_messages" in st.session_state:
-                #     pending_messages = st.session_state.pop("pending_initial_messages") 
-                #     try:
-                #         messages_to_send = [...]
-                #         print(f"DEBUG: Injecting pending messages: ...")
-                #     except Exception as msg_e:
-                #         print(f"ERROR converting pending messages: {msg_e}")
-                #         messages_to_send = []
-
-                # 현재 사용자 쿼리만 HumanMessage로 구성
-                messages_to_send = [HumanMessage(content=query)]
-                print(f"DEBUG: Final messages being sent to agent: {[m.type for m in messages_to_send]}")
-
-                try:
-                    try:
-                        loop = asyncio.get_running_loop()
-                    except RuntimeError:
-                        loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(loop)
-
-                    async with anyio.create_task_group() as tg:
-                        # --- 수정: StopStreamAndRerun 예외 처리 블록을 TaskGroup 내부로 이동 --- START
-                        try:
-                            response = await asyncio.wait_for(
-                                astream_graph(
-                                    st.session_state.agent,
-                                    {"messages": messages_to_send}, # 현재 사용자 입력만 전달
-                                    callback=streaming_callback,
-                                    config=RunnableConfig(
-                                        recursion_limit=200,
-                                        thread_id=st.session_state.thread_id, # 새 thread_id 사용됨
-                                        max_concurrency=1,
-                                    ),
-                                ),
-                                timeout=timeout_seconds,
-                            )
-                            await asyncio.sleep(2) # UI 업데이트 후 약간의 지연 복구
-                            final_text = "".join(accumulated_text_obj).strip()
-                        except StopStreamAndRerun:
-                            # 콜백에서 스트림 중단 요청 감지 (TaskGroup 내에서 처리)
-                            print("DEBUG (process_query in TG): StopStreamAndRerun caught. Stream stopped early for rerun.")
-                            final_text = "".join(accumulated_text_obj).strip()
-                            response = {} # 빈 응답으로 설정
-                        # --- 수정: StopStreamAndRerun 예외 처리 블록을 TaskGroup 내부로 이동 --- END
-
-                except asyncio.TimeoutError:
-                    error_msg = f"⏱️ 요청 시간이 {timeout_seconds}초를 초과했습니다."
-                    return {"error": error_msg}, error_msg, [], []
-                except Exception as e:
-                    # StopStreamAndRerun 외의 다른 예외
-                    error_msg = f"처리 중 오류 발생: {str(e)}"
-                    return {"error": error_msg}, error_msg, [], []
-
-                print(f"DEBUG: Final agent text output (before history append): '{final_text}'")
-
-                return response, final_text, final_tool_results, formatted_tool_results_for_history
-            else:
-                return (
-                    {"error": "🚫 에이전트가 초기화되지 않았습니다."},
-                    "🚫 에이전트가 초기화되지 않았습니다.",
-                    [],
-                    []
-                )
-        except Exception as e:
-            import traceback
-            error_msg = f"❌ 쿼리 처리 중 오류 발생: {str(e)}\n{traceback.format_exc()}"
-            return {"error": error_msg}, error_msg, [], []
-
-
-    async def initialize_session(mcp_config=None):
+        ui_state = {"just_submitted_form": st.session_state.get("just_submitted_form", False)}
+        callback_bundle = get_streaming_callback(ui_state)
+        # 인증된 세션의 대화만 소유자를 기록해, 나중에 같은 계정으로만 이어갈 수 있게 함
+        if st.session_state.google_authenticated:
+            owner = get_account_email()
+            if owner:
+                set_thread_owner(get_checkpointer(), st.session_state.thread_id, owner)
+        accumulated_text_obj = callback_bundle[1]
+
+        def render_stream():
+            if accumulated_text_obj:
+                text_placeholder.markdown("".join(accumulated_text_obj))
+
+        result = run_async(
+            process_query(
+                query,
+                st.session_state.agent,
+                st.session_state.thread_id,
+                callback_bundle,
+                timeout_seconds=timeout_seconds,
+            ),
+            on_update=render_stream,
+        )
+        for key, value in ui_state.items():
+            st.session_state[key] = value
+        return result
+
+
+    def initialize_session():
         """
-        MCP 세션과 에이전트를 초기화합니다.
-
-        매개변수:
-            mcp_config: MCP 도구 설정 정보(JSON). None인 경우 기본 설정 사용
+        공유 MCP 클라이언트 풀에서 MCP 클라이언트와 에이전트를 임대해 세션을 초기화합니다.
+        MCP 서버 프로세스는 풀에 처음 접속하는 세션에서만 시작됩니다.
 
         반환값:
             bool: 초기화 성공 여부
         """
         try:
             with st.spinner("🔄 MCP 서버에 연결 중..."):
-                if mcp_config is None:
-                    # 기본 설정 사용
-                    mcp_config = {
-                        "weather": {
-                            "command": "python",
-                            "args": ["./mcp_server_local.py"],
-                            "transport": "stdio",
-                        },
-                        "gsuite": {
-                            "command": "python",
-                            "args": ["./gsuite_mcp_server.py"],
-                            "transport": "stdio",
-                        },
-                        # pplx_search 서버 추가
-                        "pplx_search": {
-                            "command": "python",
-                            "args": ["./pplx_search_mcp_server.py"],
-                            "transport": "stdio",
-                        },
-                    }
-                client = MultiServerMCPClient(mcp_config)
-                await client.__aenter__()
+                client, agent, model = mcp_pool.acquire(st.session_state.pool_session_id)
                 tools = client.get_tools()
                 st.session_state.tool_count = len(tools)
                 st.session_state.mcp_client = client
-
-                model = ChatUpstage(
-                    model="solar-pro",
-                    temperature=0.0,
-                    max_tokens=20000
-                )
                 # --- 추가: LLM 모델 인스턴스를 세션 상태에 저장 ---
                 st.session_state.llm_model = model
                 # --- 추가 끝 ---
-                
-                agent = create_react_agent(
-                    model,
-                    tools,
-                    checkpointer=MemorySaver(),
-                    prompt="""You are an intelligent and helpful assistant using tools. Respond in Korean.
-
-                    **Available Tools:** You have tools for:
-                    *   Weather: `get_weather`
-                    *   Gmail: `list_emails_tool`, `search_emails_tool`, `send_email_tool`, `modify_email_tool`
-                    *   Google Calendar: `list_events_tool`, `create_event_tool`
-                    *   Web Search: `perplexity_search`
-
-                    **VERY IMPORTANT RULES (Tool Usage):**
-                    1. You MUST **ONLY** use the tools listed in 'Available Tools'.
-                    2. **NEVER** attempt to use tools that are not listed.
-                    3. **Web Search (`perplexity_search`) Usage - STRICT RULE:**
-                        *   You **MUST NOT** use the `perplexity_search` tool unless the user's message contains **explicit search keywords** like "검색해줘", "찾아줘", "알아봐줘", "search for", "find information about", etc.
-                        *   For **ANY** other type of query, including definitions (like "잘했어가 뭐야?"), explanations, general conversation, or questions answerable from common knowledge, you **MUST respond directly without using any tools**, especially `perplexity_search`.
-                        *   Prioritize direct, tool-less responses **unless** an explicit search command is given.
-                    4. If the user's request is unrelated to the available tools (following the strict search rule above) or can be answered without tools, respond directly.
-
-                    **CRITICAL RULE for Specific Phrases (Form Trigger):**
-                    - If the user's message is EXACTLY "일정 추가" or "일정 추가해" or "add event", the correct first step is to use the `create_event_tool` with empty arguments `{}`. **Do not ask for details first.**
-                    - If the user's message is EXACTLY "메일 보내줘" or "이메일 작성" or "send email", the correct first step is to use the `send_email_tool` with empty arguments `{}`. **Do not ask for details first.**
-                    - The system will handle prompting for details via a form after these specific calls.
-
-                    **Other Requests:**
-                    For any other request (following the specific rules above), identify the correct tool from 'Available Tools' or answer directly if appropriate. Use the provided details if available when calling tools.
-
-                    **Handling Tool Results (ToolMessage):**
-                    - Incorporate tool results into your final response clearly and helpfully.
-                    """,
-                )
                 st.session_state.agent = agent
                 st.session_state.session_initialized = True
+                SESSIONS_INITIALIZED.inc(result="success")
                 return True
         except Exception as e:
+            SESSIONS_INITIALIZED.inc(result="failure")
             st.error(f"❌ 초기화 중 오류 발생: {str(e)}")
             import traceback
 
@@ -784,8 +679,7 @@ with tab1:
                 if token_path.exists():
                     token_path.unlink()
                 st.session_state.google_authenticated = False
-                st.session_state.gmail_service = None
-                st.session_state.calendar_service = None
+                clear_service_cache()
                 # 연동 해제 시에는 재생성 플래그 설정 불필요
                 st.rerun()
 
@@ -824,11 +718,10 @@ with tab1:
                             if search_tool:
                                 with st.spinner(f"'{interests_input}' 관련 최신 보고서 생성 중..."): # 스피너 추가
                                     try:
-                                        loop = st.session_state.event_loop
-                                        search_prompt = f"Summarize the latest developments and key information about: {interests_input}. Provide a concise overview suitable for a briefing."
                                         print(f"DEBUG (Interest Save): Triggering briefing search for: {interests_input}")
-                                        result = loop.run_until_complete(search_tool.ainvoke({"query": search_prompt}))
+                                        result = generate_briefing(interests_input, st.empty(), search_tool, source="interest_save")
                                         st.session_state.briefing_result = result # 결과 저장
+                                        st.session_state.briefing_created_at = time.time()
                                         st.session_state.last_briefed_interests = interests_input # 마지막 브리핑 관심사 업데이트
                                         print(f"DEBUG (Interest Save): Briefing search complete for: {interests_input}")
                                     except Exception as e:
@@ -868,6 +761,44 @@ with tab1:
                 st.rerun() # UI 즉시 업데이트
     # --- 관심 분야 입력 UI (수정) --- END
 
+    # --- 대화 저장소 상태 (메모리 사용량) --- START
+    with st.sidebar.expander("대화 저장소 상태", expanded=False):
+        checkpoint_stats = checkpointer_stats(get_checkpointer())
+        st.caption(f"저장 방식: {checkpoint_stats['backend']} · 보관 중인 대화 {checkpoint_stats['threads']:,}개")
+        if checkpoint_stats.get("process_rss_bytes"):
+            st.caption(f"프로세스 메모리: {checkpoint_stats['process_rss_bytes'] / 1024 / 1024:,.1f} MB")
+        if "db_bytes" in checkpoint_stats:
+            st.caption(
+                f"저장소 파일: {checkpoint_stats['db_bytes'] / 1024 / 1024:,.1f} MB "
+                f"(캐시 상한 {checkpoint_stats['cache_limit_bytes'] / 1024 / 1024:,.0f} MB) · "
+                f"정리된 대화 {checkpoint_stats['expired_threads'] + checkpoint_stats['evicted_threads']:,}개"
+            )
+    # --- 대화 저장소 상태 (메모리 사용량) --- END
+
+    # --- 응답 지연 통계 (추적) --- START
+    with st.sidebar.expander("응답 지연 통계", expanded=False):
+        latency_summary = get_tracer().latency_summary()
+        if latency_summary:
+            st.dataframe(
+                [
+                    {"구간": name, "호출": stats["count"], "오류": stats["errors"],
+                     "p50 (ms)": round(stats["p50_ms"]), "p95 (ms)": round(stats["p95_ms"]), "p99 (ms)": round(stats["p99_ms"])}
+                    for name, stats in latency_summary.items()
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+            st.download_button(
+                "최근 추적 내보내기 (JSON)",
+                data=json.dumps(get_tracer().recent_traces(limit=None), ensure_ascii=False, default=str),
+                file_name="traces.json",
+                mime="application/json",
+                use_container_width=True,
+            )
+        else:
+            st.caption("아직 기록된 구간이 없습니다.")
+    # --- 응답 지연 통계 (추적) --- END
+
     # --- 폼 렌더링 함수 정의 ---
     def render_email_form():
         with st.form(key='email_form_area', clear_on_submit=True):
@@ -892,7 +823,7 @@ with tab1:
                             bcc_list = [email.strip() for email in bcc.split(',') if email.strip()] if bcc else None
 
                             sent_message = send_email(
-                                st.session_state.gmail_service,
+                                get_gmail_service(),
                                 to_list,
                                 subject,
                                 body,
@@ -958,7 +889,7 @@ with tab1:
                             attendee_list = [email.strip() for email in attendees.split(',') if email.strip()] if attendees else None
 
                             event = create_calendar_event(
-                                st.session_state.calendar_service,
+                                get_calendar_service(),
                                 summary=summary,
                                 location=location,
                                 description=description,
@@ -997,7 +928,7 @@ with tab1:
         # with st.spinner("🦋 비서 '나비'를 깨우고 있어요... (초기 설정 중)"): # 스피너 제거
         success = False
         try:
-             success = st.session_state.event_loop.run_until_complete(initialize_session())
+             success = initialize_session()
         except Exception as initial_init_e:
              print(f"Critical error during initial session initialization: {initial_init_e}")
              st.error(f"❌ 시스템 초기화 중 심각한 오류 발생: {initial_init_e}. 페이지를 새로고침하거나 관리자에게 문의하세요.")
@@ -1007,9 +938,7 @@ with tab1:
             # 초기 인사말 재생성 시도
             if st.session_state.initial_greeting is None:
                  try:
-                     greeting = st.session_state.event_loop.run_until_complete(
-                         run_initial_tools_and_summarize()
-                     )
+                     greeting = generate_initial_greeting()
                      st.session_state.initial_greeting = greeting
                      # 히스토리 맨 앞에 새 인사말 삽입
                      if not st.session_state.history:
@@ -1035,9 +964,7 @@ with tab1:
     if st.session_state.get("needs_greeting_regeneration", False):
         print("DEBUG: Regenerating greeting based on flag (likely after Google Auth).")
         try:
-            new_greeting = st.session_state.event_loop.run_until_complete(
-                run_initial_tools_and_summarize()
-            )
+            new_greeting = generate_initial_greeting()
             st.session_state.initial_greeting = new_greeting
             # 히스토리 맨 앞 업데이트 또는 삽입
             if st.session_state.history: # history가 있으면 첫 메시지 업데이트
@@ -1107,9 +1034,7 @@ with tab1:
 
                 # 비동기 작업 실행
                 resp, final_text, final_tool_results, formatted_tool_results_for_history = (
-                    st.session_state.event_loop.run_until_complete(
-                        process_query(user_query, text_placeholder) # 플레이스홀더 전달
-                    )
+                    run_query(user_query, text_placeholder) # 플레이스홀더 전달
                 )
 
                 # 응답 완료 후, 어시스턴트 메시지를 임시 변수에 저장
@@ -1119,6 +1044,12 @@ with tab1:
                 else:
                     # 성공 응답을 임시 변수에 저장
                     history_entry = {"role": "assistant", "content": final_text}
+                    prompt_records = get_history_compactor().recent_records(st.session_state.thread_id, limit=1)
+                    if prompt_records:
+                        history_entry["prompt_tokens"] = {
+                            "before": prompt_records[-1]["tokens_before"],
+                            "after": prompt_records[-1]["tokens_after"],
+                        }
                     if formatted_tool_results_for_history:
                         history_entry["tool_output"] = "\n---\n".join(formatted_tool_results_for_history)
                     st.session_state.pending_assistant_entry = history_entry
@@ -1143,10 +1074,25 @@ with tab2:
     briefing_result = st.session_state.get("briefing_result")
     last_briefed = st.session_state.get("last_briefed_interests")
 
-    # 관심 분야가 있고, (결과가 없거나 or 마지막 브리핑된 관심사와 현재 관심사가 다를 때) 검색 수행 -> 조건 수정: 관심 분야가 있으면 항상 검색 수행
-    if interests: # <<< 수정된 조건: 관심 분야가 존재하면 항상 브리핑 생성 시도
+    refresh_requested = st.session_state.pop("briefing_refresh_requested", False)
+
+    # 관심 분야가 바뀌었거나 새로고침을 요청하면 현재 결과를 버림
+    if interests and (refresh_requested or last_briefed != interests):
+        briefing_result = None
+
+    # 스케줄러가 미리 생성해 둔 최신 브리핑이 있으면 바로 사용
+    if interests and briefing_result is None and not refresh_requested:
+        stored_briefing = briefing_store.get_latest(interests)
+        if stored_briefing:
+            briefing_result = stored_briefing["content"]
+            st.session_state.briefing_result = briefing_result
+            st.session_state.briefing_created_at = stored_briefing["created_at"]
+            st.session_state.last_briefed_interests = interests
+
+    briefing_rendered = False # 스트리밍으로 이미 표시했는지 여부
+    if interests: # 관심 분야가 존재하면 저장된 브리핑이 없을 때 즉시 생성
         # 브리핑 실행 로직은 컨테이너 밖에 위치 (스피너 표시 때문)
-        if briefing_result is None: # 아직 브리핑 결과가 없으면 검색 시도
+        if briefing_result is None: # 저장된 브리핑도 없으면 검색 시도
             if not st.session_state.session_initialized or not st.session_state.mcp_client:
                 st.warning("시스템이 아직 준비되지 않아 관심 분야 브리핑을 생성할 수 없습니다.")
             else:
@@ -1163,27 +1109,67 @@ with tab2:
                 else:
                     with st.spinner(f"'{interests}' 관련 보고서 작성중..."):
                         try:
-                            loop = st.session_state.event_loop
-                            search_prompt = f"Summarize the latest developments and key information about: {interests}. Provide a concise overview suitable for a briefing."
                             print(f"DEBUG: Running briefing search for: {interests}")
-                            result = loop.run_until_complete(search_tool.ainvoke({"query": search_prompt}))
+                            # 브리핑 컨테이너에 결과를 스트리밍으로 표시
+                            with st.container(border=True):
+                                st.subheader(f"✨ '{interests}' 관심 분야 브리핑")
+                                result = generate_briefing(
+                                    interests, st.empty(), search_tool,
+                                    source="refresh" if refresh_requested else "on_demand",
+                                    use_cache=not refresh_requested,
+                                )
+                            st.divider()
                             st.session_state.briefing_result = result
+                            st.session_state.briefing_created_at = time.time()
+                            st.session_state.last_briefed_interests = interests
                             briefing_result = result
+                            briefing_rendered = True
                             print(f"DEBUG: Briefing search complete for: {interests}")
                         except Exception as e:
                             st.error(f"관심 분야 브리핑 생성 중 오류 발생: {e}")
                             st.session_state.briefing_result = f"오류로 인해 브리핑 생성에 실패했습니다: {e}"
+                            st.session_state.last_briefed_interests = interests
                             briefing_result = st.session_state.briefing_result
 
     # 브리핑 결과 표시 컨테이너 또는 안내 메시지
-    if interests and briefing_result:
+    if interests and briefing_result and not briefing_rendered:
         with st.container(border=True):
             st.subheader(f"✨ '{interests}' 관심 분야 브리핑")
+            created_at = st.session_state.get("briefing_created_at")
+            caption_col, refresh_col = st.columns([4, 1])
+            if created_at:
+                caption_col.caption(f"🕒 {datetime.fromtimestamp(created_at).strftime('%Y-%m-%d %H:%M')} 기준")
+            if refresh_col.button("🔄 새로고침", key="briefing_refresh_button", use_container_width=True):
+                st.session_state.briefing_refresh_requested = True
+                st.rerun()
             st.markdown(briefing_result)
         st.divider() # 브리핑과 직접 검색 사이 구분선
     elif not interests: # 관심 분야가 없을 때 안내 메시지 표시
         st.info("💡 사이드바의 '관심 분야 설정'에서 관심사를 등록하고 맞춤 보고서를 받아보세요!")
         st.divider() # 안내 메시지와 직접 검색 사이 구분선
+
+    # 브리핑 작업 기록 (스케줄러/즉시 생성 모두 포함)
+    if interests:
+        with st.expander("브리핑 작업 기록"):
+            jobs = briefing_store.recent_jobs(limit=20)
+            if not jobs:
+                st.caption("아직 실행된 브리핑 작업이 없습니다.")
+            else:
+                st.dataframe(
+                    [
+                        {
+                            "시각": datetime.fromtimestamp(job["started_at"]).strftime("%Y-%m-%d %H:%M:%S"),
+                            "관심 분야": job["interests"],
+                            "실행 경로": job["source"],
+                            "소요 시간(초)": round(job["duration_seconds"], 2),
+                            "상태": job["status"],
+                            "오류": job["error"] or "",
+                        }
+                        for job in jobs
+                    ],
+                    use_container_width=True,
+                    hide_index=True,
+                )
     # --- 관심 분야 브리핑 --- END
 
     # --- 사용자 직접 검색 --- START
@@ -1210,12 +1196,9 @@ with tab2:
                 else:
                     with st.spinner("Perplexity AI에 문의 중..."):
                         try:
-                            loop = st.session_state.event_loop
-                            search_result = loop.run_until_complete(search_tool.ainvoke({"query": search_query}))
-                            
-                            # 검색 결과 표시 (컨테이너 내부)
+                            # 검색 결과 표시 (컨테이너 내부, 도착하는 대로 스트리밍)
                             st.markdown("--- *검색 결과* ---") # 결과 구분선 추가
-                            st.markdown(search_result)
+                            search_result = stream_search(search_query, st.empty(), search_tool)
                         except Exception as e:
                             st.error(f"검색 실행 중 오류 발생: {e}")
     # --- 사용자 직접 검색 --- END
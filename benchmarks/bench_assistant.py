@@ -0,0 +1,364 @@
+"""
+비서 전체 경로 오프라인 벤치마크
+
+API 키나 네트워크 없이 앱의 실제 코드 경로(agent_runtime.process_query, run_initial_tools_and_summarize,
+세 MCP 서버의 도구)를 실행해 지연 시간 분포, 동시 사용자 처리량, 세션당 메모리를 측정합니다.
+
+- LLM: 지연을 설정할 수 있는 가짜 채팅 모델 (fake_llm.py, 키워드로 도구 호출)
+- Gmail/캘린더: 가짜 Google 서비스 (fake_gmail.py, fake_calendar.py) + API 호출마다 --google-latency 지연
+- 날씨/Perplexity: 로컬 스텁 HTTP 서버 (stub_server.py) + 요청마다 --http-latency 지연
+- MCP 서버: 서브프로세스 대신 메모리 세션으로 연결 (도구 등록/직렬화 경로는 그대로)
+
+측정 항목:
+- tools: 도구별 호출 지연 (p50/p95/p99/max/mean ms, --cold이면 매 호출 전에 캐시를 비움)
+- sessions: 사용자 --users명이 동시에 인사말 생성 후 질문 --queries개를 처리할 때의 지연 분포와 처리량
+- memory: 세션 하나(인사말 + 질문 1개)를 더 만들 때 늘어나는 파이썬 할당량(tracemalloc)과 RSS
+- spans: 추적 구간별 지연 요약 (tracing.py)
+
+사용법 (저장소 루트에서):
+    python benchmarks/bench_assistant.py --users 10 --queries 3 --output bench.json
+    python benchmarks/bench_assistant.py --users 10 --queries 3 --baseline bench.json
+결과는 JSON으로 표준 출력에 기록되고, --baseline을 주면 이전 결과 대비 변화율(comparison)이 함께 기록됩니다.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import AsyncExitStack, redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+sys.path.insert(0, str(ROOT))
+
+import fake_calendar
+import fake_gmail
+from fake_calendar import KST, FakeCalendarService
+from fake_gmail import FakeGmailService
+from fake_llm import FakeToolCallingChatModel
+from stub_server import start_stub_server
+
+QUERIES = [
+    "오늘 날씨 어때?",
+    "최근 메일 보여줘",
+    "이번 주 일정 알려줘",
+    "파이썬 3.13 새 기능 검색해줘",
+    "주말 예보 알려줘",
+    "고마워!",
+]
+
+# 도구별 측정 인자 (도구 이름, 인자, 결과 키)
+TOOL_SPECS = [
+    ("get_weather", {}, "get_weather"),
+    ("get_weather", {"mode": "forecast"}, "get_weather_forecast"),
+    ("list_emails_tool", {"max_results": 10}, "list_emails_tool"),
+    ("search_emails_tool", {"query": "subject:보고", "max_results": 10}, "search_emails_tool"),
+    ("modify_email_tool", {"msg_id": "m000001", "action": "read"}, "modify_email_tool"),
+    ("send_email_tool", {"to": "friend@example.com", "subject": "벤치마크", "body": "본문"}, "send_email_tool"),
+    ("list_events_tool", {"max_results": 5}, "list_events_tool"),
+    ("create_event_tool", {"summary": "회의", "start_datetime": "2026-01-05 10:00", "end_datetime": "2026-01-05 11:00"}, "create_event_tool"),
+    ("perplexity_search", {"query": "벤치마크 질의 {i}"}, "perplexity_search"),
+]
+
+BENCH_PROMPT = "당신은 사용자의 비서 나비입니다. 날씨, 이메일, 캘린더, 검색 도구를 사용해 한국어로 답하세요."
+
+
+def configure_environment(tmp, base_url):
+    """앱 모듈을 불러오기 전에 저장 경로와 외부 API 주소를 임시 디렉터리/스텁 서버로 바꿉니다."""
+    os.environ.update({
+        "GMAIL_INDEX_PATH": os.path.join(tmp, "gmail_index.sqlite3"),
+        "CALENDAR_STORE_PATH": os.path.join(tmp, "calendar_store.sqlite3"),
+        "AGENT_CHECKPOINT_PATH": os.path.join(tmp, "agent_checkpoints.sqlite3"),
+        "TRACE_FILE": "",
+        "AGENT_TOKENIZER": "",
+        "PERPLEXITY_API_KEY": "bench",
+        "PERPLEXITY_API_URL": f"{base_url}/chat/completions",
+        "WEATHERMAP_API_KEY": "bench",
+        "WEATHER_LOCATION_URL": f"{base_url}/json",
+        "WEATHER_API_URL": f"{base_url}/data/2.5",
+    })
+
+
+def add_google_latency(latency):
+    """가짜 Google 서비스의 API 요청(execute)마다 latency초를 기다리게 합니다. (batch는 왕복 한 번으로 계산)"""
+    for module in (fake_gmail, fake_calendar):
+        request_execute = module._Request.execute
+        batch_execute = module._Batch.execute
+
+        def execute(self, _original=request_execute):
+            time.sleep(latency)
+            return _original(self)
+
+        def execute_batch(self, _original=batch_execute):
+            time.sleep(latency)
+            for request, _ in self._requests:
+                request.execute = request._fn  # 묶음 안의 요청은 따로 기다리지 않음
+            return _original(self)
+
+        module._Request.execute = execute
+        module._Batch.execute = execute_batch
+
+
+def build_google_services(messages, events):
+    gmail = FakeGmailService(messages)
+    for i in range(0, messages, 7):
+        gmail.add_message(subject=f"주간 보고 {i}", record_history=False)
+    calendar = FakeCalendarService()
+    start = datetime.now(KST).replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    for i in range(events):
+        calendar.add_event(f"일정 {i}", start + timedelta(hours=3 * i), record=False)
+    calendar.add_event("주간 회의", start + timedelta(hours=2), recurrence="RRULE:FREQ=WEEKLY", record=False)
+    return gmail, calendar
+
+
+def summarize(durations):
+    from tracing import summarize_durations
+
+    summary = summarize_durations(durations)
+    summary["mean_ms"] = statistics.fmean(durations) if durations else None
+    return summary
+
+
+class _ToolClient:
+    """run_initial_tools_and_summarize가 기대하는 MCP 클라이언트 인터페이스 (get_tools)"""
+
+    def __init__(self, tools):
+        self._tools = tools
+
+    def get_tools(self):
+        return self._tools
+
+
+async def connect_tools(stack, servers):
+    """MCP 서버들에 메모리 세션으로 연결하고 LangChain 도구 목록을 반환합니다."""
+    from langchain_mcp_adapters.tools import load_mcp_tools
+    from mcp.shared.memory import create_connected_server_and_client_session
+
+    tools = []
+    for server in servers:
+        session = await stack.enter_async_context(create_connected_server_and_client_session(server._mcp_server))
+        tools.extend(await load_mcp_tools(session))
+    return tools
+
+
+# --- 측정 단계 --- START
+async def bench_tools(tools, iterations, cold):
+    from cache_utils import all_caches
+
+    by_name = {tool.name: tool for tool in tools}
+    report = {}
+    for name, args, key in TOOL_SPECS:
+        tool = by_name.get(name)
+        if tool is None:
+            continue
+        durations, errors = [], 0
+        for i in range(iterations):
+            if cold:
+                for cache in all_caches():
+                    cache.clear()
+            call_args = {k: v.format(i=i) if isinstance(v, str) else v for k, v in args.items()}
+            started = time.perf_counter()
+            try:
+                await tool.ainvoke(call_args)
+            except Exception as e:
+                errors += 1
+                print(f"ERROR (bench_tools): {key}: {e}", file=sys.stderr)
+            durations.append((time.perf_counter() - started) * 1000)
+        report[key] = {**summarize(durations), "errors": errors}
+    return report
+
+
+async def run_user(index, llm, agent, client, queries, greeting_ms, query_ms, per_query, errors):
+    from agent_runtime import get_streaming_callback, process_query, run_initial_tools_and_summarize
+
+    started = time.perf_counter()
+    await run_initial_tools_and_summarize(llm, client, True, stream_buffer=[], tool_timings={})
+    greeting_ms.append((time.perf_counter() - started) * 1000)
+
+    for q in range(queries):
+        query = QUERIES[(index + q) % len(QUERIES)]
+        started = time.perf_counter()
+        result = await process_query(query, agent, f"user-{index}", get_streaming_callback({}))
+        elapsed = (time.perf_counter() - started) * 1000
+        query_ms.append(elapsed)
+        per_query.setdefault(query, []).append(elapsed)
+        if isinstance(result[0], dict) and "error" in result[0]:
+            errors.append(result[0]["error"][:200])
+
+
+async def bench_sessions(llm, agent, client, users, queries, offset=0):
+    greeting_ms, query_ms, per_query, errors = [], [], {}, []
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_user(offset + i, llm, agent, client, queries, greeting_ms, query_ms, per_query, errors)
+        for i in range(users)
+    ))
+    elapsed = time.perf_counter() - started
+    return {
+        "users": users,
+        "queries_per_user": queries,
+        "elapsed_seconds": elapsed,
+        "throughput_qps": len(query_ms) / elapsed if elapsed else None,
+        "greeting": summarize(greeting_ms),
+        "query": summarize(query_ms),
+        "per_query": {query: summarize(durations) for query, durations in per_query.items()},
+        "errors": len(errors),
+        "error_samples": errors[:3],
+    }
+
+
+async def bench_memory(llm, agent, client, sessions):
+    """세션 sessions개(인사말 + 질문 1개)를 차례로 만들며 늘어난 할당량/RSS를 세션당 값으로 나눕니다."""
+    from metrics import process_rss_bytes
+
+    gc.collect()
+    rss_before = process_rss_bytes()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(sessions):
+        await bench_sessions(llm, agent, client, 1, 1, offset=10000 + i)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = process_rss_bytes()
+
+    growth = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    top = [
+        {"file": stat.traceback[0].filename.replace(str(ROOT.parent) + os.sep, ""), "bytes": stat.size_diff}
+        for stat in after.compare_to(before, "filename")[:5]
+    ]
+    return {
+        "sessions": sessions,
+        "python_bytes_per_session": growth / sessions,
+        "tracemalloc_peak_bytes": peak,
+        "rss_bytes_per_session": (rss_after - rss_before) / sessions if rss_before and rss_after else None,
+        "rss_bytes": rss_after,
+        "top_growth": top,
+    }
+# --- 측정 단계 --- END
+
+
+# --- 이전 결과와 비교 --- START
+COMPARE_SUFFIXES = ("_ms", "_seconds", "_qps", "_bytes", "_per_session")
+
+
+def flatten(report, prefix=""):
+    """중첩된 결과에서 비교할 숫자 값만 "a.b.c" 경로로 펼칩니다."""
+    values = {}
+    for key, value in report.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key.endswith(COMPARE_SUFFIXES):
+            values[path] = value
+    return values
+
+
+def compare(report, baseline):
+    current, previous = flatten(report), flatten(baseline)
+    comparison = {}
+    for path in sorted(current.keys() & previous.keys()):
+        before, after = previous[path], current[path]
+        comparison[path] = {
+            "baseline": before,
+            "current": after,
+            "change_pct": (after - before) / before * 100 if before else None,
+        }
+    return comparison
+# --- 이전 결과와 비교 --- END
+
+
+async def run(args, stub):
+    import gsuite_mcp_server
+    import mcp_server_local
+    import pplx_search_mcp_server
+    from langgraph.prebuilt import create_react_agent
+    from checkpoint_store import checkpointer_stats, create_checkpointer
+    from history_compactor import HistoryCompactor
+    from tracing import get_tracer
+
+    add_google_latency(args.google_latency)
+    gmail, calendar = build_google_services(args.messages, args.events)
+
+    async def gmail_service(user_id=None):
+        return gmail
+
+    async def calendar_service(user_id=None):
+        return calendar
+
+    gsuite_mcp_server.get_gmail_service_async = gmail_service
+    gsuite_mcp_server.get_calendar_service_async = calendar_service
+
+    llm = FakeToolCallingChatModel(
+        first_token_latency=args.llm_latency, token_interval=args.token_interval, answer_words=args.answer_words,
+    )
+    checkpointer = create_checkpointer(args.checkpointer)
+
+    async with AsyncExitStack() as stack:
+        tools = await connect_tools(stack, [mcp_server_local.mcp, gsuite_mcp_server.mcp, pplx_search_mcp_server.mcp])
+        agent = create_react_agent(llm, tools, checkpointer=checkpointer, prompt=HistoryCompactor(BENCH_PROMPT))
+        client = _ToolClient(tools)
+
+        report = {"config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}}
+        report["tools"] = await bench_tools(tools, args.iterations, args.cold)
+        report["sessions"] = await bench_sessions(llm, agent, client, args.users, args.queries)
+        if args.memory_sessions:
+            report["memory"] = await bench_memory(llm, agent, client, args.memory_sessions)
+        report["checkpointer"] = checkpointer_stats(checkpointer)
+
+    report["spans"] = get_tracer().latency_summary()
+    report["backends"] = {
+        "http_requests": stub.request_count,
+        "gmail_calls": dict(gmail.calls),
+        "calendar_calls": dict(calendar.calls),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="동시 사용자 수")
+    parser.add_argument("--queries", type=int, default=3, help="사용자별 질문 수")
+    parser.add_argument("--iterations", type=int, default=20, help="도구별 호출 횟수")
+    parser.add_argument("--cold", action="store_true", help="도구 호출 전마다 캐시를 비움")
+    parser.add_argument("--memory-sessions", type=int, default=10, help="메모리 측정에 쓸 세션 수 (0이면 생략)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="LLM 첫 토큰까지의 지연(초)")
+    parser.add_argument("--token-interval", type=float, default=0.005, help="LLM 토큰 간격(초)")
+    parser.add_argument("--answer-words", type=int, default=40, help="LLM 답변 단어 수")
+    parser.add_argument("--http-latency", type=float, default=0.1, help="날씨/Perplexity 스텁 서버 응답 지연(초)")
+    parser.add_argument("--google-latency", type=float, default=0.05, help="Google API 요청당 지연(초)")
+    parser.add_argument("--messages", type=int, default=200, help="가짜 메일함의 메일 수")
+    parser.add_argument("--events", type=int, default=20, help="가짜 캘린더의 일정 수")
+    parser.add_argument("--checkpointer", choices=["sqlite", "memory"], default="sqlite", help="대화 상태 저장소")
+    parser.add_argument("--output", help="결과를 저장할 JSON 파일")
+    parser.add_argument("--baseline", help="비교할 이전 결과 JSON 파일")
+    args = parser.parse_args()
+
+    stub, base_url = start_stub_server(latency=args.http_latency, token_interval=args.token_interval)
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_environment(tmp, base_url)
+        try:
+            with redirect_stdout(sys.stderr):  # 앱 모듈의 DEBUG 출력이 JSON 결과에 섞이지 않도록
+                report = asyncio.run(run(args, stub))
+        finally:
+            stub.shutdown()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
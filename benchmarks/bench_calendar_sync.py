@@ -0,0 +1,98 @@
+"""
+캘린더 로컬 일정 저장소 동기화 벤치마크
+
+가짜 캘린더 서비스(fake_calendar.py)를 사용해 일정 수와 변경 건수에 따른 API 호출 수와 소요 시간을 측정합니다.
+
+- remote: 저장소 없이 "다가오는 일정" 조회 (호출마다 events.list)
+- full_sync: 저장소 최초 동기화 + 로컬 조회 (반복 일정 펼치기 포함)
+- resync_N: 변경 N건 후 증분 동기화(syncToken) + 로컬 조회
+
+사용법 (저장소 루트에서):
+    python benchmarks/bench_calendar_sync.py --sizes 200 2000 --changes 0 10
+결과는 JSON으로 표준 출력에 기록됩니다.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+sys.path.insert(0, str(ROOT))
+
+from fake_calendar import KST, FakeCalendarService
+
+
+def measure(service, fn):
+    service.reset_calls()
+    started = time.perf_counter()
+    fn()
+    return {"elapsed_seconds": time.perf_counter() - started, "api_calls": dict(service.calls)}
+
+
+def build_calendar(size, recurring):
+    """지난 1년과 앞으로 1년에 걸친 일정 size건과 주간 반복 일정 recurring건을 만듭니다."""
+    service = FakeCalendarService()
+    now = datetime.now(KST).replace(minute=0, second=0, microsecond=0)
+    for i in range(size):
+        service.add_event(f"event {i}", now + timedelta(hours=(i * 24 * 730) // max(size, 1) - 24 * 365), record=False)
+    for i in range(recurring):
+        service.add_event(f"weekly {i}", now - timedelta(days=30 - i), recurrence="RRULE:FREQ=WEEKLY", record=False)
+    return service, now
+
+
+def apply_changes(service, now, count):
+    """새 일정 추가와 기존 일정 취소를 섞어 count건의 변경을 만듭니다."""
+    ids = sorted(service.events_by_id)
+    for i in range(count):
+        if i % 2 == 0:
+            service.add_event(f"new {i}", now + timedelta(days=i + 1))
+        else:
+            service.cancel_event(ids[i])
+
+
+def bench_size(calendar_utils, size, recurring, changes, max_results):
+    service, now = build_calendar(size, recurring)
+
+    def remote():
+        service.events().list(
+            calendarId="primary", timeMin=datetime.utcnow().isoformat() + "Z",
+            maxResults=max_results, singleEvents=True, orderBy="startTime",
+        ).execute()
+
+    report = {"remote": measure(service, remote)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = calendar_utils.EventStore(os.path.join(tmp, "calendar.sqlite3"))
+
+        def local():
+            calendar_utils.sync_events(service, store, force=True)
+            calendar_utils._list_upcoming_local(service, store, datetime.utcnow().isoformat() + "Z", max_results)
+
+        report["full_sync"] = measure(service, local)
+        for count in changes:
+            apply_changes(service, now, count)
+            report[f"resync_{count}"] = measure(service, local)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[200, 2000], help="일정 수 목록")
+    parser.add_argument("--recurring", type=int, default=5, help="주간 반복 일정 수")
+    parser.add_argument("--changes", type=int, nargs="+", default=[0, 10], help="재동기화 전 변경 건수 목록")
+    parser.add_argument("--max-results", type=int, default=10, help="다가오는 일정 조회 건수")
+    args = parser.parse_args()
+
+    import calendar_utils
+
+    report = {str(size): bench_size(calendar_utils, size, args.recurring, args.changes, args.max_results) for size in args.sizes}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
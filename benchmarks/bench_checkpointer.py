@@ -0,0 +1,81 @@
+"""
+에이전트 체크포인터 메모리 벤치마크
+
+가짜 채팅 모델(FakeListChatModel)로 만든 ReAct 에이전트에 대화(thread) N개 × 턴 M개를 실행하고,
+체크포인터가 프로세스 힙에 붙잡고 있는 메모리(tracemalloc 기준)와 보관 중인 대화 수를 측정합니다.
+
+- memory: 기존 MemorySaver (모든 대화의 모든 체크포인트를 메모리에 보관)
+- sqlite: checkpoint_store.SQLiteCheckpointSaver (파일에 저장, 대화별 최근 체크포인트만 보관, LRU로 대화 수 제한)
+
+사용법 (저장소 루트에서):
+    python benchmarks/bench_checkpointer.py --threads 200 --turns 5 --max-threads 50
+결과는 JSON으로 표준 출력에 기록됩니다.
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+
+
+def run(checkpointer, threads, turns, answer_chars):
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.messages import HumanMessage
+    from langgraph.prebuilt import create_react_agent
+
+    model = FakeListChatModel(responses=["나비 답변입니다. " * (answer_chars // 10)])
+    agent = create_react_agent(model, [], checkpointer=checkpointer)
+
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    for turn in range(turns):
+        for thread in range(threads):
+            config = {"configurable": {"thread_id": f"thread-{thread}"}}
+            agent.invoke({"messages": [HumanMessage(content=f"질문 {turn}")]}, config)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "elapsed_seconds": elapsed,
+        "retained_memory_mb": (retained - baseline) / 1024 / 1024,
+        "peak_memory_mb": (peak - baseline) / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=200, help="대화 수")
+    parser.add_argument("--turns", type=int, default=5, help="대화별 턴 수")
+    parser.add_argument("--answer-chars", type=int, default=2000, help="답변 길이(글자)")
+    parser.add_argument("--max-threads", type=int, default=50, help="SQLite 저장소가 보관할 최대 대화 수")
+    args = parser.parse_args()
+
+    from langgraph.checkpoint.memory import MemorySaver
+
+    import checkpoint_store
+
+    memory_saver = MemorySaver()
+    report = {"memory": run(memory_saver, args.threads, args.turns, args.answer_chars)}
+    report["memory"]["threads"] = len(memory_saver.storage)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saver = checkpoint_store.SQLiteCheckpointSaver(os.path.join(tmp, "checkpoints.sqlite3"), max_threads=args.max_threads)
+        report["sqlite"] = run(saver, args.threads, args.turns, args.answer_chars)
+        saver.prune()
+        stats = saver.stats()
+        report["sqlite"].update({key: stats[key] for key in ("threads", "checkpoints", "db_bytes", "evicted_threads")})
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
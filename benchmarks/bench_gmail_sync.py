@@ -0,0 +1,81 @@
+"""
+Gmail 로컬 인덱스 동기화 벤치마크
+
+가짜 Gmail 서비스(fake_gmail.py)를 사용해 메일함 크기와 변경 건수에 따른 API 호출 수와 소요 시간을 측정합니다.
+
+- remote: 인덱스 없이 list_emails 호출 (호출마다 messages.list + metadata 조회)
+- full_sync: 인덱스 최초 동기화
+- resync_N: 변경 N건 후 증분 동기화(history.list) + 로컬 조회
+
+사용법 (저장소 루트에서):
+    python benchmarks/bench_gmail_sync.py --sizes 500 5000 --changes 0 10 100
+결과는 JSON으로 표준 출력에 기록됩니다.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+sys.path.insert(0, str(ROOT))
+
+from fake_gmail import FakeGmailService
+
+
+def measure(service, fn):
+    service.reset_calls()
+    started = time.perf_counter()
+    fn()
+    return {"elapsed_seconds": time.perf_counter() - started, "api_calls": dict(service.calls)}
+
+
+def apply_changes(service, count):
+    """새 메일, 읽음 처리, 삭제를 섞어 count건의 변경을 만듭니다."""
+    ids = sorted(service.messages_by_id)
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            service.add_message(subject=f"new {i}")
+        elif kind == 1:
+            service.change_labels(ids[-(i + 1)], remove=["UNREAD"])
+        else:
+            service.delete_message(ids[i])
+
+
+def bench_size(gmail_utils, size, changes, max_results):
+    service = FakeGmailService(size)
+    report = {"remote": measure(service, lambda: gmail_utils.list_emails(service, max_results=max_results, query="in:inbox"))}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = gmail_utils.MailIndex(os.path.join(tmp, "index.sqlite3"))
+        report["full_sync"] = measure(service, lambda: gmail_utils.sync_mailbox(service, index))
+        for count in changes:
+            apply_changes(service, count)
+
+            def resync():
+                gmail_utils.sync_mailbox(service, index, force=True)
+                index.list_messages(["INBOX"], max_results)
+
+            report[f"resync_{count}"] = measure(service, resync)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 5000], help="메일함 크기 목록")
+    parser.add_argument("--changes", type=int, nargs="+", default=[0, 10, 100], help="재동기화 전 변경 건수 목록")
+    parser.add_argument("--max-results", type=int, default=10, help="목록 조회 건수")
+    args = parser.parse_args()
+
+    import gmail_utils
+
+    report = {str(size): bench_size(gmail_utils, size, args.changes, args.max_results) for size in args.sizes}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+MCP 클라이언트 풀 벤치마크
+
+세션 수를 늘려 가며 세션 하나가 추가될 때 드는 초기화 시간과 메모리(RSS, 하위 프로세스 포함)를 측정합니다.
+
+- per_session: 기존 방식처럼 세션마다 MultiServerMCPClient를 새로 띄움 (세션당 MCP 서버 프로세스 3개)
+- pooled: MCPClientPool 하나를 모든 세션이 공유
+
+사용법 (저장소 루트에서, .env 설정 필요):
+    python benchmarks/bench_mcp_pool.py --sessions 5
+결과는 JSON으로 표준 출력에 기록됩니다.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import AsyncExitStack
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.chdir(ROOT)  # MCP 서버 설정이 상대 경로(./*.py)를 사용
+
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from mcp_config import build_client_config
+from mcp_pool import MCPClientPool
+
+
+def _read_proc_status(pid, field):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0
+
+
+def process_tree_rss_kb(root_pid=None):
+    """root_pid와 모든 하위 프로세스의 RSS 합계(KB)와 프로세스 수를 반환합니다. (Linux /proc 기반)"""
+    root_pid = root_pid or os.getpid()
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        ppid = _read_proc_status(entry, "PPid")
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, count, stack = 0, 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += _read_proc_status(pid, "VmRSS")
+        count += 1
+        stack.extend(children.get(pid, []))
+    return total, count
+
+
+def bench_per_session(sessions):
+    async def run():
+        samples = []
+        async with AsyncExitStack() as stack:
+            for index in range(sessions):
+                started = time.perf_counter()
+                await stack.enter_async_context(MultiServerMCPClient(build_client_config()))
+                elapsed = time.perf_counter() - started
+                rss_kb, processes = process_tree_rss_kb()
+                samples.append({"session": index + 1, "init_seconds": elapsed, "rss_kb": rss_kb, "processes": processes})
+        return samples
+
+    return asyncio.run(run())
+
+
+def bench_pooled(sessions):
+    pool = MCPClientPool(client_factory=lambda: MultiServerMCPClient(build_client_config()))
+    samples = []
+    try:
+        for index in range(sessions):
+            started = time.perf_counter()
+            pool.acquire(f"bench-session-{index}")
+            elapsed = time.perf_counter() - started
+            rss_kb, processes = process_tree_rss_kb()
+            samples.append({"session": index + 1, "init_seconds": elapsed, "rss_kb": rss_kb, "processes": processes})
+    finally:
+        pool.shutdown()
+    return samples
+
+
+def summarize(samples, baseline_kb):
+    first, last = samples[0], samples[-1]
+    extra_sessions = max(len(samples) - 1, 1)
+    return {
+        "samples": samples,
+        "first_session_init_seconds": first["init_seconds"],
+        "additional_session_init_seconds": sum(s["init_seconds"] for s in samples[1:]) / extra_sessions if len(samples) > 1 else None,
+        "first_session_rss_kb": first["rss_kb"] - baseline_kb,
+        "additional_session_rss_kb": (last["rss_kb"] - first["rss_kb"]) / extra_sessions if len(samples) > 1 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5, help="시뮬레이션할 세션 수")
+    parser.add_argument("--mode", choices=["per_session", "pooled", "both"], default="both")
+    args = parser.parse_args()
+
+    report = {"sessions": args.sessions}
+    if args.mode in ("per_session", "both"):
+        baseline_kb, _ = process_tree_rss_kb()
+        report["per_session"] = summarize(bench_per_session(args.sessions), baseline_kb)
+    if args.mode in ("pooled", "both"):
+        baseline_kb, _ = process_tree_rss_kb()
+        report["pooled"] = summarize(bench_pooled(args.sessions), baseline_kb)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
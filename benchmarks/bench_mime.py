@@ -0,0 +1,106 @@
+"""
+이메일 본문(MIME) 추출 벤치마크
+
+합성한 대용량 multipart 메시지(Gmail API full 형식 payload)에서 본문을 추출하는 시간과 최대 메모리 사용량을 측정합니다.
+메시지는 text/plain + text/html 대안, 인라인 텍스트 첨부 파일, 작은 파트 여러 개로 구성됩니다.
+
+- before: 기존 방식 (list.pop(0)로 파트 순회, 모든 파트를 UTF-8로 디코딩해 문자열 += 로 연결)
+- after: gmail_utils.extract_body (deque 순회, text/plain 대안만 사용, 첨부 파일 건너뜀, 크기 제한)
+
+사용법 (저장소 루트에서):
+    python benchmarks/bench_mime.py --size-mb 10 --parts 1000
+결과는 JSON으로 표준 출력에 기록됩니다.
+"""
+import argparse
+import base64
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+
+
+def legacy_extract_body(payload):
+    """변경 전 gmail_utils.extract_body"""
+    parts = [payload]
+    body = ""
+
+    while parts:
+        part = parts.pop(0)
+
+        if 'parts' in part:
+            parts.extend(part['parts'])
+
+        if 'body' in part and 'data' in part['body']:
+            body_data = part['body']['data']
+            body += base64.urlsafe_b64decode(body_data).decode('utf-8', errors='replace')
+
+    return body
+
+
+def _part(mime_type, text, filename=""):
+    data = base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+    return {
+        "mimeType": mime_type,
+        "filename": filename,
+        "headers": [{"name": "Content-Type", "value": f"{mime_type}; charset=UTF-8"}],
+        "body": {"size": len(text), "data": data},
+    }
+
+
+def build_message(size_mb, parts):
+    """본문 대안(20%/30%), 텍스트 첨부 파일(40%), 작은 파트들(10%)로 약 size_mb MB의 메시지를 만듭니다."""
+    total = size_mb * 1024 * 1024
+    line = "나비 비서 벤치마크 본문 줄입니다. The quick brown fox jumps over the lazy dog.\n"
+    line_bytes = len(line.encode("utf-8"))
+
+    def text(size):
+        return line * max(1, size // line_bytes)
+
+    small = text(total // 10 // max(parts, 1))
+    return {
+        "mimeType": "multipart/mixed",
+        "headers": [],
+        "parts": [
+            {"mimeType": "multipart/alternative", "parts": [
+                _part("text/plain", text(total // 5)),
+                _part("text/html", "<html><body><p>" + text(total * 3 // 10) + "</p></body></html>"),
+            ]},
+            _part("text/plain", text(total * 2 // 5), filename="log.txt"),
+            {"mimeType": "multipart/mixed", "parts": [_part("text/plain", small) for _ in range(parts)]},
+        ],
+    }
+
+
+def measure(fn, payload):
+    tracemalloc.start()
+    started = time.perf_counter()
+    body = fn(payload)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"elapsed_seconds": elapsed, "peak_memory_mb": peak / 1024 / 1024, "body_chars": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=10, help="합성 메시지 크기(MB)")
+    parser.add_argument("--parts", type=int, default=1000, help="작은 파트 수")
+    args = parser.parse_args()
+
+    import gmail_utils
+
+    payload = build_message(args.size_mb, args.parts)
+    report = {
+        "before": measure(legacy_extract_body, payload),
+        "after": measure(gmail_utils.extract_body, payload),
+        "after_uncapped": measure(lambda p: gmail_utils.extract_body(p, max_bytes=args.size_mb * 1024 * 1024 * 2), payload),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
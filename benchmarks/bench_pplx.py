@@ -0,0 +1,108 @@
+"""
+Perplexity 검색 동시 처리량 벤치마크
+
+지연 시간을 설정할 수 있는 로컬 스텁 서버를 띄우고, perplexity_search 도구가 동시에 여러 번 호출될 때의
+처리량을 비교합니다.
+
+- before: 동기 ask_perplexity를 async 도구 안에서 호출 (호출마다 새 연결, 이벤트 루프 블로킹)
+- after: ask_perplexity_async를 await (공유 연결 풀, 논블로킹)
+- cached: after와 같은 질의를 (공백/대소문자만 바꿔) 다시 보내 응답 캐시 적중 시의 처리량과 API 호출 수를 측정
+- streaming: 긴 답변 하나를 한 번에 받을 때와 stream: true로 받을 때 첫 글자가 화면에 나오기까지의 시간을 비교
+
+사용법 (저장소 루트에서):
+    python benchmarks/bench_pplx.py --concurrency 10 --latency 0.2
+결과는 JSON으로 표준 출력에 기록됩니다.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT.parent))
+sys.path.insert(0, str(ROOT))
+
+from stub_server import start_stub_server
+
+
+async def run_concurrent(search, concurrency, template="query {}"):
+    started = time.perf_counter()
+    results = await asyncio.gather(*(search(template.format(i)) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    failures = sum(1 for result in results if result.startswith("❌"))
+    return {
+        "elapsed_seconds": elapsed,
+        "throughput_rps": concurrency / elapsed,
+        "failures": failures,
+    }
+
+
+async def measure_first_token(pplx_utils, question):
+    started = time.perf_counter()
+    await pplx_utils.ask_perplexity_async(question, use_cache=False)
+    blocking_total = time.perf_counter() - started
+
+    started = time.perf_counter()
+    first_token, chunks = None, 0
+    async for _ in pplx_utils.stream_perplexity_async(question, use_cache=False):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+        chunks += 1
+    return {
+        "blocking_first_token_seconds": blocking_total,
+        "streaming_first_token_seconds": first_token,
+        "streaming_total_seconds": time.perf_counter() - started,
+        "streaming_chunks": chunks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=10, help="동시 검색 수")
+    parser.add_argument("--latency", type=float, default=0.2, help="스텁 서버 응답 지연(초)")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="스트리밍 응답 청크 간격(초)")
+    parser.add_argument("--answer-words", type=int, default=50, help="streaming 측정에 사용할 답변 단어 수")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(latency=args.latency, token_interval=args.token_interval)
+    os.environ.setdefault("PERPLEXITY_API_KEY", "benchmark")
+    os.environ["PERPLEXITY_API_URL"] = f"{base_url}/chat/completions"
+    import pplx_utils
+
+    async def search_before(query):
+        return pplx_utils.ask_perplexity(query, use_cache=False)
+
+    async def search_after(query):
+        return await pplx_utils.ask_perplexity_async(query, use_cache=False)
+
+    async def search_cached(query):
+        return await pplx_utils.ask_perplexity_async(query)
+
+    try:
+        report = {
+            "concurrency": args.concurrency,
+            "stub_latency_seconds": args.latency,
+            "before": asyncio.run(run_concurrent(search_before, args.concurrency)),
+            "after": asyncio.run(run_concurrent(search_after, args.concurrency)),
+        }
+
+        # 캐시 예열 후 같은 질의를 표기만 바꿔 다시 요청
+        asyncio.run(run_concurrent(search_cached, args.concurrency))
+        requests_before = server.request_count
+        report["cached"] = asyncio.run(run_concurrent(search_cached, args.concurrency, template="  QUERY   {} "))
+        report["cached"]["api_requests"] = server.request_count - requests_before
+        report["cache_stats"] = pplx_utils.get_cache_stats()
+
+        long_question = " ".join(f"word{i}" for i in range(args.answer_words))
+        report["streaming"] = asyncio.run(measure_first_token(pplx_utils, long_question))
+    finally:
+        server.shutdown()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+벤치마크용 가짜 Google Calendar API 서비스
+
+googleapiclient Calendar 서비스 중 이 저장소가 사용하는 부분(events.list/instances/insert, calendars.get, batch 요청)만
+메모리에서 흉내 내고, API 호출 수를 calls에 기록합니다.
+반복 일정은 RRULE의 FREQ=DAILY/WEEKLY, INTERVAL, COUNT, UNTIL만 지원합니다.
+"""
+import itertools
+from datetime import datetime, timedelta, timezone
+
+from googleapiclient.errors import HttpError
+
+KST = timezone(timedelta(hours=9))
+
+
+class _Resp(dict):
+    """HttpError에 넘길 최소한의 응답 객체"""
+
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "fake error"
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class _Batch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id):
+        self._requests.append((request, request_id))
+
+    def execute(self):
+        self._service.calls["batch"] += 1
+        for request, request_id in self._requests:
+            try:
+                self._callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self._callback(request_id, None, e)
+
+
+def _parse(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _event_time(dt):
+    return {"dateTime": dt.isoformat(), "timeZone": "Asia/Seoul"}
+
+
+class FakeCalendarService:
+    """
+    메모리 기반 가짜 캘린더 서비스.
+
+    add_event / update_event / cancel_event / cancel_instance로 일정을 바꾸면 syncToken 변경분에 반영됩니다.
+    """
+
+    CALL_TYPES = ["calendars", "list", "instances", "insert", "batch"]
+
+    def __init__(self, calendar_id="me@example.com"):
+        self.calendar_id = calendar_id
+        self.events_by_id = {}  # id -> 일정 (반복 일정 원본 포함, 취소된 일정은 status=cancelled)
+        self.exceptions = {}  # (반복 일정 id, 원래 시작 시각 ISO) -> 예외 회차 (수정 또는 취소)
+        self.changes = []  # (변경 번호, 일정 또는 예외 회차)
+        self.sync_expired = False  # True이면 syncToken 조회가 410
+        self._sequence = itertools.count(1)
+        self._ids = itertools.count()
+        self.calls = {}
+        self.reset_calls()
+
+    def reset_calls(self):
+        self.calls = {name: 0 for name in self.CALL_TYPES}
+
+    # --- 일정 변경 --- START
+    def add_event(self, summary, start, hours=1, recurrence=None, record=True):
+        event_id = f"e{next(self._ids):06d}"
+        event = {
+            "id": event_id,
+            "status": "confirmed",
+            "summary": summary,
+            "start": _event_time(start),
+            "end": _event_time(start + timedelta(hours=hours)),
+        }
+        if recurrence:
+            event["recurrence"] = [recurrence]
+        self.events_by_id[event_id] = event
+        if record:
+            self._record(event)
+        return event_id
+
+    def update_event(self, event_id, **fields):
+        self.events_by_id[event_id].update(fields)
+        self._record(self.events_by_id[event_id])
+
+    def cancel_event(self, event_id):
+        self.events_by_id[event_id] = {"id": event_id, "status": "cancelled"}
+        self._record(self.events_by_id[event_id])
+
+    def cancel_instance(self, master_id, original_start):
+        key = (master_id, original_start.isoformat())
+        exception = {
+            "id": f"{master_id}_{original_start.strftime('%Y%m%dT%H%M%S')}",
+            "status": "cancelled",
+            "recurringEventId": master_id,
+            "originalStartTime": _event_time(original_start),
+        }
+        self.exceptions[key] = exception
+        self._record(exception)
+
+    def _record(self, item):
+        self.changes.append((next(self._sequence), dict(item)))
+    # --- 일정 변경 --- END
+
+    # --- 반복 일정 펼치기 --- START
+    def _occurrences(self, master, window_start, window_end):
+        rule = dict(item.split("=", 1) for item in master["recurrence"][0][len("RRULE:"):].split(";"))
+        step = timedelta(days=int(rule.get("INTERVAL", 1)) * (7 if rule["FREQ"] == "WEEKLY" else 1))
+        count = int(rule["COUNT"]) if "COUNT" in rule else None
+        until = datetime.strptime(rule["UNTIL"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc) if "UNTIL" in rule else None
+        start, end = _parse(master["start"]["dateTime"]), _parse(master["end"]["dateTime"])
+        index = 0
+        while start < window_end:
+            if (count is not None and index >= count) or (until is not None and start > until):
+                break
+            if end > window_start:
+                exception = self.exceptions.get((master["id"], start.isoformat()))
+                if exception is None:
+                    yield {
+                        **{k: v for k, v in master.items() if k != "recurrence"},
+                        "id": f"{master['id']}_{start.strftime('%Y%m%dT%H%M%S')}",
+                        "recurringEventId": master["id"],
+                        "originalStartTime": _event_time(start),
+                        "start": _event_time(start),
+                        "end": _event_time(end),
+                    }
+                elif exception.get("status") != "cancelled":
+                    yield exception
+            start, end, index = start + step, end + step, index + 1
+    # --- 반복 일정 펼치기 --- END
+
+    # --- googleapiclient 호환 인터페이스 --- START
+    def calendars(self):
+        return self
+
+    def events(self):
+        return self
+
+    def new_batch_http_request(self, callback):
+        return _Batch(self, callback)
+
+    def get(self, calendarId):
+        def execute():
+            self.calls["calendars"] += 1
+            return {"id": self.calendar_id, "timeZone": "Asia/Seoul"}
+
+        return _Request(execute)
+
+    def list(self, calendarId, singleEvents=False, maxResults=250, pageToken=None, syncToken=None,
+             showDeleted=False, timeMin=None, timeMax=None, orderBy=None):
+        def execute():
+            self.calls["list"] += 1
+            if syncToken is not None:
+                if self.sync_expired:
+                    raise HttpError(_Resp(410), b"sync token expired")
+                latest = {}
+                for sequence, item in self.changes:
+                    if sequence > int(syncToken):
+                        latest[item["id"]] = item
+                items = list(latest.values())
+            elif singleEvents:
+                window_start = _parse(timeMin) if timeMin else datetime(1970, 1, 1, tzinfo=timezone.utc)
+                window_end = _parse(timeMax) if timeMax else window_start + timedelta(days=3650)
+                items = []
+                for event in self.events_by_id.values():
+                    if event.get("status") == "cancelled":
+                        continue
+                    if "recurrence" in event:
+                        items.extend(self._occurrences(event, window_start, window_end))
+                    elif _parse(event["end"]["dateTime"]) > window_start and _parse(event["start"]["dateTime"]) < window_end:
+                        items.append(event)
+                items.sort(key=lambda item: _parse(item["start"]["dateTime"]))
+            else:
+                items = [event for event in self.events_by_id.values() if showDeleted or event.get("status") != "cancelled"]
+                items += [exception for exception in self.exceptions.values() if showDeleted or exception.get("status") != "cancelled"]
+
+            start = int(pageToken or 0)
+            response = {"items": items[start:start + maxResults]}
+            if start + maxResults < len(items):
+                response["nextPageToken"] = str(start + maxResults)
+            elif not singleEvents or syncToken is not None:
+                response["nextSyncToken"] = str(self.changes[-1][0] if self.changes else 0)
+            return response
+
+        return _Request(execute)
+
+    def instances(self, calendarId, eventId, timeMin=None, timeMax=None, maxResults=250, pageToken=None):
+        def execute():
+            self.calls["instances"] += 1
+            master = self.events_by_id[eventId]
+            items = list(self._occurrences(master, _parse(timeMin), _parse(timeMax)))
+            start = int(pageToken or 0)
+            response = {"items": items[start:start + maxResults]}
+            if start + maxResults < len(items):
+                response["nextPageToken"] = str(start + maxResults)
+            return response
+
+        return _Request(execute)
+
+    def insert(self, calendarId, body):
+        def execute():
+            self.calls["insert"] += 1
+            start = datetime.fromisoformat(body["start"]["dateTime"]).replace(tzinfo=KST)
+            end = datetime.fromisoformat(body["end"]["dateTime"]).replace(tzinfo=KST)
+            event_id = self.add_event(body["summary"], start, hours=(end - start).total_seconds() / 3600)
+            return self.events_by_id[event_id]
+
+        return _Request(execute)
+    # --- googleapiclient 호환 인터페이스 --- END
@@ -0,0 +1,213 @@
+"""
+벤치마크용 가짜 Gmail API 서비스
+
+googleapiclient Gmail 서비스 중 이 저장소가 사용하는 부분(messages.list/get/modify/send, history.list,
+getProfile, batch 요청)만 메모리에서 흉내 내고, API 호출 수를 calls에 기록합니다.
+"""
+import base64
+import itertools
+
+from googleapiclient.errors import HttpError
+
+
+class _Resp(dict):
+    """HttpError에 넘길 최소한의 응답 객체"""
+
+    def __init__(self, status):
+        super().__init__(status=str(status))
+        self.status = status
+        self.reason = "fake error"
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self):
+        return self._fn()
+
+
+class _Batch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id):
+        self._requests.append((request, request_id))
+
+    def execute(self):
+        self._service.calls["batch"] += 1
+        for request, request_id in self._requests:
+            try:
+                self._callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self._callback(request_id, None, e)
+
+
+class _History:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, maxResults=100):
+        service = self._service
+
+        def execute():
+            service.calls["history"] += 1
+            if service.history_expired:
+                raise HttpError(_Resp(404), b"startHistoryId expired")
+            records = [record for history_id, record in service.history_records if history_id > int(startHistoryId)]
+            start = int(pageToken or 0)
+            response = {"historyId": str(service.history_id)}
+            page = records[start:start + maxResults]
+            if page:
+                response["history"] = page
+            if start + maxResults < len(records):
+                response["nextPageToken"] = str(start + maxResults)
+            return response
+
+        return _Request(execute)
+
+
+class FakeGmailService:
+    """
+    메모리 기반 가짜 Gmail 서비스.
+
+    add_message / change_labels / delete_message로 메일함을 바꾸면 history.list에 해당 변경 기록이 쌓입니다.
+    """
+
+    CALL_TYPES = ["profile", "list", "get", "history", "batch", "modify", "send"]
+
+    def __init__(self, message_count=0, email="me@example.com"):
+        self.email = email
+        self.history_id = 1000
+        self.history_records = []  # (historyId, history 레코드)
+        self.history_expired = False  # True이면 history.list가 404 (historyId 만료)
+        self.messages_by_id = {}
+        self._counter = itertools.count()
+        self.calls = {}
+        self.reset_calls()
+        for _ in range(message_count):
+            self.add_message(record_history=False)
+
+    def reset_calls(self):
+        self.calls = {name: 0 for name in self.CALL_TYPES}
+
+    # --- 메일함 변경 --- START
+    def add_message(self, subject=None, sender="sender@example.com", body="", labels=("INBOX", "UNREAD"), record_history=True):
+        number = next(self._counter)
+        message_id = f"m{number:06d}"
+        self.history_id += 1
+        self.messages_by_id[message_id] = {
+            "id": message_id,
+            "threadId": f"t{number:06d}",
+            "labelIds": list(labels),
+            "snippet": body[:100] or f"snippet {number}",
+            "internalDate": str(1_700_000_000_000 + number * 60_000),
+            "historyId": str(self.history_id),
+            "headers": [
+                {"name": "From", "value": sender},
+                {"name": "To", "value": self.email},
+                {"name": "Subject", "value": subject or f"subject {number}"},
+                {"name": "Date", "value": f"Mon, 1 Jan 2024 00:{number % 60:02d}:00 +0000"},
+            ],
+            "body": body,
+        }
+        if record_history:
+            self._record({"messagesAdded": [{"message": self._summary(message_id)}]})
+        return message_id
+
+    def change_labels(self, message_id, add=(), remove=()):
+        message = self.messages_by_id[message_id]
+        message["labelIds"] = [label for label in message["labelIds"] if label not in remove]
+        message["labelIds"] += [label for label in add if label not in message["labelIds"]]
+        self.history_id += 1
+        record = {}
+        if add:
+            record["labelsAdded"] = [{"message": self._summary(message_id), "labelIds": list(add)}]
+        if remove:
+            record["labelsRemoved"] = [{"message": self._summary(message_id), "labelIds": list(remove)}]
+        self._record(record)
+
+    def delete_message(self, message_id):
+        del self.messages_by_id[message_id]
+        self.history_id += 1
+        self._record({"messagesDeleted": [{"message": {"id": message_id}}]})
+
+    def _summary(self, message_id):
+        message = self.messages_by_id[message_id]
+        return {"id": message_id, "threadId": message["threadId"], "labelIds": list(message["labelIds"])}
+
+    def _record(self, record):
+        self.history_records.append((self.history_id, {"id": str(self.history_id), **record}))
+    # --- 메일함 변경 --- END
+
+    # --- googleapiclient 호환 인터페이스 --- START
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return _History(self)
+
+    def new_batch_http_request(self, callback):
+        return _Batch(self, callback)
+
+    def getProfile(self, userId):
+        def execute():
+            self.calls["profile"] += 1
+            return {"emailAddress": self.email, "historyId": str(self.history_id), "messagesTotal": len(self.messages_by_id)}
+
+        return _Request(execute)
+
+    def list(self, userId, labelIds=None, q=None, maxResults=100, pageToken=None, **kwargs):
+        def execute():
+            self.calls["list"] += 1
+            ids = sorted(self.messages_by_id, key=lambda mid: -int(self.messages_by_id[mid]["internalDate"]))
+            if labelIds:
+                ids = [mid for mid in ids if all(label in self.messages_by_id[mid]["labelIds"] for label in labelIds)]
+            start = int(pageToken or 0)
+            response = {
+                "messages": [{"id": mid, "threadId": self.messages_by_id[mid]["threadId"]} for mid in ids[start:start + maxResults]],
+                "resultSizeEstimate": len(ids),
+            }
+            if start + maxResults < len(ids):
+                response["nextPageToken"] = str(start + maxResults)
+            return response
+
+        return _Request(execute)
+
+    def get(self, userId, id, format="full", metadataHeaders=None):
+        def execute():
+            self.calls["get"] += 1
+            if id not in self.messages_by_id:
+                raise HttpError(_Resp(404), b"message not found")
+            message = self.messages_by_id[id]
+            result = {key: message[key] for key in ("id", "threadId", "labelIds", "snippet", "internalDate", "historyId")}
+            headers = message["headers"]
+            if format == "metadata" and metadataHeaders:
+                headers = [header for header in headers if header["name"] in metadataHeaders]
+            result["payload"] = {"mimeType": "text/plain", "headers": headers}
+            if format == "full":
+                result["payload"]["body"] = {"data": base64.urlsafe_b64encode(message["body"].encode("utf-8")).decode("ascii")}
+            return result
+
+        return _Request(execute)
+
+    def modify(self, userId, id, body):
+        def execute():
+            self.calls["modify"] += 1
+            self.change_labels(id, body.get("addLabelIds", []), body.get("removeLabelIds", []))
+            return self._summary(id)
+
+        return _Request(execute)
+
+    def send(self, userId, body):
+        def execute():
+            self.calls["send"] += 1
+            return {"id": self.add_message(labels=("SENT",)), "labelIds": ["SENT"]}
+
+        return _Request(execute)
+    # --- googleapiclient 호환 인터페이스 --- END
@@ -0,0 +1,121 @@
+"""
+벤치마크용 가짜 채팅 모델
+
+마지막 메시지만 보고 응답을 정하는 결정적인 모델입니다.
+- 도구가 바인딩된 상태(에이전트)에서 사용자 메시지에 ROUTES의 키워드가 있으면 해당 도구 호출을 반환합니다.
+- 그 밖에는(도구 결과를 받은 뒤, 인사말 생성 등) answer_words 단어짜리 답변을 반환합니다.
+첫 토큰까지의 지연과 토큰 간격을 설정할 수 있고, 스트리밍(astream)과 토큰 사용량(usage_metadata)을 지원합니다.
+"""
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# (키워드, 도구 이름, 인자) - 인자가 None이면 사용자 메시지 전체를 query로 전달
+ROUTES = [
+    ("예보", "get_weather", {"mode": "forecast"}),
+    ("날씨", "get_weather", {}),
+    ("메일", "list_emails_tool", {"max_results": 10}),
+    ("일정", "list_events_tool", {"max_results": 5}),
+    ("검색", "perplexity_search", None),
+]
+
+_call_ids = itertools.count()
+
+
+class FakeToolCallingChatModel(BaseChatModel):
+    """키워드로 도구를 고르고, 설정한 지연으로 답변을 스트리밍하는 가짜 채팅 모델"""
+
+    first_token_latency: float = 0.2  # 첫 토큰까지의 지연(초)
+    token_interval: float = 0.01  # 토큰 간격(초)
+    answer_words: int = 40  # 답변 단어 수
+    tool_names: List[str] = []  # bind_tools로 바인딩된 도구 이름
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-tool-calling"
+
+    @property
+    def _identifying_params(self):
+        return {"model_name": "fake-solar"}
+
+    def _get_ls_params(self, stop=None, **kwargs):
+        params = super()._get_ls_params(stop=stop, **kwargs)
+        params["ls_model_name"] = "fake-solar"
+        return params
+
+    def bind_tools(self, tools, **kwargs):
+        names = [tool if isinstance(tool, str) else getattr(tool, "name", None) or tool["name"] for tool in tools]
+        return self.model_copy(update={"tool_names": names})
+
+    # --- 응답 결정 --- START
+    def _plan(self, messages):
+        """(도구 호출 또는 None, 답변 단어 목록)"""
+        last = messages[-1]
+        if isinstance(last, HumanMessage) and self.tool_names:
+            text = last.content if isinstance(last.content, str) else str(last.content)
+            for keyword, tool_name, args in ROUTES:
+                if keyword in text and tool_name in self.tool_names:
+                    call = {
+                        "name": tool_name,
+                        "args": {"query": text} if args is None else dict(args),
+                        "id": f"call_{next(_call_ids)}",
+                    }
+                    return call, []
+        return None, [f"답변{i}" for i in range(self.answer_words)]
+
+    @staticmethod
+    def _usage(messages, output_tokens):
+        # 글자 수 기반의 결정적인 근사치 (토크나이저 없이)
+        input_tokens = sum(len(str(message.content)) // 2 + 4 for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _message(self, messages):
+        call, words = self._plan(messages)
+        if call is not None:
+            return AIMessage(content="", tool_calls=[call], usage_metadata=self._usage(messages, 10)), 1
+        return AIMessage(content=" ".join(words), usage_metadata=self._usage(messages, len(words))), len(words)
+
+    def _chunks(self, messages):
+        call, words = self._plan(messages)
+        if call is not None:
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[{"name": call["name"], "args": json.dumps(call["args"], ensure_ascii=False), "id": call["id"], "index": 0}],
+                usage_metadata=self._usage(messages, 10),
+            )
+            return
+        for index, word in enumerate(words):
+            last = index == len(words) - 1
+            yield AIMessageChunk(
+                content=word if index == 0 else " " + word,
+                usage_metadata=self._usage(messages, len(words)) if last else None,
+            )
+    # --- 응답 결정 --- END
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message, tokens = self._message(messages)
+        time.sleep(self.first_token_latency + self.token_interval * tokens)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        message, tokens = self._message(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_interval * tokens)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        time.sleep(self.first_token_latency)
+        for chunk in self._chunks(messages):
+            yield ChatGenerationChunk(message=chunk)
+            time.sleep(self.token_interval)
+
+    async def _astream(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self.first_token_latency)
+        for chunk in self._chunks(messages):
+            yield ChatGenerationChunk(message=chunk)
+            await asyncio.sleep(self.token_interval)
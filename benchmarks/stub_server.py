@@ -0,0 +1,105 @@
+"""
+벤치마크용 로컬 스텁 HTTP 서버
+
+응답 지연 시간을 설정할 수 있는 다음 API를 제공합니다.
+- POST /chat/completions: Perplexity 호환 API (stream: true 이면 SSE로 응답)
+- GET /json: ipinfo.io 호환 IP 위치 조회
+- GET /data/2.5/weather, /data/2.5/forecast: OpenWeatherMap 호환 현재 날씨 / 5일(3시간 간격) 예보
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive 지원
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.server.request_count += 1
+        path = self.path.split("?", 1)[0]
+        if path == "/json":
+            self._send_json({"ip": "127.0.0.1", "city": "Seoul", "country": "KR", "loc": "37.5665,126.9780"})
+        elif path == "/data/2.5/weather":
+            self._send_json({"name": "Seoul", "weather": [{"description": "맑음"}], "main": {"temp": 21.5}})
+        elif path == "/data/2.5/forecast":
+            # 고정 시각부터 3시간 간격 40개 (결과가 실행 시각과 무관하도록)
+            entries = [
+                {
+                    "dt": 1767225600 + i * 10800,
+                    "main": {"temp": 15.0 + (i % 8)},
+                    "weather": [{"description": "맑음" if i % 3 else "구름 조금"}],
+                }
+                for i in range(40)
+            ]
+            self._send_json({"city": {"name": "Seoul", "timezone": 32400}, "list": entries})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.latency)
+        self.server.request_count += 1
+        question = request.get("messages", [{}])[-1].get("content", "")
+        answer = f"stub answer: {question}"
+        if request.get("stream"):
+            self._send_stream(answer)
+            return
+        # 스트리밍이 아니면 답변 전체가 생성될 때까지 기다린 뒤 한 번에 응답
+        time.sleep(self.server.token_interval * len(answer.split(" ")))
+        self._send_json({
+            "choices": [{"message": {"role": "assistant", "content": answer}}]
+        })
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, answer):
+        """stream: true 요청에 단어 단위 SSE 청크로 응답 (청크 사이 간격: server.token_interval)"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ")
+        for index, word in enumerate(words):
+            delta = word if index == 0 else " " + word
+            event = {"choices": [{"delta": {"role": "assistant", "content": delta}}]}
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+            time.sleep(self.server.token_interval)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 동시 연결 시 listen backlog 부족으로 인한 재전송 지연 방지
+
+
+def start_stub_server(latency=0.2, host="127.0.0.1", port=0, token_interval=0.02):
+    """
+    스텁 서버를 백그라운드 스레드에서 시작합니다.
+    latency는 첫 응답까지의 지연, token_interval은 스트리밍 응답의 청크 간격(초)입니다.
+
+    Returns:
+        (server, base_url): server.shutdown()으로 종료
+    """
+    server = StubServer((host, port), StubHandler)
+    server.latency = latency
+    server.token_interval = token_interval
+    server.request_count = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,165 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+
+def build_briefing_prompt(interests: str) -> str:
+    """관심 분야 브리핑용 검색 질의를 만듭니다."""
+    return f"Summarize the latest developments and key information about: {interests}. Provide a concise overview suitable for a briefing."
+
+
+class BriefingStore:
+    """
+    관심 분야 브리핑과 브리핑 작업 기록을 저장하는 SQLite 저장소.
+    Streamlit 스크립트 스레드와 스케줄러(공유 이벤트 루프 스레드)에서 함께 사용하므로 연결 하나를 잠금으로 보호합니다.
+    """
+
+    def __init__(self, db_path="briefings.sqlite3", max_jobs=500):
+        """
+        Args:
+            db_path: SQLite 파일 경로
+            max_jobs: 보관할 최대 작업 기록 수
+        """
+        self.db_path = db_path
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS briefings (
+                    interests TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    duration_seconds REAL,
+                    source TEXT
+                );
+                CREATE TABLE IF NOT EXISTS briefing_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    interests TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    started_at REAL NOT NULL,
+                    duration_seconds REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT
+                );
+                """
+            )
+            self._db.commit()
+
+    def get_latest(self, interests):
+        """
+        관심 분야의 최신 브리핑을 반환합니다.
+
+        Returns:
+            dict | None: {"interests", "content", "created_at", "duration_seconds", "source"}
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM briefings WHERE interests = ?", (interests,)).fetchone()
+        return dict(row) if row else None
+
+    def save_briefing(self, interests, content, duration_seconds=None, source="scheduled"):
+        """관심 분야의 최신 브리핑을 저장합니다. (이전 브리핑은 덮어씀)"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO briefings (interests, content, created_at, duration_seconds, source) VALUES (?, ?, ?, ?, ?)",
+                (interests, content, time.time(), duration_seconds, source),
+            )
+            self._db.commit()
+
+    def log_job(self, interests, source, started_at, duration_seconds, error=None):
+        """브리핑 작업 한 건의 소요 시간과 성공/실패 여부를 기록합니다."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO briefing_jobs (interests, source, started_at, duration_seconds, status, error) VALUES (?, ?, ?, ?, ?, ?)",
+                (interests, source, started_at, duration_seconds, "error" if error else "ok", error),
+            )
+            self._db.execute(
+                "DELETE FROM briefing_jobs WHERE id NOT IN (SELECT id FROM briefing_jobs ORDER BY id DESC LIMIT ?)",
+                (self.max_jobs,),
+            )
+            self._db.commit()
+
+    def recent_jobs(self, limit=20):
+        """최근 작업 기록을 최신순으로 반환합니다."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM briefing_jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+
+class BriefingScheduler:
+    """
+    관심 분야 브리핑을 주기적으로 미리 생성해 BriefingStore에 저장하는 asyncio 작업.
+    Streamlit 스크립트 실행과 무관하게 공유 이벤트 루프(MCPClientPool)에서 돌아갑니다.
+    """
+
+    def __init__(self, store, search, interests_loader, interval=3600.0, check_interval=60.0, retry_interval=300.0):
+        """
+        Args:
+            store: BriefingStore
+            search: 검색 질의를 받아 응답 문자열을 반환하는 코루틴 함수 (예: ask_perplexity_async)
+            interests_loader: 현재 저장된 관심 분야 문자열을 반환하는 함수
+            interval: 브리핑 재생성 주기(초)
+            check_interval: 관심 분야 변경/재생성 시점을 확인하는 주기(초)
+            retry_interval: 생성 실패 후 다시 시도하기까지 기다리는 시간(초)
+        """
+        self.store = store
+        self.search = search
+        self.interests_loader = interests_loader
+        self.interval = interval
+        self.check_interval = min(check_interval, interval)
+        self.retry_interval = retry_interval
+        self._last_failure = {}  # interests -> 마지막 실패 시각
+
+    async def run_forever(self):
+        """스케줄러 루프. (mcp_pool.submit으로 공유 이벤트 루프에서 실행)"""
+        print(f"DEBUG (BriefingScheduler): started (interval={self.interval:.0f}s)")
+        while True:
+            try:
+                await self.run_pending()
+            except Exception as e:
+                print(f"ERROR (BriefingScheduler): {e}")
+            await asyncio.sleep(self.check_interval)
+
+    async def run_pending(self):
+        """관심 분야의 브리핑이 없거나 interval보다 오래되었으면 새로 생성합니다."""
+        interests = self.interests_loader()
+        if not interests:
+            return
+        latest = self.store.get_latest(interests)
+        now = time.time()
+        if latest and now - latest["created_at"] < self.interval:
+            return
+        if now - self._last_failure.get(interests, 0) < self.retry_interval:
+            return
+        if await self.generate(interests) is None:
+            self._last_failure[interests] = time.time()
+        else:
+            self._last_failure.pop(interests, None)
+
+    async def generate(self, interests, source="scheduled"):
+        """
+        브리핑을 생성해 저장하고 작업 기록을 남깁니다.
+
+        Returns:
+            str | None: 생성된 브리핑 (실패 시 None)
+        """
+        started_at = time.time()
+        started = time.perf_counter()
+        error = None
+        content = None
+        try:
+            content = await self.search(build_briefing_prompt(interests), use_cache=False)
+            if content.startswith("❌"):
+                error, content = content, None
+        except Exception as e:
+            error = str(e)
+        duration = time.perf_counter() - started
+
+        if content:
+            self.store.save_briefing(interests, content, duration, source)
+        self.store.log_job(interests, source, started_at, duration, error)
+        print(f"DEBUG (BriefingScheduler): {source} briefing for '{interests}' {'failed' if error else 'done'} in {duration:.2f}s")
+        return content
@@ -0,0 +1,188 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+_caches = weakref.WeakSet()  # 생성된 TTLCache (지표 수집용)
+
+
+def normalize_text(text: str) -> str:
+    """캐시 키용 정규화: 앞뒤 공백 제거, 연속 공백을 하나로, 대소문자 무시"""
+    return " ".join(str(text).split()).casefold()
+
+
+def all_caches():
+    """이 프로세스에서 만들어진(아직 살아 있는) TTLCache 목록을 이름순으로 반환합니다."""
+    return sorted(list(_caches), key=lambda cache: cache.name)
+
+
+class TTLCache:
+    """
+    LRU 제거와 항목별 TTL을 지원하는 스레드 안전 캐시.
+
+    - 메모리에는 최대 maxsize개 항목을 두고, 넘치면 가장 오래 사용하지 않은 항목부터 제거합니다.
+    - 항목마다 만료 시각을 가지며, 만료된 항목은 조회 시 제거됩니다.
+    - db_path를 주면 SQLite 파일에도 저장해 프로세스를 다시 시작해도 캐시가 유지됩니다.
+      (값은 JSON으로 직렬화하므로 JSON으로 표현 가능한 값만 저장할 수 있습니다.)
+    """
+
+    def __init__(self, maxsize=256, ttl=1800.0, db_path=None, name="cache"):
+        """
+        Args:
+            maxsize: 메모리(및 SQLite)에 보관할 최대 항목 수
+            ttl: 기본 유효 시간(초)
+            db_path: SQLite 파일 경로 (None이면 메모리에만 저장)
+            name: 로그와 SQLite 테이블 구분용 이름
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0, "expirations": 0}
+        self._db = None
+        self._table = "cache_" + "".join(ch if ch.isalnum() else "_" for ch in name)
+        if db_path:
+            self._open_db(db_path)
+        _caches.add(self)
+
+    # --- SQLite 저장소 --- START
+    def _open_db(self, db_path):
+        try:
+            directory = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"ERROR ({self.name}): SQLite 캐시를 열 수 없어 메모리 캐시만 사용합니다: {e}", file=sys.stderr)
+            self._db = None
+
+    def _db_get(self, key, now):
+        try:
+            row = self._db.execute(
+                f"SELECT value, expires_at FROM {self._table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(f"UPDATE {self._table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return row[1], json.loads(row[0])
+        except (sqlite3.Error, ValueError) as e:
+            print(f"ERROR ({self.name}): SQLite 캐시 조회 실패: {e}", file=sys.stderr)
+            return None
+
+    def _db_set(self, key, value, expires_at, now):
+        try:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self._table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at, now),
+            )
+            # 만료 항목 정리 후 maxsize를 넘는 항목은 오래 사용하지 않은 순서로 제거
+            self._db.execute(f"DELETE FROM {self._table} WHERE expires_at <= ?", (now,))
+            self._db.execute(
+                f"DELETE FROM {self._table} WHERE key NOT IN "
+                f"(SELECT key FROM {self._table} ORDER BY accessed_at DESC LIMIT ?)",
+                (self.maxsize,),
+            )
+            self._db.commit()
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"ERROR ({self.name}): SQLite 캐시 저장 실패: {e}", file=sys.stderr)
+    # --- SQLite 저장소 --- END
+
+    def get(self, key, default=None):
+        """캐시된 값을 반환합니다. 없거나 만료되었으면 default를 반환합니다."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._data.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1]
+                del self._data[key]
+                self._stats["expirations"] += 1
+
+            if self._db is not None:
+                entry = self._db_get(key, now)
+                if entry is not None:
+                    self._store(key, entry)
+                    self._stats["hits"] += 1
+                    self._stats["disk_hits"] += 1
+                    return entry[1]
+
+            self._stats["misses"] += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """
+        값을 캐시에 저장합니다.
+
+        Args:
+            key: 캐시 키 (문자열)
+            value: 저장할 값
+            ttl: 이 항목의 유효 시간(초) (기본값: 캐시의 ttl)
+        """
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store(key, (expires_at, value))
+            if self._db is not None:
+                self._db_set(key, value, expires_at, now)
+
+    def _store(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def delete(self, key):
+        """캐시 항목을 제거합니다."""
+        with self._lock:
+            self._data.pop(key, None)
+            if self._db is not None:
+                try:
+                    self._db.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"ERROR ({self.name}): SQLite 캐시 삭제 실패: {e}", file=sys.stderr)
+
+    def clear(self):
+        """모든 캐시 항목을 제거합니다. (통계는 유지)"""
+        with self._lock:
+            self._data.clear()
+            if self._db is not None:
+                try:
+                    self._db.execute(f"DELETE FROM {self._table}")
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"ERROR ({self.name}): SQLite 캐시 초기화 실패: {e}", file=sys.stderr)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """캐시 적중 통계를 반환합니다. (hit_ratio는 조회가 없으면 None)"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "persistent": self._db is not None,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else None,
+            }
@@ -1,14 +1,550 @@
+import json
 import os
-from datetime import datetime, timedelta
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
 from googleapiclient.errors import HttpError
 
+load_dotenv()
+
+# 로컬 일정 저장소 설정
+# 일정을 SQLite에 저장하고 이후에는 syncToken으로 변경분만 가져온다. 반복 일정은 조회 구간만큼 instances로 펼쳐 저장한다.
+STORE_ENABLED = os.getenv("CALENDAR_STORE_ENABLED", "true").lower() == "true"
+STORE_PATH = os.getenv("CALENDAR_STORE_PATH", "calendar_store.sqlite3")
+SYNC_INTERVAL = float(os.getenv("CALENDAR_SYNC_INTERVAL", "30"))  # 이 시간(초) 안에는 다시 동기화하지 않음
+EXPANSION_DAYS = int(os.getenv("CALENDAR_EXPANSION_DAYS", "90"))  # 반복 일정을 기본으로 펼쳐 두는 기간
+MAX_HORIZON_DAYS = int(os.getenv("CALENDAR_MAX_HORIZON_DAYS", "365"))  # 로컬에서 답할 최대 기간 (넘으면 API 조회)
+BATCH_SIZE = 50  # 한 번의 batch 요청에 담을 최대 요청 수
+MAX_PAGE_SIZE = 2500  # events.list 한 페이지의 최대 크기 (Calendar API 제한)
+
+def _parse_event_time(value):
+    """일정의 start/end 값을 (epoch 초, 종일 여부)로 변환합니다. (종일 일정은 로컬 자정 기준)"""
+    if 'dateTime' in value:
+        return datetime.fromisoformat(value['dateTime'].replace('Z', '+00:00')).timestamp(), False
+    return datetime.fromisoformat(value['date']).timestamp(), True
+
+def _to_rfc3339(timestamp):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def _parse_rfc3339(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+def _recurrence_until(event):
+    """RRULE의 UNTIL 값을 epoch 초로 반환합니다. (없으면 None)"""
+    for rule in event.get('recurrence', []):
+        if not rule.startswith('RRULE:'):
+            continue
+        for item in rule[len('RRULE:'):].split(';'):
+            if item.startswith('UNTIL='):
+                value = item[len('UNTIL='):]
+                try:
+                    if 'T' in value:
+                        return datetime.strptime(value.rstrip('Z'), '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc).timestamp()
+                    return datetime.strptime(value, '%Y%m%d').timestamp() + 86400
+                except ValueError:
+                    return None
+    return None
+
+
+class EventStore:
+    """
+    기본 캘린더(primary)의 일정을 저장하는 로컬 SQLite 저장소.
+
+    - events: 단일 일정과 반복 일정의 원본(master). 반복 일정의 예외(수정된 회차)는 저장하지 않고 instances 조회에 맡깁니다.
+    - instances: 반복 일정을 펼친 회차 (expansions에 펼친 구간 기록)
+    - sync_state: nextSyncToken, 계정 정보, 마지막 동기화 시각
+    """
+
+    def __init__(self, db_path=STORE_PATH):
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.service_id = None  # 마지막으로 계정을 확인한 서비스 객체 id
+        self.sync_thread = None  # 진행 중인 백그라운드 전체 동기화 스레드
+        self.stats = {
+            'full_syncs': 0,
+            'incremental_syncs': 0,
+            'changed_events': 0,
+            'expansions': 0,
+            'local_queries': 0,
+            'remote_queries': 0,
+        }
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS events (
+                    id TEXT PRIMARY KEY,
+                    recurring INTEGER NOT NULL,
+                    start_ts REAL,
+                    end_ts REAL,
+                    until_ts REAL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_start ON events (recurring, start_ts);
+                CREATE TABLE IF NOT EXISTS instances (
+                    id TEXT PRIMARY KEY,
+                    master_id TEXT NOT NULL,
+                    start_ts REAL,
+                    end_ts REAL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_instances_start ON instances (start_ts);
+                CREATE INDEX IF NOT EXISTS idx_instances_master ON instances (master_id);
+                CREATE TABLE IF NOT EXISTS expansions (
+                    master_id TEXT PRIMARY KEY,
+                    window_start REAL NOT NULL,
+                    window_end REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+            self._db.commit()
+
+    # --- 동기화 상태 --- START
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, **values):
+        with self.lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                [(key, None if value is None else str(value)) for key, value in values.items()],
+            )
+            self._db.commit()
+    # --- 동기화 상태 --- END
+
+    # --- 일정 저장 --- START
+    def clear(self):
+        """모든 일정과 동기화 상태를 삭제합니다."""
+        with self.lock:
+            self._db.executescript(
+                "DELETE FROM events; DELETE FROM instances; DELETE FROM expansions; DELETE FROM sync_state;"
+            )
+            self._db.commit()
+
+    def apply_changes(self, items):
+        """
+        events.list 결과(전체 또는 syncToken 변경분)를 반영합니다.
+
+        - 취소된 일정은 삭제하고, 반복 일정이면 펼친 회차도 삭제
+        - 반복 일정의 예외(recurringEventId가 있는 항목)는 해당 반복 일정의 펼친 구간을 무효화
+        """
+        with self.lock:
+            for item in items:
+                master_id = item.get('recurringEventId')
+                if master_id:
+                    self._invalidate_expansion(master_id)
+                    continue
+                if item.get('status') == 'cancelled':
+                    self._db.execute("DELETE FROM events WHERE id = ?", (item['id'],))
+                    self._invalidate_expansion(item['id'])
+                    continue
+                self.upsert_event(item, commit=False)
+            self._db.commit()
+
+    def upsert_event(self, event, commit=True):
+        """단일 일정 또는 반복 일정 원본을 저장합니다. (반복 일정이면 펼친 구간 무효화)"""
+        with self.lock:
+            start_ts, _ = _parse_event_time(event['start'])
+            end_ts, _ = _parse_event_time(event['end'])
+            recurring = 1 if event.get('recurrence') else 0
+            self._db.execute(
+                "INSERT OR REPLACE INTO events (id, recurring, start_ts, end_ts, until_ts, data) VALUES (?, ?, ?, ?, ?, ?)",
+                (event['id'], recurring, start_ts, end_ts, _recurrence_until(event), json.dumps(event, ensure_ascii=False)),
+            )
+            if recurring:
+                self._invalidate_expansion(event['id'])
+            if commit:
+                self._db.commit()
+
+    def _invalidate_expansion(self, master_id):
+        self._db.execute("DELETE FROM instances WHERE master_id = ?", (master_id,))
+        self._db.execute("DELETE FROM expansions WHERE master_id = ?", (master_id,))
+
+    def masters_to_expand(self, window_start, window_end):
+        """
+        [window_start, window_end) 구간이 아직 펼쳐지지 않은 반복 일정 목록을 반환합니다.
+        이미 펼친 구간이 요청 구간 시작을 덮고 있으면 그 뒤의 모자란 부분만, 아니면 요청 구간 전체를 조회하도록 합니다.
+
+        Returns:
+            list: (master_id, 조회 시작) 목록 (조회 끝은 window_end)
+        """
+        with self.lock:
+            rows = self._db.execute(
+                "SELECT e.id, x.window_start, x.window_end FROM events e "
+                "LEFT JOIN expansions x ON x.master_id = e.id "
+                "WHERE e.recurring = 1 AND e.start_ts < ? AND (e.until_ts IS NULL OR e.until_ts > ?)",
+                (window_end, window_start),
+            ).fetchall()
+        result = []
+        for master_id, expanded_start, expanded_end in rows:
+            if expanded_start is None or expanded_start > window_start or expanded_end < window_start:
+                result.append((master_id, window_start))
+            elif expanded_end < window_end:
+                result.append((master_id, expanded_end))
+        return result
+
+    def set_instances(self, master_id, window_start, window_end, instances, fetch_start=None):
+        """
+        반복 일정의 [fetch_start, window_end) 회차를 교체하고 펼친 구간을 [window_start, window_end)로 기록합니다.
+        window_start 전에 끝난 회차는 지워서, 날마다 구간이 뒤로 밀려도 저장된 회차가 계속 늘어나지 않게 합니다.
+        (fetch_start를 생략하면 구간 전체를 교체)
+        """
+        fetch_start = window_start if fetch_start is None else fetch_start
+        with self.lock:
+            # 조회 결과에는 fetch_start 이후에 끝나는 회차가 모두 포함되므로 그 회차들은 새 결과로 교체
+            self._db.execute(
+                "DELETE FROM instances WHERE master_id = ? AND (end_ts <= ? OR end_ts > ?)",
+                (master_id, window_start, fetch_start),
+            )
+            rows = []
+            for instance in instances:
+                if instance.get('status') == 'cancelled':
+                    continue
+                start_ts, _ = _parse_event_time(instance['start'])
+                end_ts, _ = _parse_event_time(instance['end'])
+                rows.append((instance['id'], master_id, start_ts, end_ts, json.dumps(instance, ensure_ascii=False)))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO instances (id, master_id, start_ts, end_ts, data) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO expansions (master_id, window_start, window_end) VALUES (?, ?, ?)",
+                (master_id, window_start, window_end),
+            )
+            self._db.commit()
+    # --- 일정 저장 --- END
+
+    def has_recurring_after(self, timestamp):
+        """timestamp 이후에도 회차가 남아 있을 수 있는 반복 일정이 있는지 확인합니다."""
+        with self.lock:
+            row = self._db.execute(
+                "SELECT 1 FROM events WHERE recurring = 1 AND (until_ts IS NULL OR until_ts > ?) LIMIT 1", (timestamp,)
+            ).fetchone()
+        return row is not None
+
+    def counts(self):
+        """저장된 일정/회차/펼친 반복 일정 수를 반환합니다."""
+        with self.lock:
+            return {
+                table: self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ('events', 'instances', 'expansions')
+            }
+
+    def query(self, time_min, time_max, max_results=None, offset=0):
+        """
+        [time_min, time_max) 구간과 겹치는 일정(단일 일정 + 펼친 반복 회차)을 시작 시간순으로 반환합니다.
+        (Google Calendar의 timeMin과 같이 종료 시간이 time_min 이후인 일정을 포함, offset은 건너뛸 일정 수)
+        """
+        sql = (
+            "SELECT data, start_ts FROM events WHERE recurring = 0 AND end_ts > ? AND start_ts < ? "
+            "UNION ALL "
+            "SELECT data, start_ts FROM instances WHERE end_ts > ? AND start_ts < ? "
+            "ORDER BY start_ts"
+        )
+        params = [time_min, time_max, time_min, time_max]
+        if max_results is not None or offset:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([-1 if max_results is None else max_results, offset])
+        with self.lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+
+_event_stores = {}
+_event_stores_lock = threading.Lock()
+
+def get_event_store(db_path=None):
+    """프로세스에서 공유하는 EventStore를 반환합니다. (저장소를 사용하지 않으면 None)"""
+    if not STORE_ENABLED:
+        return None
+    db_path = db_path or STORE_PATH
+    with _event_stores_lock:
+        if db_path not in _event_stores:
+            _event_stores[db_path] = EventStore(db_path)
+        return _event_stores[db_path]
+
+def _list_all_events(service, sync_token=None):
+    """
+    events.list를 끝까지 페이지 조회합니다. (반복 일정은 펼치지 않음)
+
+    Returns:
+        (items, next_sync_token)
+    """
+    items, page_token = [], None
+    while True:
+        params = {'calendarId': 'primary', 'singleEvents': False, 'maxResults': 2500, 'pageToken': page_token}
+        if sync_token:
+            params['syncToken'] = sync_token  # 변경분 조회 (삭제된 일정도 cancelled로 포함됨)
+        else:
+            params['showDeleted'] = False
+        response = service.events().list(**params).execute()
+        items.extend(response.get('items', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return items, response.get('nextSyncToken')
+
+def _full_sync(service, store):
+    """전체 일정을 다시 가져와 저장소를 새로 만듭니다. (API 조회는 잠금 밖에서 하고 저장만 잠금 안에서 함)"""
+    items, next_token = _list_all_events(service)
+    with store.lock:
+        calendar_id = store.get_state('calendar_id')
+        store.clear()
+        store.apply_changes(items)
+        store.set_state(calendar_id=calendar_id, sync_token=next_token, last_sync_at=time.time())
+    store.stats['full_syncs'] += 1
+    print(f"DEBUG (calendar_utils): full sync stored {len(items)} events", file=sys.stderr)
+
+def _background_full_sync(service, store):
+    try:
+        _full_sync(service, store)
+    except Exception as error:
+        print(f'캘린더 일정 백그라운드 동기화 중 오류 발생: {error}', file=sys.stderr)
+
+def _start_background_sync(service, store):
+    """전체 동기화를 백그라운드 스레드에서 시작합니다. (이미 진행 중이면 그대로 둠)"""
+    with _event_stores_lock:
+        if store.sync_thread is None or not store.sync_thread.is_alive():
+            store.sync_thread = threading.Thread(
+                target=_background_full_sync, args=(service, store), name="calendar-store-sync", daemon=True
+            )
+            store.sync_thread.start()
+
+def sync_events(service, store=None, force=False, background=False):
+    """
+    로컬 일정 저장소를 Google 캘린더와 동기화합니다.
+    처음에는 전체 일정을 가져오고, 이후에는 syncToken으로 변경분만 가져옵니다. (syncToken 만료(410) 시 전체 동기화)
+    
+    Args:
+        service: 구글 캘린더 API 서비스 객체
+        store: EventStore (기본값: get_event_store())
+        force: True이면 SYNC_INTERVAL과 관계없이 동기화
+        background: True이면 전체 동기화(최초 또는 syncToken 만료 시)를 백그라운드 스레드에서 시작하고 기다리지 않음
+            (일정 조회 도구는 이 값으로 호출해, 저장소가 준비될 때까지 Calendar API 결과를 사용)
+        
+    Returns:
+        bool: 저장소를 사용할 수 있으면 True (동기화 실패, 전체 동기화 진행 중 또는 저장소 비활성화 시 False)
+    """
+    store = store or get_event_store()
+    if store is None:
+        return False
+    sync_thread = store.sync_thread
+    if sync_thread is not None and sync_thread.is_alive():
+        if background:
+            return False
+        sync_thread.join()
+
+    with store.lock:
+        try:
+            # 인증 정보가 바뀌어 서비스 객체가 새로 만들어지면 계정이 같은지 한 번 확인
+            if store.service_id != id(service):
+                calendar_id = service.calendars().get(calendarId='primary').execute().get('id')
+                if calendar_id != store.get_state('calendar_id'):
+                    store.clear()
+                    store.set_state(calendar_id=calendar_id)
+                store.service_id = id(service)
+
+            sync_token = store.get_state('sync_token')
+            last_sync_at = float(store.get_state('last_sync_at', 0) or 0)
+            if sync_token and not force and time.time() - last_sync_at < SYNC_INTERVAL:
+                return True
+
+            if sync_token:
+                try:
+                    items, next_token = _list_all_events(service, sync_token)
+                    store.apply_changes(items)
+                    store.set_state(sync_token=next_token, last_sync_at=time.time())
+                    store.stats['incremental_syncs'] += 1
+                    store.stats['changed_events'] += len(items)
+                    if items:
+                        print(f"DEBUG (calendar_utils): incremental sync applied {len(items)} changed events", file=sys.stderr)
+                    return True
+                except HttpError as error:
+                    if getattr(error, 'resp', None) is None or error.resp.status != 410:
+                        raise
+                    print("DEBUG (calendar_utils): syncToken expired, falling back to full sync", file=sys.stderr)
+
+            if background:
+                _start_background_sync(service, store)
+                return False
+            _full_sync(service, store)
+            return True
+        except HttpError as error:
+            print(f'캘린더 일정 동기화 중 오류 발생: {error}', file=sys.stderr)
+            return False
+
+def _expand_recurring(service, store, window_start, window_end):
+    """구간 안의 반복 일정 회차를 events.instances batch 요청으로 펼쳐 저장합니다."""
+    # 조회 시각(now)이 조금씩 움직여도 이미 펼친 구간을 재사용하도록 하루 단위로 맞춤
+    window_start = window_start // 86400 * 86400
+    window_end = -(-window_end // 86400) * 86400
+    pending = store.masters_to_expand(window_start, window_end)
+    for start in range(0, len(pending), BATCH_SIZE):
+        chunk = pending[start:start + BATCH_SIZE]
+        responses = {}
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                print(f'반복 일정 조회 중 오류 발생 (ID: {chunk[int(request_id)][0]}): {exception}', file=sys.stderr)
+                return
+            responses[int(request_id)] = response
+
+        batch = service.new_batch_http_request(callback=callback)
+        for index, (master_id, fetch_start) in enumerate(chunk):
+            batch.add(service.events().instances(
+                calendarId='primary', eventId=master_id,
+                timeMin=_to_rfc3339(fetch_start), timeMax=_to_rfc3339(window_end), maxResults=2500
+            ), request_id=str(index))
+        batch.execute()
+
+        for index, response in responses.items():
+            master_id, fetch_start = chunk[index]
+            instances = response.get('items', [])
+            page_token = response.get('nextPageToken')
+            while page_token:
+                page = service.events().instances(
+                    calendarId='primary', eventId=master_id,
+                    timeMin=_to_rfc3339(fetch_start), timeMax=_to_rfc3339(window_end),
+                    maxResults=2500, pageToken=page_token
+                ).execute()
+                instances.extend(page.get('items', []))
+                page_token = page.get('nextPageToken')
+            store.set_instances(master_id, window_start, window_end, instances, fetch_start)
+            store.stats['expansions'] += 1
+
+def _list_upcoming_local(service, store, time_min, max_results, offset=0):
+    """
+    다가오는 일정 N개를 로컬 저장소에서 찾습니다. (offset개는 건너뜀)
+    반복 일정은 EXPANSION_DAYS 구간부터 펼치고, 결과가 모자라면 MAX_HORIZON_DAYS까지 구간을 두 배씩 넓힙니다.
+    (그래도 모자라면 단일 일정은 기간 제한 없이 찾고, 그 뒤에도 회차가 남은 반복 일정이 있을 때만 None을 반환해 API로 조회)
+    """
+    start_ts = _parse_rfc3339(time_min)
+    days = EXPANSION_DAYS
+    while True:
+        window_end = start_ts + days * 86400
+        _expand_recurring(service, store, start_ts, window_end)
+        events = store.query(start_ts, window_end, max_results, offset)
+        if len(events) >= max_results:
+            return events
+        if days >= MAX_HORIZON_DAYS:
+            if store.has_recurring_after(window_end):
+                return None
+            return store.query(start_ts, float('inf'), max_results, offset)
+        days = min(days * 2, MAX_HORIZON_DAYS)
+
+# --- 페이지 단위 조회 --- START
+def _list_event_page(service, time_min, page_size, page_token=None):
+    """
+    events.list 한 페이지(반복 일정은 회차로 펼친 시작 시간순)를 조회합니다.
+
+    Returns:
+        (events, next_page_token)
+    """
+    events_result = service.events().list(
+        calendarId='primary',
+        timeMin=time_min,
+        maxResults=min(page_size, MAX_PAGE_SIZE),
+        singleEvents=True,
+        orderBy='startTime',
+        pageToken=page_token
+    ).execute()
+    return events_result.get('items', []), events_result.get('nextPageToken')
+
+def iter_events(service, time_min=None, page_size=250, limit=None):
+    """
+    다가오는 일정을 페이지를 넘겨 가며 하나씩 반환하는 제너레이터.
+    다음 페이지는 필요할 때만 조회하므로 메모리에는 한 페이지만 유지됩니다.
+
+    Args:
+        service: 구글 캘린더 API 서비스 객체
+        time_min: 조회 시작 시간 (기본값: 현재 시간)
+        page_size: 한 번에 조회할 페이지 크기 (최대 2500)
+        limit: 최대 일정 수 (선택, 없으면 끝까지)
+
+    Yields:
+        event: 일정
+    """
+    if time_min is None:
+        time_min = datetime.utcnow().isoformat() + 'Z'
+    remaining = limit
+    page_token = None
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        events, page_token = _list_event_page(service, time_min, size, page_token)
+        for event in events:
+            yield event
+        if remaining is not None:
+            remaining -= len(events)
+        if not page_token or not events:
+            return
+
+def list_events_page(service, page_size=10, page_token=None):
+    """
+    다가오는 일정의 한 페이지를 조회합니다. (MCP 도구의 커서 기반 페이지 조회용)
+    동기화된 로컬 저장소로 답할 수 있으면 저장소에서, 그렇지 않으면 Calendar API에서 조회합니다.
+
+    Args:
+        service: 구글 캘린더 API 서비스 객체
+        page_size: 페이지 크기 (최대 2500)
+        page_token: 이전 페이지가 반환한 커서 (첫 페이지는 None)
+
+    Returns:
+        (events, next_page_token): 일정 목록과 다음 페이지 커서 (마지막 페이지는 None)
+        커서는 "<조회 시작 시간>|o:<offset>"(로컬 저장소 위치) 또는 "<조회 시작 시간>|<Calendar pageToken>"입니다.
+        (페이지를 넘기는 동안 조회 시작 시간을 고정해 같은 목록을 이어서 보도록 함)
+    """
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    if page_token:
+        time_min, _, position = page_token.partition('|')
+    else:
+        time_min, position = datetime.utcnow().isoformat() + 'Z', ''
+
+    try:
+        if position and not position.startswith('o:'):
+            events, next_token = _list_event_page(service, time_min, page_size, position)
+            return events, f"{time_min}|{next_token}" if next_token else None
+
+        offset = int(position[2:]) if position else 0
+        store = get_event_store()
+        if store is not None and sync_events(service, store, background=True):
+            # 한 건 더 읽어 다음 페이지가 있는지 확인
+            events = _list_upcoming_local(service, store, time_min, page_size + 1, offset)
+            if events is not None:
+                store.stats['local_queries'] += 1
+                if len(events) > page_size:
+                    return events[:page_size], f"{time_min}|o:{offset + page_size}"
+                return events, None
+            store.stats['remote_queries'] += 1
+
+        # 저장소로 답할 수 없으면 offset이 있는 페이지까지 넘긴 뒤 Calendar 페이지 토큰으로 이어감
+        next_token = None
+        for _ in range(offset // page_size):
+            _, next_token = _list_event_page(service, time_min, page_size, next_token)
+            if not next_token:
+                return [], None
+        events, next_token = _list_event_page(service, time_min, page_size, next_token)
+        return events[offset % page_size:], f"{time_min}|{next_token}" if next_token else None
+
+    except HttpError as error:
+        print(f'캘린더 일정 조회 중 오류 발생: {error}', file=sys.stderr)
+        return [], None
+# --- 페이지 단위 조회 --- END
+
 def list_upcoming_events(service, max_results=10, time_min=None):
     """
     캘린더에서 다가오는 일정을 조회합니다.
+    동기화된 로컬 저장소로 답할 수 있으면 API 목록 조회를 하지 않습니다.
     
     Args:
         service: 구글 캘린더 API 서비스 객체
-        max_results: 최대 조회 결과 수 (기본값: 10)
+        max_results: 최대 조회 결과 수 (기본값: 10, 2500을 넘으면 여러 페이지를 이어서 조회)
         time_min: 조회 시작 시간 (기본값: 현재 시간)
         
     Returns:
@@ -17,20 +553,23 @@ def list_upcoming_events(service, max_results=10, time_min=None):
     if time_min is None:
         time_min = datetime.utcnow().isoformat() + 'Z'  # 'Z'는 UTC 시간을 의미
     
+    store = get_event_store()
+    if store is not None and sync_events(service, store, background=True):
+        try:
+            events = _list_upcoming_local(service, store, time_min, max_results)
+        except HttpError as error:
+            print(f'반복 일정 조회 중 오류 발생: {error}', file=sys.stderr)
+            events = None
+        if events is not None:
+            store.stats['local_queries'] += 1
+            return events
+        store.stats['remote_queries'] += 1
+    
     try:
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        events = events_result.get('items', [])
-        return events
+        return list(iter_events(service, time_min=time_min, page_size=min(max_results, MAX_PAGE_SIZE), limit=max_results))
     
     except HttpError as error:
-        print(f'캘린더 일정 조회 중 오류 발생: {error}')
+        print(f'캘린더 일정 조회 중 오류 발생: {error}', file=sys.stderr)
         return []
 
 def create_calendar_event(service, summary, location=None, description=None, 
@@ -83,11 +622,25 @@ def create_calendar_event(service, summary, location=None, description=None,
     
     try:
         event = service.events().insert(calendarId='primary', body=event_body).execute()
+        
+        # 로컬 저장소에 바로 반영하고, 다음 조회 때 동기화하도록 동기화 주기를 초기화
+        store = get_event_store()
+        if store is not None:
+            store.upsert_event(event)
+            store.set_state(last_sync_at=0)
+        
         return event
     
     except HttpError as error:
-        print(f'캘린더 일정 생성 중 오류 발생: {error}')
+        print(f'캘린더 일정 생성 중 오류 발생: {error}', file=sys.stderr)
+        return None
+
+def get_store_stats(store=None):
+    """일정 저장소의 동기화/조회 통계를 반환합니다."""
+    store = store or get_event_store()
+    if store is None:
         return None
+    return {**store.stats, **store.counts(), 'has_sync_token': store.get_state('sync_token') is not None}
 
 def format_event_for_display(event):
     """
@@ -0,0 +1,408 @@
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from metrics import process_rss_bytes
+
+# 에이전트 대화 상태(체크포인트) 저장소 설정
+CHECKPOINTER = os.getenv("AGENT_CHECKPOINTER", "sqlite").lower()  # sqlite | memory
+CHECKPOINT_PATH = os.getenv("AGENT_CHECKPOINT_PATH", "agent_checkpoints.sqlite3")
+CHECKPOINT_TTL = float(os.getenv("AGENT_CHECKPOINT_TTL", "604800"))  # 이 시간(초) 동안 사용하지 않은 대화는 삭제
+CHECKPOINT_MAX_THREADS = int(os.getenv("AGENT_CHECKPOINT_MAX_THREADS", "500"))  # 넘으면 가장 오래 쓰지 않은 대화부터 삭제
+CHECKPOINT_KEEP = int(os.getenv("AGENT_CHECKPOINT_KEEP", "3"))  # 대화별로 보관할 최근 체크포인트 수
+CHECKPOINT_CACHE_KB = int(os.getenv("AGENT_CHECKPOINT_CACHE_KB", "8192"))  # SQLite 페이지 캐시 크기 (KB)
+PRUNE_INTERVAL = 60  # 만료/초과 대화 정리 주기(초)
+
+
+def _config(thread_id, checkpoint_ns, checkpoint_id):
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver):
+    """
+    에이전트 대화 상태를 SQLite 파일에 저장하는 LangGraph 체크포인터. (MemorySaver 대체)
+
+    - 체크포인트는 채널 값과 함께 한 행으로 저장하고, 대화(thread_id)별로 최근 keep_checkpoints개만 보관합니다.
+    - 대화마다 마지막 사용 시각을 기록해, ttl_seconds 동안 쓰지 않은 대화와 max_threads를 넘는 가장 오래 쓰지 않은(LRU) 대화를 삭제합니다.
+    - 상태가 프로세스 힙이 아니라 파일에 있으므로 메모리 사용량이 대화 수와 무관하게 일정하고, 앱을 다시 시작해도 대화를 이어갈 수 있습니다.
+    Streamlit 스크립트 스레드와 공유 이벤트 루프 스레드에서 함께 사용하므로 연결 하나를 잠금으로 보호합니다.
+    """
+
+    def __init__(self, db_path=CHECKPOINT_PATH, ttl_seconds=CHECKPOINT_TTL, max_threads=CHECKPOINT_MAX_THREADS,
+                 keep_checkpoints=CHECKPOINT_KEEP, cache_kb=CHECKPOINT_CACHE_KB, serde=None):
+        """
+        Args:
+            db_path: SQLite 파일 경로
+            ttl_seconds: 이 시간(초) 동안 사용하지 않은 대화를 삭제 (0 이하이면 만료 없음)
+            max_threads: 보관할 최대 대화 수 (0 이하이면 제한 없음)
+            keep_checkpoints: 대화별로 보관할 최근 체크포인트 수 (최소 1)
+            cache_kb: SQLite 페이지 캐시 크기 (KB)
+            serde: 체크포인트 직렬화기 (기본값: LangGraph 기본 직렬화기)
+        """
+        super().__init__(serde=serde)
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_threads = max_threads
+        self.keep_checkpoints = max(1, keep_checkpoints)
+        self.stats_counters = {"puts": 0, "expired_threads": 0, "evicted_threads": 0}
+        self._last_prune = 0.0
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(f"PRAGMA cache_size=-{int(cache_kb)}")
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    last_access REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_threads_access ON threads (last_access);
+                CREATE TABLE IF NOT EXISTS thread_owners (
+                    thread_id TEXT PRIMARY KEY,
+                    owner TEXT NOT NULL
+                );
+                """
+            )
+            self._db.commit()
+
+    # --- 체크포인트 읽기 --- START
+    def _load_tuple(self, row):
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = self._db.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=_config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((value_type, value))) for task_id, channel, value_type, value in writes],
+        )
+
+    def get_tuple(self, config):
+        """대화의 체크포인트(checkpoint_id가 없으면 최신)를 반환하고 대화의 마지막 사용 시각을 갱신합니다."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            if checkpoint_id:
+                row = self._db.execute(
+                    "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._db.execute(
+                    "SELECT * FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            self._touch(thread_id)
+            self._db.commit()
+            return self._load_tuple(row)
+
+    def list(self, config, *, filter=None, before=None, limit=None):
+        """조건에 맞는 체크포인트를 최신순으로 반환합니다."""
+        clauses, params = [], []
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._db.execute(f"SELECT * FROM checkpoints {where} ORDER BY checkpoint_id DESC", params).fetchall()
+            # 메타데이터 필터는 역직렬화 후 적용
+            results = []
+            for row in rows:
+                checkpoint_tuple = self._load_tuple(row)
+                if filter and not all(checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+                if limit is not None and len(results) >= limit:
+                    break
+        yield from results
+    # --- 체크포인트 읽기 --- END
+
+    # --- 체크포인트 쓰기 --- START
+    def put(self, config, checkpoint, metadata, new_versions):
+        """체크포인트를 저장하고, 대화별 보관 개수를 넘는 오래된 체크포인트와 만료/초과 대화를 정리합니다."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, serialized = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, serialized, metadata_type, serialized_metadata),
+            )
+            self._trim_thread(thread_id, checkpoint_ns)
+            self._touch(thread_id)
+            self.stats_counters["puts"] += 1
+            if time.time() - self._last_prune >= PRUNE_INTERVAL:
+                self._prune()
+            self._db.commit()
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        """체크포인트에 연결된 중간 쓰기(pending writes)를 저장합니다. (일반 쓰기는 처음 값을 유지, 특수 채널은 덮어씀)"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            rows.append((write_idx >= 0, (thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx, channel,
+                                          *self.serde.dumps_typed(value), task_path)))
+        with self._lock:
+            for keep_first, row in rows:
+                verb = "INSERT OR IGNORE" if keep_first else "INSERT OR REPLACE"
+                self._db.execute(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self._db.commit()
+
+    def delete_thread(self, thread_id):
+        """대화의 체크포인트와 중간 쓰기를 모두 삭제합니다."""
+        with self._lock:
+            self._delete_threads([thread_id])
+            self._db.commit()
+
+    def set_owner(self, thread_id, owner):
+        """대화의 소유자를 기록합니다. (이미 소유자가 있으면 바꾸지 않음)"""
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO thread_owners (thread_id, owner) VALUES (?, ?)", (thread_id, owner))
+            self._db.commit()
+
+    def get_owner(self, thread_id):
+        with self._lock:
+            row = self._db.execute("SELECT owner FROM thread_owners WHERE thread_id = ?", (thread_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_next_version(self, current, channel):
+        # MemorySaver와 같은 형식 (버전 번호 + 난수)
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    # 비동기 버전은 동기 메서드를 그대로 사용 (로컬 파일 접근이라 짧게 끝남)
+    async def aget_tuple(self, config):
+        return self.get_tuple(config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for checkpoint_tuple in self.list(config, filter=filter, before=before, limit=limit):
+            yield checkpoint_tuple
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id):
+        return self.delete_thread(thread_id)
+    # --- 체크포인트 쓰기 --- END
+
+    # --- 대화 정리 (TTL/LRU) --- START
+    def _touch(self, thread_id):
+        self._db.execute("INSERT OR REPLACE INTO threads (thread_id, last_access) VALUES (?, ?)", (thread_id, time.time()))
+
+    def _trim_thread(self, thread_id, checkpoint_ns):
+        """대화의 최근 keep_checkpoints개를 제외한 체크포인트와 그 중간 쓰기를 삭제합니다."""
+        stale = self._db.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_checkpoints),
+        ).fetchall()
+        for (checkpoint_id,) in stale:
+            for table in ("checkpoints", "writes"):
+                self._db.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                )
+
+    def _delete_threads(self, thread_ids):
+        for thread_id in thread_ids:
+            for table in ("checkpoints", "writes", "threads", "thread_owners"):
+                self._db.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def _prune(self):
+        """ttl_seconds 동안 쓰지 않은 대화와 max_threads를 넘는 가장 오래 쓰지 않은 대화를 삭제합니다."""
+        self._last_prune = time.time()
+        expired = []
+        if self.ttl_seconds > 0:
+            expired = [row[0] for row in self._db.execute(
+                "SELECT thread_id FROM threads WHERE last_access < ?", (self._last_prune - self.ttl_seconds,)
+            )]
+            self._delete_threads(expired)
+        evicted = []
+        if self.max_threads > 0:
+            evicted = [row[0] for row in self._db.execute(
+                "SELECT thread_id FROM threads ORDER BY last_access DESC LIMIT -1 OFFSET ?", (self.max_threads,)
+            )]
+            self._delete_threads(evicted)
+        self.stats_counters["expired_threads"] += len(expired)
+        self.stats_counters["evicted_threads"] += len(evicted)
+        if expired or evicted:
+            print(f"DEBUG (SQLiteCheckpointSaver): 만료된 대화 {len(expired)}개, 초과한 대화 {len(evicted)}개를 삭제했습니다.")
+
+    def prune(self):
+        """만료/초과 대화를 즉시 정리합니다. (put에서 PRUNE_INTERVAL마다 자동으로 호출됨)"""
+        with self._lock:
+            self._prune()
+            self._db.commit()
+    # --- 대화 정리 (TTL/LRU) --- END
+
+    def stats(self):
+        """
+        저장소 상태와 메모리 사용량을 반환합니다.
+
+        Returns:
+            dict: {"backend", "threads", "checkpoints", "pending_writes", "db_bytes", "cache_limit_bytes",
+                   "process_rss_bytes", "puts", "expired_threads", "evicted_threads"}
+        """
+        with self._lock:
+            threads = self._db.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints = self._db.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            pending_writes = self._db.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+            page_count = self._db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._db.execute("PRAGMA page_size").fetchone()[0]
+            cache_size = self._db.execute("PRAGMA cache_size").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "pending_writes": pending_writes,
+            "db_bytes": page_count * page_size,
+            # 음수이면 KB 단위, 양수이면 페이지 수
+            "cache_limit_bytes": -cache_size * 1024 if cache_size < 0 else cache_size * page_size,
+            "process_rss_bytes": process_rss_bytes(),
+            **self.stats_counters,
+        }
+
+
+def create_checkpointer(backend=CHECKPOINTER, **kwargs):
+    """
+    AGENT_CHECKPOINTER 설정에 맞는 체크포인터를 생성합니다.
+
+    Args:
+        backend: "sqlite" (기본값, 파일에 저장하고 TTL/LRU로 정리) 또는 "memory" (기존 MemorySaver, 정리 없음)
+        **kwargs: SQLiteCheckpointSaver 인자
+
+    Returns:
+        BaseCheckpointSaver
+    """
+    if backend == "memory":
+        return MemorySaver()
+    if backend != "sqlite":
+        print(f"ERROR (create_checkpointer): 알 수 없는 AGENT_CHECKPOINTER '{backend}', sqlite를 사용합니다.")
+    return SQLiteCheckpointSaver(**kwargs)
+
+
+def checkpointer_stats(checkpointer):
+    """체크포인터 상태를 반환합니다. (MemorySaver는 대화 수와 프로세스 메모리만 보고)"""
+    if isinstance(checkpointer, SQLiteCheckpointSaver):
+        return checkpointer.stats()
+    return {
+        "backend": "memory",
+        "threads": len(getattr(checkpointer, "storage", {})),
+        "process_rss_bytes": process_rss_bytes(),
+    }
+
+
+def set_thread_owner(checkpointer, thread_id, owner):
+    """
+    대화의 소유자(Google 계정 이메일)를 기록합니다. 처음 기록한 소유자가 유지됩니다.
+    (MemorySaver는 체크포인터 객체에 보관)
+    """
+    if isinstance(checkpointer, SQLiteCheckpointSaver):
+        checkpointer.set_owner(thread_id, owner)
+    else:
+        checkpointer.__dict__.setdefault("thread_owners", {}).setdefault(thread_id, owner)
+
+
+def get_thread_owner(checkpointer, thread_id):
+    """대화의 소유자를 반환합니다. (기록되지 않았으면 None)"""
+    if isinstance(checkpointer, SQLiteCheckpointSaver):
+        return checkpointer.get_owner(thread_id)
+    return checkpointer.__dict__.get("thread_owners", {}).get(thread_id)
+
+
+def load_conversation(checkpointer, thread_id, owner):
+    """
+    저장된 대화의 사용자 질문과 최종 답변을 화면 표시용 기록으로 반환합니다. (앱을 다시 시작한 뒤 대화를 이어갈 때 사용)
+    thread_id는 URL로 전달되므로 인증 수단으로 쓰지 않고, 대화의 소유자가 owner와 같을 때만 불러옵니다.
+
+    Args:
+        checkpointer: 체크포인터
+        thread_id: 대화 ID
+        owner: 현재 세션의 Google 계정 이메일 (None이면 불러오지 않음)
+
+    Returns:
+        list[dict]: [{"role": "user" | "assistant", "content": str}, ...] (저장된 대화가 없거나 소유자가 다르면 빈 목록)
+    """
+    if owner is None or get_thread_owner(checkpointer, thread_id) != owner:
+        return []
+    try:
+        checkpoint_tuple = checkpointer.get_tuple({"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}})
+    except Exception as e:
+        print(f"ERROR (load_conversation): 대화 {thread_id}를 불러오지 못했습니다: {e}")
+        return []
+    if checkpoint_tuple is None:
+        return []
+    history = []
+    for message in checkpoint_tuple.checkpoint["channel_values"].get("messages", []):
+        if isinstance(message, HumanMessage):
+            history.append({"role": "user", "content": message.content})
+        elif isinstance(message, AIMessage) and isinstance(message.content, str) and message.content.strip():
+            history.append({"role": "assistant", "content": message.content})
+    return history
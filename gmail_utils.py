@@ -1,15 +1,721 @@
 import base64
+import codecs
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from dotenv import load_dotenv
 from googleapiclient.errors import HttpError
 
+try:
+    import charset_normalizer  # requests 의존성으로 함께 설치됨 (charset이 없는 본문의 인코딩 추정용)
+except ImportError:
+    charset_normalizer = None
+
+load_dotenv()
+
+# 한 번의 batch 요청에 담을 최대 요청 수 (Gmail은 50개 이하를 권장)
+BATCH_SIZE = 50
+# messages.list 한 페이지의 최대 크기 (Gmail API 제한)
+MAX_PAGE_SIZE = 500
+
+# 로컬 메일 인덱스 설정
+# 메시지 메타데이터(From/Subject/Date/snippet/라벨)를 SQLite에 저장하고, 이후에는 historyId 이후의 변경분만 가져온다.
+INDEX_ENABLED = os.getenv("GMAIL_INDEX_ENABLED", "true").lower() == "true"
+INDEX_PATH = os.getenv("GMAIL_INDEX_PATH", "gmail_index.sqlite3")
+SYNC_INTERVAL = float(os.getenv("GMAIL_SYNC_INTERVAL", "15"))  # 이 시간(초) 안에는 다시 동기화하지 않음
+INITIAL_SYNC_LIMIT = int(os.getenv("GMAIL_INDEX_INITIAL_SYNC", "500"))  # 최초 전체 동기화 시 가져올 최근 메시지 수
+INDEX_MAX_MESSAGES = int(os.getenv("GMAIL_INDEX_MAX_MESSAGES", "5000"))
+INDEX_HEADERS = ['From', 'To', 'Subject', 'Date']
+# 동기화 시 본문까지 가져와 전문 검색 인덱스에 넣을지 여부 (끄면 본문은 get_email_content로 열어 본 메일만 색인)
+INDEX_BODIES = os.getenv("GMAIL_INDEX_BODIES", "true").lower() == "true"
+INDEX_BODY_CHARS = 20000  # 메일당 색인할 최대 본문 길이
+SYNC_CHUNK_SIZE = 100  # 동기화 시 한 번에 조회/저장할 메시지 수
+
+# 본문 추출 설정: 메일 하나에서 디코딩할 최대 본문 크기(바이트)
+BODY_MAX_BYTES = int(os.getenv("GMAIL_BODY_MAX_BYTES", "1000000"))
+BODY_TRUNCATED_MARKER = "\n\n... (본문이 너무 길어 이후 내용은 생략되었습니다)"
+CHARSET_RE = re.compile(r'charset\s*=\s*("[^"]+"|[^;\s]+)', re.IGNORECASE)
+
+# --- 한국어 검색 토큰화 --- START
+HANGUL_RUN_RE = re.compile(r"[\uac00-\ud7a3]+")
+# 한글과 그 밖의 문자가 붙어 있으면 문자 종류가 바뀌는 곳에서 나눔 (예: "3월회의" -> "3", "월회의")
+WORD_RE = re.compile(r"[\uac00-\ud7a3]+|[^\W_\uac00-\ud7a3]+")
+# 토큰화 방식이 바뀌면 올려서 기존 인덱스를 다시 만들게 함
+TOKENIZER_VERSION = 2
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+def tokenize_for_search(text):
+    """
+    전문 검색용 토큰 목록을 만듭니다.
+    한글은 형태소 분석기 없이도 부분 일치가 되도록 음절 바이그램(2-gram)으로, 그 밖의 단어는 소문자로 나눕니다.
+    (예: "회의록 Update" -> ["회의", "의록", "update"], "Zoom회의록" -> ["zoom", "회의", "의록"])
+    """
+    tokens = []
+    for word in WORD_RE.findall(text or ""):
+        if HANGUL_RUN_RE.fullmatch(word) and len(word) > 1:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word.lower())
+    return tokens
+
+def _fts_phrase(text):
+    """검색어 하나를 FTS5 구문 질의로 변환합니다. (한 글자 한글은 바이그램 접두어로 검색)"""
+    tokens = tokenize_for_search(text)
+    if not tokens:
+        return None
+    if len(tokens) == 1 and HANGUL_RUN_RE.fullmatch(tokens[0]) and len(tokens[0]) == 1:
+        return f'"{tokens[0]}"*'
+    return '"' + " ".join(tokens) + '"'
+# --- 한국어 검색 토큰화 --- END
+
+def batch_get_messages(service, message_ids, format='metadata', metadata_headers=None):
+    """
+    여러 이메일의 상세 정보를 Google API batch 요청으로 한 번에 조회합니다.
+    
+    Args:
+        service: 구글 Gmail API 서비스 객체
+        message_ids: 조회할 이메일 ID 목록
+        format: 조회 형식 (기본값: 'metadata')
+        metadata_headers: format이 'metadata'일 때 가져올 헤더 목록 (기본값: From, Subject, Date)
+        
+    Returns:
+        messages: 이메일 상세 정보 목록 (message_ids 순서 유지, 조회에 실패한 이메일은 제외)
+    """
+    if metadata_headers is None:
+        metadata_headers = ['From', 'Subject', 'Date']
+    
+    results = {}
+    
+    def callback(request_id, response, exception):
+        # 개별 이메일 오류는 해당 이메일만 건너뜀
+        if exception is not None:
+            print(f'이메일 상세 조회 중 오류 발생 (ID: {message_ids[int(request_id)]}): {exception}')
+            return
+        results[int(request_id)] = response
+    
+    for start in range(0, len(message_ids), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for index in range(start, min(start + BATCH_SIZE, len(message_ids))):
+            params = {'userId': 'me', 'id': message_ids[index], 'format': format}
+            if format == 'metadata':
+                params['metadataHeaders'] = metadata_headers
+            batch.add(service.users().messages().get(**params), request_id=str(index))
+        batch.execute()
+    
+    return [results[index] for index in range(len(message_ids)) if index in results]
+
+class MailIndex:
+    """
+    Gmail 메시지 메타데이터를 저장하는 로컬 SQLite 인덱스.
+    sync_mailbox로 동기화하며, 마지막 동기화 historyId와 계정 정보를 sync_state 테이블에 보관합니다.
+    """
+
+    def __init__(self, db_path=INDEX_PATH, max_messages=INDEX_MAX_MESSAGES):
+        """
+        Args:
+            db_path: SQLite 파일 경로
+            max_messages: 보관할 최대 메시지 수 (넘으면 오래된 메시지부터 제거)
+        """
+        self.db_path = db_path
+        self.max_messages = max_messages
+        self.lock = threading.RLock()
+        self.service_id = None  # 마지막으로 계정을 확인한 서비스 객체 id
+        self.sync_thread = None  # 진행 중인 백그라운드 전체 동기화 스레드
+        self.stats = {
+            'full_syncs': 0,
+            'incremental_syncs': 0,
+            'history_records': 0,
+            'messages_fetched': 0,
+            'local_queries': 0,
+            'remote_queries': 0,
+            'local_searches': 0,
+            'remote_searches': 0,
+        }
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self.lock:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id TEXT PRIMARY KEY,
+                    thread_id TEXT,
+                    internal_date INTEGER,
+                    sender TEXT,
+                    recipient TEXT,
+                    subject TEXT,
+                    date TEXT,
+                    snippet TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_messages_internal_date ON messages (internal_date DESC);
+                CREATE TABLE IF NOT EXISTS message_labels (
+                    message_id TEXT NOT NULL,
+                    label_id TEXT NOT NULL,
+                    PRIMARY KEY (message_id, label_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_message_labels_label ON message_labels (label_id, message_id);
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+                    sender, subject, snippet, body, tokenize = 'unicode61'
+                );
+                """
+            )
+            self._db.commit()
+            # 예전 토큰화 방식으로 만든 인덱스는 비워서 다음 동기화 때 전체 동기화로 다시 만듦
+            if self.get_state('history_id') is not None and self.get_state('tokenizer') != str(TOKENIZER_VERSION):
+                self.clear()
+
+    # --- 동기화 상태 --- START
+    def get_state(self, key, default=None):
+        with self.lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, **values):
+        with self.lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                [(key, None if value is None else str(value)) for key, value in values.items()],
+            )
+            self._db.commit()
+    # --- 동기화 상태 --- END
+
+    # --- 메시지 저장/조회 --- START
+    def clear(self):
+        """모든 메시지와 동기화 상태를 삭제합니다."""
+        with self.lock:
+            self._db.executescript(
+                "DELETE FROM messages; DELETE FROM message_labels; DELETE FROM message_fts; DELETE FROM sync_state;"
+            )
+            self._db.commit()
+
+    def upsert_messages(self, messages):
+        """
+        Gmail API의 metadata 또는 full 형식 메시지 목록을 저장하고 전문 검색 인덱스를 갱신합니다.
+        (full 형식이면 본문도 색인하고, metadata 형식이면 이미 색인된 본문을 유지)
+        """
+        if not messages:
+            return
+        with self.lock:
+            for message in messages:
+                payload = message.get('payload', {})
+                headers = {h['name'].lower(): h['value'] for h in payload.get('headers', [])}
+                body = decode_body(payload, INDEX_BODY_CHARS * 4)[0][:INDEX_BODY_CHARS] if _has_body(payload) else self._indexed_body(message['id'])
+                self._delete_fts([message['id']])
+                self._db.execute(
+                    "INSERT OR REPLACE INTO messages (id, thread_id, internal_date, sender, recipient, subject, date, snippet) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        message['id'],
+                        message.get('threadId'),
+                        int(message.get('internalDate', 0)),
+                        headers.get('from'),
+                        headers.get('to'),
+                        headers.get('subject'),
+                        headers.get('date'),
+                        message.get('snippet', ''),
+                    ),
+                )
+                self._replace_labels(message['id'], message.get('labelIds', []))
+                self._index_text(message['id'], headers.get('from'), headers.get('subject'), message.get('snippet', ''), body)
+            self._prune()
+            self._db.commit()
+
+    def set_body(self, message_id, body):
+        """인덱스에 있는 메시지의 본문을 전문 검색 인덱스에 반영합니다. (없는 메시지는 무시)"""
+        with self.lock:
+            row = self._db.execute("SELECT sender, subject, snippet FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if row is None:
+                return
+            self._delete_fts([message_id])
+            self._index_text(message_id, row['sender'], row['subject'], row['snippet'], body[:INDEX_BODY_CHARS])
+            self._db.commit()
+
+    def _index_text(self, message_id, sender, subject, snippet, body):
+        # FTS 행의 rowid는 messages 행의 rowid와 같게 맞춤 (본문 원문은 저장하지 않고 토큰만 저장)
+        self._db.execute(
+            "INSERT INTO message_fts (rowid, sender, subject, snippet, body) "
+            "SELECT rowid, ?, ?, ?, ? FROM messages WHERE id = ?",
+            (
+                " ".join(tokenize_for_search(sender)),
+                " ".join(tokenize_for_search(subject)),
+                " ".join(tokenize_for_search(snippet)),
+                " ".join(tokenize_for_search(HTML_TAG_RE.sub(" ", body))) if body is not None else None,
+                message_id,
+            ),
+        )
+
+    def _indexed_body(self, message_id):
+        row = self._db.execute(
+            "SELECT message_fts.body FROM message_fts JOIN messages ON messages.rowid = message_fts.rowid "
+            "WHERE messages.id = ?", (message_id,)
+        ).fetchone()
+        # 이미 토큰화된 본문이므로 다시 토큰화해도 같은 결과
+        return row[0] if row else None
+
+    def _delete_fts(self, message_ids):
+        self._db.executemany(
+            "DELETE FROM message_fts WHERE rowid IN (SELECT rowid FROM messages WHERE id = ?)",
+            [(message_id,) for message_id in message_ids],
+        )
+
+    def set_labels(self, message_id, label_ids):
+        """인덱스에 있는 메시지의 라벨을 교체합니다. (없는 메시지는 무시)"""
+        with self.lock:
+            if self._db.execute("SELECT 1 FROM messages WHERE id = ?", (message_id,)).fetchone():
+                self._replace_labels(message_id, label_ids)
+                self._db.commit()
+
+    def delete_messages(self, message_ids):
+        """메시지를 인덱스에서 삭제합니다."""
+        if not message_ids:
+            return
+        with self.lock:
+            rows = [(message_id,) for message_id in message_ids]
+            self._delete_fts(message_ids)
+            self._db.executemany("DELETE FROM messages WHERE id = ?", rows)
+            self._db.executemany("DELETE FROM message_labels WHERE message_id = ?", rows)
+            self._db.commit()
+
+    def _replace_labels(self, message_id, label_ids):
+        self._db.execute("DELETE FROM message_labels WHERE message_id = ?", (message_id,))
+        self._db.executemany(
+            "INSERT OR IGNORE INTO message_labels (message_id, label_id) VALUES (?, ?)",
+            [(message_id, label_id) for label_id in label_ids],
+        )
+
+    def _prune(self):
+        stale = self._db.execute(
+            "SELECT id FROM messages ORDER BY internal_date DESC LIMIT -1 OFFSET ?", (self.max_messages,)
+        ).fetchall()
+        if stale:
+            self._delete_fts([row[0] for row in stale])
+            self._db.executemany("DELETE FROM messages WHERE id = ?", stale)
+            self._db.executemany("DELETE FROM message_labels WHERE message_id = ?", stale)
+            self.set_state(complete=0)
+
+    def count(self):
+        with self.lock:
+            return self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def list_messages(self, label_ids=None, max_results=10):
+        """
+        라벨 조건(모든 라벨을 가진 메시지)에 맞는 최근 메시지를 최신순으로 반환합니다.
+
+        Returns:
+            messages: Gmail API metadata 형식과 같은 구조의 메시지 목록
+        """
+        return self.search_messages({'labels': label_ids or []}, max_results)
+
+    def search_messages(self, criteria, max_results=10, offset=0):
+        """
+        parse_search_query가 만든 조건으로 메시지를 최신순으로 검색합니다.
+
+        Args:
+            criteria: {'fts': FTS5 질의 목록, 'labels': 모두 가져야 하는 라벨, 'exclude_labels': 없어야 하는 라벨,
+                       'after': 이 시각(ms) 이후, 'before': 이 시각(ms) 이전}
+            max_results: 최대 결과 수
+            offset: 건너뛸 결과 수 (페이지 조회용)
+
+        Returns:
+            messages: Gmail API metadata 형식과 같은 구조의 메시지 목록
+        """
+        where, params = [], []
+        if criteria.get('fts'):
+            where.append("rowid IN (SELECT rowid FROM message_fts WHERE message_fts MATCH ?)")
+            params.append(" AND ".join(criteria['fts']))
+        labels = sorted(set(criteria.get('labels') or []))
+        if labels:
+            where.append(
+                f"id IN (SELECT message_id FROM message_labels WHERE label_id IN ({', '.join('?' for _ in labels)})"
+                " GROUP BY message_id HAVING COUNT(*) = ?)"
+            )
+            params.extend(labels)
+            params.append(len(labels))
+        exclude_labels = sorted(set(criteria.get('exclude_labels') or []))
+        if exclude_labels:
+            where.append(
+                f"id NOT IN (SELECT message_id FROM message_labels WHERE label_id IN ({', '.join('?' for _ in exclude_labels)}))"
+            )
+            params.extend(exclude_labels)
+        if criteria.get('after') is not None:
+            where.append("internal_date >= ?")
+            params.append(criteria['after'])
+        if criteria.get('before') is not None:
+            where.append("internal_date < ?")
+            params.append(criteria['before'])
+
+        sql = "SELECT * FROM messages"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY internal_date DESC LIMIT ? OFFSET ?"
+        params.extend([max_results, offset])
+        with self.lock:
+            rows = self._db.execute(sql, params).fetchall()
+            return [self._to_message(row) for row in rows]
+
+    def _to_message(self, row):
+        labels = [r[0] for r in self._db.execute(
+            "SELECT label_id FROM message_labels WHERE message_id = ?", (row['id'],)
+        )]
+        headers = [
+            {'name': name, 'value': row[column]}
+            for name, column in (('From', 'sender'), ('To', 'recipient'), ('Subject', 'subject'), ('Date', 'date'))
+            if row[column] is not None
+        ]
+        return {
+            'id': row['id'],
+            'threadId': row['thread_id'],
+            'labelIds': labels,
+            'snippet': row['snippet'],
+            'internalDate': str(row['internal_date']),
+            'payload': {'headers': headers},
+        }
+    # --- 메시지 저장/조회 --- END
+
+
+_mail_indexes = {}
+_mail_indexes_lock = threading.Lock()
+
+def get_mail_index(db_path=None):
+    """프로세스에서 공유하는 MailIndex를 반환합니다. (인덱스를 사용하지 않으면 None)"""
+    if not INDEX_ENABLED:
+        return None
+    db_path = db_path or INDEX_PATH
+    with _mail_indexes_lock:
+        if db_path not in _mail_indexes:
+            _mail_indexes[db_path] = MailIndex(db_path)
+        return _mail_indexes[db_path]
+
+def _full_sync(service, index):
+    """최근 메시지를 다시 가져와 인덱스를 새로 만듭니다."""
+    profile = service.users().getProfile(userId='me').execute()
+    # 목록 조회 전에 historyId를 받아 두어야 조회 중 도착한 메일도 다음 증분 동기화에 포함됨
+    history_id = profile['historyId']
+
+    message_ids = []
+    page_token = None
+    while len(message_ids) < INITIAL_SYNC_LIMIT:
+        response = service.users().messages().list(
+            userId='me',
+            maxResults=min(500, INITIAL_SYNC_LIMIT - len(message_ids)),
+            pageToken=page_token
+        ).execute()
+        message_ids.extend(message['id'] for message in response.get('messages', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+
+    index.clear()
+    # 청크마다 잠금을 잡고 저장하므로, 백그라운드 동기화 중에도 다른 호출(본문 색인, 라벨 변경)이 오래 기다리지 않음
+    # (history_id는 마지막에 기록하므로 그 전까지 목록 조회는 인덱스를 사용하지 않음)
+    fetched = _fetch_into_index(service, index, message_ids)
+    index.set_state(
+        history_id=history_id,
+        email=profile.get('emailAddress'),
+        complete=0 if page_token else 1,
+        bodies=1 if INDEX_BODIES else 0,
+        tokenizer=TOKENIZER_VERSION,
+        last_sync_at=time.time(),
+    )
+    index.stats['full_syncs'] += 1
+    print(f"DEBUG (gmail_utils): full sync indexed {fetched} messages (historyId={history_id})", file=sys.stderr)
+
+def _fetch_into_index(service, index, message_ids):
+    """메시지를 SYNC_CHUNK_SIZE개씩 batch 조회해 인덱스에 저장하고 저장한 수를 반환합니다. (본문 색인 시 full 형식)"""
+    fetched = 0
+    for start in range(0, len(message_ids), SYNC_CHUNK_SIZE):
+        chunk = message_ids[start:start + SYNC_CHUNK_SIZE]
+        if INDEX_BODIES:
+            messages = batch_get_messages(service, chunk, format='full')
+        else:
+            messages = batch_get_messages(service, chunk, metadata_headers=INDEX_HEADERS)
+        index.upsert_messages(messages)
+        fetched += len(messages)
+    index.stats['messages_fetched'] += fetched
+    return fetched
+
+def _incremental_sync(service, index, start_history_id):
+    """
+    history.list로 start_history_id 이후의 변경분만 인덱스에 반영합니다.
+
+    Returns:
+        bool: 성공 여부 (historyId가 만료되어 전체 동기화가 필요하면 False)
+    """
+    added, deleted, labels = {}, set(), {}
+    history_id = start_history_id
+    page_token = None
+    records = 0
+    try:
+        while True:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                pageToken=page_token
+            ).execute()
+            for record in response.get('history', []):
+                records += 1
+                for item in record.get('messagesAdded', []):
+                    added[item['message']['id']] = item['message']
+                    deleted.discard(item['message']['id'])
+                for item in record.get('messagesDeleted', []):
+                    deleted.add(item['message']['id'])
+                    added.pop(item['message']['id'], None)
+                    labels.pop(item['message']['id'], None)
+                # 라벨 변경 레코드의 message.labelIds는 변경 후 전체 라벨
+                for item in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                    if item['message']['id'] not in deleted:
+                        labels[item['message']['id']] = item['message'].get('labelIds', [])
+            history_id = response.get('historyId', history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+    except HttpError as error:
+        if getattr(error, 'resp', None) is not None and error.resp.status == 404:
+            print("DEBUG (gmail_utils): historyId expired, falling back to full sync", file=sys.stderr)
+            return False
+        raise
+
+    # 새 메시지는 헤더가 필요하므로 batch로 조회 (라벨 변경만 있는 메시지는 API 호출 없음)
+    with index.lock:
+        fetched = _fetch_into_index(service, index, list(added))
+        for message_id, label_ids in labels.items():
+            if message_id not in added:
+                index.set_labels(message_id, label_ids)
+        index.delete_messages(deleted)
+        index.set_state(history_id=history_id, last_sync_at=time.time())
+    index.stats['incremental_syncs'] += 1
+    index.stats['history_records'] += records
+    if records:
+        print(f"DEBUG (gmail_utils): incremental sync applied {records} history records "
+              f"(+{fetched} / -{len(deleted)} / labels {len(labels)})", file=sys.stderr)
+    return True
+
+def _background_full_sync(service, index):
+    try:
+        _full_sync(service, index)
+    except Exception as error:
+        print(f'메일 인덱스 백그라운드 동기화 중 오류 발생: {error}', file=sys.stderr)
+
+def _start_background_sync(service, index):
+    """전체 동기화를 백그라운드 스레드에서 시작합니다. (이미 진행 중이면 그대로 둠)"""
+    with _mail_indexes_lock:
+        if index.sync_thread is None or not index.sync_thread.is_alive():
+            index.sync_thread = threading.Thread(
+                target=_background_full_sync, args=(service, index), name="gmail-index-sync", daemon=True
+            )
+            index.sync_thread.start()
+
+def sync_mailbox(service, index=None, force=False, background=False):
+    """
+    로컬 메일 인덱스를 Gmail과 동기화합니다.
+    처음에는 최근 메시지를 전체 동기화하고, 이후에는 마지막 historyId 이후의 변경분만 가져옵니다.
+    
+    Args:
+        service: 구글 Gmail API 서비스 객체
+        index: MailIndex (기본값: get_mail_index())
+        force: True이면 SYNC_INTERVAL과 관계없이 동기화
+        background: True이면 전체 동기화(최초 또는 historyId 만료 시)를 백그라운드 스레드에서 시작하고 기다리지 않음
+            (목록 조회 도구는 이 값으로 호출해, 인덱스가 준비될 때까지 Gmail API 결과를 사용)
+        
+    Returns:
+        bool: 인덱스를 사용할 수 있으면 True (동기화 실패, 전체 동기화 진행 중 또는 인덱스 비활성화 시 False)
+    """
+    index = index or get_mail_index()
+    if index is None:
+        return False
+    sync_thread = index.sync_thread
+    if sync_thread is not None and sync_thread.is_alive():
+        if background:
+            return False
+        sync_thread.join()
+
+    with index.lock:
+        try:
+            # 인증 정보가 바뀌어 서비스 객체가 새로 만들어지면 계정이 같은지 한 번 확인
+            if index.service_id != id(service):
+                email = service.users().getProfile(userId='me').execute().get('emailAddress')
+                if email != index.get_state('email'):
+                    index.set_state(history_id=None)
+                index.service_id = id(service)
+
+            history_id = index.get_state('history_id')
+            last_sync_at = float(index.get_state('last_sync_at', 0) or 0)
+            if history_id is not None and (force or time.time() - last_sync_at >= SYNC_INTERVAL):
+                if not _incremental_sync(service, index, history_id):
+                    history_id = None
+            if history_id is None:
+                if background:
+                    _start_background_sync(service, index)
+                    return False
+                _full_sync(service, index)
+            return True
+        except HttpError as error:
+            print(f'메일 인덱스 동기화 중 오류 발생: {error}', file=sys.stderr)
+            return False
+
+def get_index_stats(index=None):
+    """메일 인덱스의 동기화/조회 통계를 반환합니다."""
+    index = index or get_mail_index()
+    if index is None:
+        return None
+    return {
+        **index.stats,
+        'indexed_messages': index.count(),
+        'history_id': index.get_state('history_id'),
+        'complete': index.get_state('complete') == '1',
+    }
+
+# --- 페이지 단위 조회 --- START
+def _list_message_ids(service, query=None, label_ids=None, page_size=100, page_token=None):
+    """
+    messages.list 한 페이지의 이메일 ID를 조회합니다.
+
+    Returns:
+        (message_ids, next_page_token)
+    """
+    result = service.users().messages().list(
+        userId='me',
+        labelIds=label_ids,
+        q=query,
+        maxResults=min(page_size, MAX_PAGE_SIZE),
+        pageToken=page_token
+    ).execute()
+    return [message['id'] for message in result.get('messages', [])], result.get('nextPageToken')
+
+def iter_message_pages(service, query=None, label_ids=None, page_size=100, page_token=None):
+    """
+    Gmail 이메일 목록을 한 페이지씩 조회하는 제너레이터.
+    다음 페이지는 필요할 때만 조회하므로 메모리에는 한 페이지만 유지됩니다.
+
+    Args:
+        service: 구글 Gmail API 서비스 객체
+        query: 검색 쿼리 (선택)
+        label_ids: 라벨 ID 목록 (선택)
+        page_size: 페이지 크기 (최대 500)
+        page_token: 이어서 조회할 페이지 토큰 (선택)
+
+    Yields:
+        (messages, next_page_token): 한 페이지의 이메일(metadata) 목록과 다음 페이지 토큰 (마지막 페이지는 None)
+    """
+    while True:
+        message_ids, page_token = _list_message_ids(service, query, label_ids, page_size, page_token)
+        yield batch_get_messages(service, message_ids), page_token
+        if not page_token:
+            return
+
+def iter_emails(service, query=None, label_ids=None, page_size=100, limit=None):
+    """
+    Gmail 이메일을 페이지를 넘겨 가며 하나씩 반환하는 제너레이터.
+
+    Args:
+        service: 구글 Gmail API 서비스 객체
+        query: 검색 쿼리 (선택)
+        label_ids: 라벨 ID 목록 (선택)
+        page_size: 한 번에 조회할 페이지 크기 (최대 500)
+        limit: 최대 이메일 수 (선택, 없으면 끝까지)
+
+    Yields:
+        message: 이메일(metadata)
+    """
+    remaining = limit
+    page_token = None
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        message_ids, page_token = _list_message_ids(service, query, label_ids, size, page_token)
+        for message in batch_get_messages(service, message_ids):
+            yield message
+        if remaining is not None:
+            remaining -= len(message_ids)
+        if not page_token or not message_ids:
+            return
+
+def _local_criteria(service, index, query, label_ids):
+    """
+    로컬 인덱스 검색 조건을 만듭니다. 인덱스로 정확히 답할 수 없으면 None을 반환합니다.
+    (지원하지 않는 연산자, 동기화 실패, 본문 미색인 상태의 일반 검색어)
+    """
+    criteria = parse_search_query(query) if query else {'labels': []}
+    if criteria is None:
+        return None
+    criteria['labels'] = criteria['labels'] + list(label_ids or [])
+    if not sync_mailbox(service, index, background=True):
+        return None
+    if criteria.get('free_text') and not (INDEX_BODIES and index.get_state('bodies') == '1'):
+        return None
+    return criteria
+
+def list_emails_page(service, page_size=10, page_token=None, query=None, label_ids=None):
+    """
+    이메일 목록의 한 페이지를 조회합니다. (MCP 도구의 커서 기반 페이지 조회용)
+    동기화된 로컬 인덱스로 답할 수 있으면 인덱스에서, 그렇지 않으면 Gmail API에서 조회합니다.
+
+    Args:
+        service: 구글 Gmail API 서비스 객체
+        page_size: 페이지 크기 (최대 500)
+        page_token: 이전 페이지가 반환한 커서 (첫 페이지는 None)
+        query: 검색 쿼리 (선택, 페이지를 넘길 때도 같은 값을 전달)
+        label_ids: 라벨 ID 목록 (선택, 기본값: ['INBOX'])
+
+    Returns:
+        (messages, next_page_token): 이메일 목록과 다음 페이지 커서 (마지막 페이지는 None)
+        커서는 로컬 인덱스 위치("o:<offset>") 또는 Gmail pageToken입니다.
+    """
+    if label_ids is None:
+        label_ids = ['INBOX']
+    page_size = min(page_size, MAX_PAGE_SIZE)
+
+    try:
+        if page_token and not page_token.startswith('o:'):
+            message_ids, next_token = _list_message_ids(service, query, label_ids, page_size, page_token)
+            return batch_get_messages(service, message_ids), next_token
+
+        offset = int(page_token[2:]) if page_token else 0
+        index = get_mail_index()
+        criteria = _local_criteria(service, index, query, label_ids) if index is not None else None
+        if criteria is not None:
+            # 한 건 더 읽어 다음 페이지가 있는지 확인
+            messages = index.search_messages(criteria, page_size + 1, offset)
+            if len(messages) > page_size:
+                index.stats['local_queries'] += 1
+                return messages[:page_size], f"o:{offset + page_size}"
+            if index.get_state('complete') == '1':
+                index.stats['local_queries'] += 1
+                return messages, None
+        if index is not None:
+            index.stats['remote_queries'] += 1
+
+        # 인덱스로 답할 수 없으면 offset이 있는 페이지까지 ID 목록만 넘긴 뒤 Gmail 페이지 토큰으로 이어감
+        next_token = None
+        for _ in range(offset // page_size):
+            _, next_token = _list_message_ids(service, query, label_ids, page_size, next_token)
+            if not next_token:
+                return [], None
+        message_ids, next_token = _list_message_ids(service, query, label_ids, page_size, next_token)
+        return batch_get_messages(service, message_ids[offset % page_size:]), next_token
+
+    except HttpError as error:
+        print(f'이메일 목록 조회 중 오류 발생: {error}')
+        return [], None
+# --- 페이지 단위 조회 --- END
+
 def list_emails(service, max_results=10, query=None, label_ids=None):
     """
     Gmail에서 이메일 목록을 조회합니다.
     
     Args:
         service: 구글 Gmail API 서비스 객체
-        max_results: 최대 조회 결과 수 (기본값: 10)
+        max_results: 최대 조회 결과 수 (기본값: 10, 500을 넘으면 여러 페이지를 이어서 조회)
         query: 검색 쿼리 (선택)
         label_ids: 라벨 ID 목록 (선택, 기본값: ['INBOX'])
         
@@ -19,38 +725,114 @@ def list_emails(service, max_results=10, query=None, label_ids=None):
     if label_ids is None:
         label_ids = ['INBOX']
     
+    # 검색어가 없는 최근 메일 조회는 동기화된 로컬 인덱스에서 처리
+    # (인덱스가 최근 메시지 일부만 가지고 있어 결과가 모자라면 API로 조회)
+    index = get_mail_index() if query is None else None
+    if index is not None and sync_mailbox(service, index, background=True):
+        messages = index.list_messages(label_ids, max_results)
+        if len(messages) >= max_results or index.get_state('complete') == '1':
+            index.stats['local_queries'] += 1
+            return messages
+    if index is not None:
+        index.stats['remote_queries'] += 1
+    
     try:
-        # 이메일 목록 조회
-        result = service.users().messages().list(
-            userId='me',
-            labelIds=label_ids,
-            q=query,
-            maxResults=max_results
-        ).execute()
-        
-        messages = result.get('messages', [])
-        
-        # 각 이메일의 상세 정보 조회
-        detailed_messages = []
-        for message in messages:
-            msg = service.users().messages().get(
-                userId='me', 
-                id=message['id'],
-                format='metadata',
-                metadataHeaders=['From', 'Subject', 'Date']
-            ).execute()
-            
-            detailed_messages.append(msg)
-        
-        return detailed_messages
+        # 이메일 목록을 페이지 단위로 조회 (페이지마다 상세 정보는 batch 요청으로 조회)
+        return list(iter_emails(service, query=query, label_ids=label_ids,
+                                page_size=min(max_results, MAX_PAGE_SIZE), limit=max_results))
     
     except HttpError as error:
         print(f'이메일 목록 조회 중 오류 발생: {error}')
         return []
 
+# 로컬 검색에서 지원하는 is:/in: 값 -> (가져야 하는 라벨, 없어야 하는 라벨)
+SEARCH_LABEL_OPERATORS = {
+    ('is', 'unread'): ('UNREAD', None),
+    ('is', 'read'): (None, 'UNREAD'),
+    ('is', 'starred'): ('STARRED', None),
+    ('is', 'important'): ('IMPORTANT', None),
+    ('in', 'inbox'): ('INBOX', None),
+    ('in', 'sent'): ('SENT', None),
+}
+SEARCH_TERM_RE = re.compile(r'(\w+):("[^"]*"|\S+)|"([^"]*)"|(\S+)')
+
+def _parse_search_date(value):
+    """after:/before: 값(YYYY/MM/DD, YYYY-MM-DD 또는 epoch 초)을 epoch 밀리초로 변환합니다."""
+    if value.isdigit():
+        return int(value) * 1000
+    for date_format in ('%Y/%m/%d', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(value, date_format).timestamp() * 1000)
+        except ValueError:
+            continue
+    return None
+
+def parse_search_query(query):
+    """
+    Gmail 검색어를 로컬 인덱스 검색 조건으로 변환합니다.
+    지원: 일반 검색어/"구문", from:, subject:, after:, before:, is:unread/read/starred/important, in:inbox/sent
+    
+    Args:
+        query: Gmail 검색 쿼리
+        
+    Returns:
+        criteria: MailIndex.search_messages 조건 (지원하지 않는 연산자가 있으면 None)
+    """
+    criteria = {'fts': [], 'labels': [], 'exclude_labels': ['SPAM', 'TRASH'], 'after': None, 'before': None, 'free_text': False}
+    for operator, operand, phrase, word in SEARCH_TERM_RE.findall(query or ""):
+        if operator:
+            operator = operator.lower()
+            operand = operand.strip('"')
+            if operator in ('from', 'subject'):
+                fts_phrase = _fts_phrase(operand)
+                if fts_phrase is None:
+                    return None
+                criteria['fts'].append(f"{'sender' if operator == 'from' else 'subject'} : {fts_phrase}")
+            elif operator in ('after', 'before'):
+                timestamp = _parse_search_date(operand)
+                if timestamp is None:
+                    return None
+                criteria[operator] = timestamp
+            elif (operator, operand.lower()) in SEARCH_LABEL_OPERATORS:
+                include, exclude = SEARCH_LABEL_OPERATORS[(operator, operand.lower())]
+                if include:
+                    criteria['labels'].append(include)
+                if exclude:
+                    criteria['exclude_labels'].append(exclude)
+            else:
+                return None
+            continue
+
+        text = phrase if phrase else word
+        # OR, 제외(-), 그룹({ }, ( )) 등 불리언 연산은 Gmail에 맡김
+        if text in ('OR', 'AND') or text.startswith(('-', '{', '(')) or text.endswith((')', '}')):
+            return None
+        fts_phrase = _fts_phrase(text)
+        if fts_phrase is None:
+            continue
+        criteria['fts'].append(fts_phrase)
+        criteria['free_text'] = True
+    return criteria
+
+def _search_local(service, index, query, max_results):
+    """
+    로컬 인덱스에서 검색합니다. 인덱스로 정확히 답할 수 없으면 None을 반환합니다.
+    (지원하지 않는 연산자, 동기화 실패, 본문 미색인 상태의 일반 검색어, 일부만 동기화된 인덱스에서 결과가 모자란 경우)
+    """
+    # 원격 검색과 같이 받은편지함으로 한정
+    criteria = _local_criteria(service, index, query, ['INBOX'])
+    if criteria is None:
+        return None
+    messages = index.search_messages(criteria, max_results)
+    # 인덱스는 최신 메일부터 보관하므로 결과가 max_results개면 원격 검색과 같은 상위 결과
+    if len(messages) < max_results and index.get_state('complete') != '1':
+        return None
+    return messages
+
 def search_emails(service, query, max_results=10):
     """
     Gmail에서 특정 쿼리로 이메일을 검색합니다.
+    동기화된 로컬 인덱스로 답할 수 있으면 API를 호출하지 않고, 그렇지 않으면 Gmail 검색(q=)을 사용합니다.
     
     Args:
         service: 구글 Gmail API 서비스 객체
@@ -60,8 +842,145 @@ def search_emails(service, query, max_results=10):
     Returns:
         messages: 검색된 이메일 목록
     """
+    index = get_mail_index()
+    if index is not None:
+        try:
+            messages = _search_local(service, index, query, max_results)
+        except sqlite3.Error as error:
+            print(f'로컬 메일 검색 중 오류 발생: {error}')
+            messages = None
+        if messages is not None:
+            index.stats['local_searches'] += 1
+            return messages
+        index.stats['remote_searches'] += 1
     return list_emails(service, max_results=max_results, query=query)
 
+def _has_body(payload):
+    """full 형식 payload인지(본문 데이터나 하위 파트가 있는지) 확인합니다."""
+    return 'parts' in payload or 'data' in payload.get('body', {})
+
+def _part_headers(part):
+    return {header['name'].lower(): header['value'] for header in part.get('headers', [])}
+
+def _part_charset(part):
+    """파트의 Content-Type 헤더에 지정된 charset을 반환합니다. (없거나 알 수 없으면 None)"""
+    match = CHARSET_RE.search(_part_headers(part).get('content-type', ''))
+    if not match:
+        return None
+    charset = match.group(1).strip('"\'')
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+def _is_attachment(part):
+    """첨부 파일 파트인지 확인합니다. (파일 이름, attachmentId, Content-Disposition: attachment)"""
+    disposition = _part_headers(part).get('content-disposition', '').lower()
+    return bool(part.get('filename')) or 'attachmentId' in part.get('body', {}) or disposition.startswith('attachment')
+
+def _decode_part(part, max_bytes):
+    """
+    텍스트 파트의 본문 데이터를 max_bytes 바이트까지만 base64 디코딩해 문자열로 변환합니다.
+
+    Returns:
+        (text, decoded_bytes, truncated)
+    """
+    data = part['body']['data']
+    # base64 4글자가 3바이트이므로 필요한 앞부분만 디코딩
+    padding = 2 if data.endswith('==') else 1 if data.endswith('=') else 0
+    truncated = (len(data) - padding) * 3 // 4 > max_bytes
+    if truncated:
+        data = data[:-(-max_bytes // 3) * 4]
+    raw = base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))[:max_bytes]
+
+    charset = _part_charset(part)
+    if charset is None:
+        try:
+            raw.decode('utf-8')
+            charset = 'utf-8'
+        except UnicodeDecodeError as error:
+            # 잘린 끝부분의 불완전한 UTF-8 문자는 무시하고, 그 밖의 오류는 인코딩 추정
+            if truncated and error.start >= len(raw) - 3:
+                charset = 'utf-8'
+            elif charset_normalizer is not None:
+                best = charset_normalizer.from_bytes(raw).best()
+                charset = best.encoding if best is not None else 'utf-8'
+            else:
+                charset = 'utf-8'
+    # 증분 디코더로 잘린 끝부분의 불완전한 멀티바이트 문자를 버림
+    decoder = codecs.getincrementaldecoder(charset)(errors='replace')
+    return decoder.decode(raw, final=not truncated), len(raw), truncated
+
+def _collect_text_parts(payload, prefer_html=False, include_attachments=False):
+    """
+    본문으로 쓸 텍스트 파트를 문서 순서대로 반환합니다.
+    multipart/alternative에서는 선호하는 형식(text/plain 또는 text/html) 하나만 고릅니다.
+    """
+    preferred = 'text/html' if prefer_html else 'text/plain'
+    selected = []
+    pending = deque([payload])
+    while pending:
+        part = pending.popleft()
+        mime_type = part.get('mimeType', '').lower()
+        children = part.get('parts')
+        if children:
+            if mime_type == 'multipart/alternative':
+                # 선호 형식이 있으면 그것을, 없으면 마지막(가장 풍부한) 대안을 사용
+                children = [next((child for child in children if child.get('mimeType', '').lower() == preferred), children[-1])]
+            # 문서 순서를 유지하도록 하위 파트를 앞쪽에 끼워 넣음
+            pending.extendleft(reversed(children))
+            continue
+        if 'data' not in part.get('body', {}):
+            continue
+        if _is_attachment(part) and not include_attachments:
+            continue
+        # 첨부 파일을 포함하더라도 텍스트가 아닌 파트(이미지 등)는 디코딩하지 않음
+        if mime_type and not mime_type.startswith('text/'):
+            continue
+        selected.append(part)
+    return selected
+
+def decode_body(payload, max_bytes=None, prefer_html=False, include_attachments=False):
+    """
+    메시지 payload에서 본문 텍스트를 추출합니다.
+
+    Returns:
+        (body, truncated): 본문 텍스트와 max_bytes에서 잘렸는지 여부
+    """
+    remaining = BODY_MAX_BYTES if max_bytes is None else max_bytes
+    chunks = []
+    truncated = False
+    for part in _collect_text_parts(payload, prefer_html, include_attachments):
+        if remaining <= 0:
+            truncated = True
+            break
+        text, decoded_bytes, part_truncated = _decode_part(part, remaining)
+        chunks.append(text)
+        remaining -= decoded_bytes
+        if part_truncated:
+            truncated = True
+            break
+    return "".join(chunks), truncated
+
+def extract_body(payload, max_bytes=None, prefer_html=False, include_attachments=False):
+    """
+    메시지 payload에서 본문 텍스트를 추출합니다.
+    text/plain과 text/html 대안이 함께 있으면 하나만 사용하고, 첨부 파일은 건너뜁니다.
+    
+    Args:
+        payload: Gmail API full 형식 메시지의 payload
+        max_bytes: 디코딩할 최대 본문 크기(바이트) (기본값: BODY_MAX_BYTES, 넘으면 잘라내고 표시를 덧붙임)
+        prefer_html: True이면 multipart/alternative에서 text/html을 사용 (기본값: text/plain)
+        include_attachments: True이면 텍스트 첨부 파일도 본문에 포함
+        
+    Returns:
+        body: 본문 텍스트
+    """
+    body, truncated = decode_body(payload, max_bytes, prefer_html, include_attachments)
+    if truncated:
+        body += BODY_TRUNCATED_MARKER
+    return body
+
 def get_email_content(service, msg_id):
     """
     특정 이메일의 내용을 조회합니다.
@@ -82,18 +1001,12 @@ def get_email_content(service, msg_id):
             headers[header['name']] = header['value']
         
         # 이메일 본문 추출
-        parts = [message['payload']]
-        body = ""
-        
-        while parts:
-            part = parts.pop(0)
-            
-            if 'parts' in part:
-                parts.extend(part['parts'])
-            
-            if 'body' in part and 'data' in part['body']:
-                body_data = part['body']['data']
-                body += base64.urlsafe_b64decode(body_data).decode('utf-8')
+        body = extract_body(message['payload'])
+        
+        # 열어 본 메일의 본문은 전문 검색 인덱스에도 반영
+        index = get_mail_index()
+        if index is not None:
+            index.set_body(msg_id, body)
         
         return {
             'id': message['id'],
@@ -153,6 +1066,11 @@ def send_email(service, to, subject, body, cc=None, bcc=None, html=False):
             body={'raw': raw_message}
         ).execute()
         
+        # 다음 조회 때 보낸 메일이 인덱스에 바로 반영되도록 동기화 주기를 초기화
+        index = get_mail_index()
+        if index is not None:
+            index.set_state(last_sync_at=0)
+        
         return sent_message
     
     except HttpError as error:
@@ -188,6 +1106,11 @@ def modify_email_labels(service, msg_id, add_labels=None, remove_labels=None):
             }
         ).execute()
         
+        # 응답의 labelIds(변경 후 전체 라벨)로 로컬 인덱스도 바로 갱신
+        index = get_mail_index()
+        if index is not None and 'labelIds' in modified_message:
+            index.set_labels(msg_id, modified_message['labelIds'])
+        
         return modified_message
     
     except HttpError as error:
@@ -1,9 +1,26 @@
+import asyncio
+import json
 import os
 import pickle
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from urllib.parse import urlsplit
 from google_auth_oauthlib.flow import Flow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.http import build_http
+from metrics import register_cache_stats
+from tracing import get_tracer
+
+try:
+    import fcntl  # 프로세스 간 토큰 갱신 잠금 (Windows에서는 프로세스 내 잠금만 사용)
+except ImportError:
+    fcntl = None
 
 # 인증 관련 상수 정의
 SCOPES = [
@@ -14,6 +31,31 @@ SCOPES = [
     'https://www.googleapis.com/auth/calendar.events'
 ]
 TOKEN_FILE = 'token.pickle'
+# 만료 이 시간(초) 전부터 토큰을 미리 갱신
+REFRESH_MARGIN = int(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+
+# 프로세스 단위 인증 정보/서비스 캐시 (앱의 폼과 GSuite MCP 서버가 함께 사용하는 서비스 레지스트리)
+# token_path -> (토큰 파일 mtime, credentials)
+_credentials_cache = {}
+# (서비스 종류, token_path) -> (credentials, service)
+_service_cache = {}
+# (API 이름, 버전) -> 파싱한 디스커버리 문서
+_discovery_docs = {}
+# token_path -> (credentials, 계정 이메일)
+_account_cache = {}
+_cache_stats = {
+    'credentials_hits': 0,
+    'credentials_misses': 0,
+    'service_hits': 0,
+    'service_misses': 0,
+    'discovery_loads': 0,
+    'token_refreshes': 0,
+    'token_refresh_coalesced': 0,
+    'token_refresh_failures': 0,
+}
+_cache_lock = threading.RLock()  # 서비스 생성 중 디스커버리 문서 캐시도 같은 잠금을 사용
+# 토큰 갱신은 한 번에 하나만 수행 (기다린 호출은 갱신된 토큰 파일을 다시 읽어 사용)
+_refresh_lock = threading.Lock()
 
 def create_oauth_flow(redirect_uri):
     """OAuth 인증 흐름 생성"""
@@ -47,44 +89,282 @@ def fetch_token(flow, code):
     flow.fetch_token(code=code)
     return flow.credentials
 
-def save_credentials(credentials, user_id=None):
-    """사용자 인증 정보 저장"""
-    token_path = Path(TOKEN_FILE)
+def get_token_path(user_id=None):
+    """사용자별 토큰 파일 경로 반환"""
     if user_id:
-        token_path = Path(f"token_{user_id}.pickle")
+        return Path(f"token_{user_id}.pickle")
+    return Path(TOKEN_FILE)
+
+def save_credentials(credentials, user_id=None):
+    """사용자 인증 정보 저장 (임시 파일에 쓴 뒤 교체하므로 읽는 쪽이 쓰다 만 파일을 보지 않음)"""
+    token_path = get_token_path(user_id)
     
-    with open(token_path, 'wb') as token:
-        pickle.dump(credentials, token)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{token_path.name}.", dir=token_path.parent)
+    try:
+        with os.fdopen(fd, 'wb') as token:
+            pickle.dump(credentials, token)
+            token.flush()
+            os.fsync(token.fileno())
+        os.replace(tmp_path, token_path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
     
     return token_path
 
-def load_credentials(user_id=None):
-    """저장된 인증 정보 불러오기"""
-    token_path = Path(TOKEN_FILE)
-    if user_id:
-        token_path = Path(f"token_{user_id}.pickle")
-    
-    credentials = None
-    if token_path.exists():
-        with open(token_path, 'rb') as token:
-            credentials = pickle.load(token)
+def _read_credentials(token_path):
+    if not token_path.exists():
+        return None
+    with open(token_path, 'rb') as token:
+        return pickle.load(token)
+
+def needs_refresh(credentials):
+    """만료되었거나 REFRESH_MARGIN초 안에 만료되는 갱신 가능한 토큰인지 확인"""
+    if credentials is None or not credentials.refresh_token:
+        return False
+    if credentials.expired or credentials.expiry is None:
+        return credentials.expired
+    # google-auth의 expiry는 UTC 기준 naive datetime
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return credentials.expiry - timedelta(seconds=REFRESH_MARGIN) <= now
+
+class _TokenFileLock:
+    """토큰 파일 옆의 .lock 파일로 앱과 MCP 서버 프로세스 사이의 동시 갱신을 막습니다. (fcntl이 없으면 아무 일도 하지 않음)"""
+
+    def __init__(self, token_path):
+        self.lock_path = Path(f"{token_path}.lock")
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.lock_path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+def refresh_credentials(credentials, user_id=None):
+    """
+    토큰을 갱신해 저장하고 갱신된 인증 정보를 반환합니다.
     
-    # 토큰이 만료되었으면 갱신
-    if credentials and credentials.expired and credentials.refresh_token:
-        credentials.refresh(Request())
+    스레드/프로세스 잠금 안에서 토큰 파일을 다시 읽어, 기다리는 동안 다른 호출이 이미 갱신했으면 그 토큰을 그대로 사용합니다.
+    (동시에 여러 도구 호출이 만료를 발견해도 실제 갱신 요청은 한 번)
+    아직 만료되지 않은 토큰의 사전 갱신이 실패하면 기존 토큰을 반환합니다.
+    """
+    token_path = get_token_path(user_id)
+    with _refresh_lock, _TokenFileLock(token_path):
+        current = _read_credentials(token_path)
+        if current is not None and not needs_refresh(current):
+            with _cache_lock:
+                _cache_stats['token_refresh_coalesced'] += 1
+            return current
+        credentials = current or credentials
+        try:
+            credentials.refresh(Request())
+        except Exception as e:
+            with _cache_lock:
+                _cache_stats['token_refresh_failures'] += 1
+            if credentials.expired:
+                raise
+            print(f"ERROR (google_auth): 토큰 사전 갱신 실패, 만료 전까지 기존 토큰을 사용합니다: {e}", file=sys.stderr)
+            return credentials
         save_credentials(credentials, user_id)
+        with _cache_lock:
+            _cache_stats['token_refreshes'] += 1
+        return credentials
+
+def load_credentials(user_id=None):
+    """저장된 인증 정보 불러오기 (만료되었거나 곧 만료되면 갱신)"""
+    credentials = _read_credentials(get_token_path(user_id))
+    
+    if needs_refresh(credentials):
+        credentials = refresh_credentials(credentials, user_id)
     
     return credentials
 
+# --- 디스커버리 문서 기반 서비스 생성 --- START
+class _ThreadLocalHttp:
+    """
+    스레드마다 별도의 httplib2.Http를 사용하는 전송 객체.
+    httplib2.Http는 스레드 안전하지 않으므로, 서비스 객체 하나를 여러 스레드(Streamlit 세션, MCP 도구 호출)가 공유할 수 있도록
+    요청을 현재 스레드의 Http로 보냅니다.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = build_http()
+        return http
+
+    def request(self, uri, method="GET", *args, **kwargs):
+        # Google API 호출마다 추적 구간 기록 (배치 요청은 한 구간)
+        url = urlsplit(uri)
+        with get_tracer().start_span(f"{method} {url.hostname}", "http", path=url.path) as span:
+            response, content = self._http().request(uri, method, *args, **kwargs)
+            span.set_attribute("status_code", response.status)
+            if response.status >= 500:
+                span.set_error(f"HTTP {response.status}")
+            return response, content
+
+    def __getattr__(self, name):
+        # timeout, redirect_codes, connections 등은 현재 스레드의 Http 값을 사용
+        return getattr(self._http(), name)
+
+def _get_discovery_doc(api, version):
+    """
+    google-api-python-client에 포함된 정적 디스커버리 문서를 프로세스에서 한 번만 읽고 파싱해 반환합니다.
+    (포함되지 않은 API이면 None)
+    """
+    key = (api, version)
+    with _cache_lock:
+        if key not in _discovery_docs:
+            content = discovery_cache.get_static_doc(api, version)
+            _discovery_docs[key] = json.loads(content) if content else None
+            _cache_stats['discovery_loads'] += 1
+        return _discovery_docs[key]
+
+def _build_service(api, version, credentials):
+    doc = _get_discovery_doc(api, version)
+    if doc is None:
+        print(f"DEBUG (google_auth): {api} {version} 정적 디스커버리 문서가 없어 build()로 생성합니다.", file=sys.stderr)
+        return build(api, version, credentials=credentials)
+    # 파싱한 문서를 재사용하므로 서비스 생성 시 네트워크 요청이나 JSON 파싱이 없음
+    return build_from_document(doc, http=AuthorizedHttp(credentials, http=_ThreadLocalHttp()))
+
 def build_gmail_service(credentials):
     """Gmail API 서비스 생성"""
-    return build('gmail', 'v1', credentials=credentials)
+    return _build_service('gmail', 'v1', credentials)
 
 def build_calendar_service(credentials):
     """Calendar API 서비스 생성"""
-    return build('calendar', 'v3', credentials=credentials)
+    return _build_service('calendar', 'v3', credentials)
+# --- 디스커버리 문서 기반 서비스 생성 --- END
+
+def _token_mtime(token_path):
+    try:
+        return token_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def get_cached_credentials(user_id=None):
+    """
+    캐시된 인증 정보를 반환합니다.
+    
+    토큰 파일의 mtime이 바뀌었거나 인증 정보 갱신이 필요한 경우에만 파일을 다시 읽습니다.
+    갱신은 캐시 잠금 밖에서 하므로, 갱신 중에도 다른 스레드의 캐시 조회가 막히지 않습니다.
+    """
+    token_path = get_token_path(user_id)
+    
+    with _cache_lock:
+        mtime = _token_mtime(token_path)
+        if mtime is None:
+            # 토큰 파일이 삭제되었으면(연동 해제) 캐시도 비움
+            _credentials_cache.pop(token_path, None)
+            return None
+        
+        cached = _credentials_cache.get(token_path)
+        if cached and cached[0] == mtime and not needs_refresh(cached[1]):
+            _cache_stats['credentials_hits'] += 1
+            return cached[1]
+        
+        _cache_stats['credentials_misses'] += 1
+    
+    credentials = load_credentials(user_id)
+    if credentials:
+        with _cache_lock:
+            # 갱신 시 파일이 다시 저장되므로 mtime을 새로 읽음
+            mtime = _token_mtime(token_path)
+            cached = _credentials_cache.get(token_path)
+            # 기다리는 동안 다른 스레드가 같은 토큰 파일로 캐시를 채웠으면 그 객체를 사용 (서비스 재생성 방지)
+            if cached and cached[0] == mtime and not needs_refresh(cached[1]):
+                return cached[1]
+            _credentials_cache[token_path] = (mtime, credentials)
+    return credentials
+
+def _get_cached_service(kind, builder, user_id=None):
+    credentials = get_cached_credentials(user_id)
+    if not credentials:
+        return None
+    
+    key = (kind, get_token_path(user_id))
+    with _cache_lock:
+        cached = _service_cache.get(key)
+        # 인증 정보 객체가 그대로면(파일 변경/갱신 없음) 기존 서비스 재사용
+        if cached and cached[0] is credentials:
+            _cache_stats['service_hits'] += 1
+            return cached[1]
+        
+        _cache_stats['service_misses'] += 1
+        service = builder(credentials)
+        _service_cache[key] = (credentials, service)
+        return service
+
+def get_gmail_service(user_id=None):
+    """캐시된 Gmail API 서비스 반환 (인증 정보가 없으면 None)"""
+    return _get_cached_service('gmail', build_gmail_service, user_id)
+
+def get_calendar_service(user_id=None):
+    """캐시된 Calendar API 서비스 반환 (인증 정보가 없으면 None)"""
+    return _get_cached_service('calendar', build_calendar_service, user_id)
+
+def get_account_email(user_id=None):
+    """
+    인증된 Google 계정의 이메일 주소를 반환합니다. (인증 정보가 바뀌기 전까지 캐시, 인증되지 않았거나 조회에 실패하면 None)
+    저장된 대화를 이어갈 때 대화의 소유자를 확인하는 데 사용합니다.
+    """
+    credentials = get_cached_credentials(user_id)
+    if not credentials:
+        return None
+    token_path = get_token_path(user_id)
+    with _cache_lock:
+        cached = _account_cache.get(token_path)
+        if cached and cached[0] is credentials:
+            return cached[1]
+    try:
+        email = get_gmail_service(user_id).users().getProfile(userId='me').execute().get('emailAddress')
+    except Exception as e:
+        print(f"ERROR (google_auth): 계정 정보를 조회하지 못했습니다: {e}", file=sys.stderr)
+        return None
+    with _cache_lock:
+        _account_cache[token_path] = (credentials, email)
+    return email
+
+async def get_gmail_service_async(user_id=None):
+    """get_gmail_service의 비동기 버전 (토큰 파일 읽기/갱신을 이벤트 루프 밖의 스레드에서 수행)"""
+    return await asyncio.to_thread(get_gmail_service, user_id)
+
+async def get_calendar_service_async(user_id=None):
+    """get_calendar_service의 비동기 버전 (토큰 파일 읽기/갱신을 이벤트 루프 밖의 스레드에서 수행)"""
+    return await asyncio.to_thread(get_calendar_service, user_id)
+
+def get_cache_stats():
+    """인증 정보/서비스 캐시 적중 통계 반환"""
+    with _cache_lock:
+        return dict(_cache_stats)
+
+# 인증 정보/서비스 캐시 적중률을 지표(/metrics)에 포함
+register_cache_stats("google_credentials", lambda: {
+    "hits": _cache_stats['credentials_hits'], "misses": _cache_stats['credentials_misses'],
+})
+register_cache_stats("google_services", lambda: {
+    "hits": _cache_stats['service_hits'], "misses": _cache_stats['service_misses'],
+})
+
+def clear_service_cache():
+    """캐시된 인증 정보와 서비스를 모두 비움 (디스커버리 문서는 유지)"""
+    with _cache_lock:
+        _credentials_cache.clear()
+        _service_cache.clear()
+        _account_cache.clear()
 
 def is_authenticated(user_id=None):
     """사용자 인증 여부 확인"""
-    credentials = load_credentials(user_id)
+    credentials = get_cached_credentials(user_id)
     return credentials is not None and not (credentials.expired and not credentials.refresh_token)
@@ -1,100 +1,144 @@
 from mcp.server.fastmcp import FastMCP
+import asyncio
 import os
 from google_auth import (
     create_oauth_flow, get_authorization_url, fetch_token, 
     save_credentials, load_credentials, is_authenticated,
-    build_gmail_service, build_calendar_service
+    get_gmail_service_async, get_calendar_service_async, get_cache_stats
 )
 from gmail_utils import (
     list_emails, search_emails, get_email_content, 
-    send_email, modify_email_labels, format_email_for_display
+    send_email, modify_email_labels, format_email_for_display,
+    get_index_stats, list_emails_page
 )
 from calendar_utils import (
     list_upcoming_events, create_calendar_event, 
-    format_event_for_display
+    format_event_for_display, get_store_stats, list_events_page
 )
 import json
 from datetime import datetime
+from mcp_config import MCP_BIND_HOST, MCP_TRANSPORT, get_metrics_port, get_server_port
+from metrics import instrument_tool, start_metrics_server
+from tracing import traced
 
 # Initialize FastMCP server with configuration
 mcp = FastMCP(
     "GSuite",  # Name of the MCP server
     instructions="Google Workspace 도구를 사용하여 Gmail과 캘린더를 관리할 수 있습니다.",
-    host="0.0.0.0",
-    port=8006,
+    host=MCP_BIND_HOST,
+    port=get_server_port("gsuite"),
 )
 
+# --- 도구 응답 형식 --- START
+# json: 압축 JSON 레코드 (앱이 직접 표시하고, LLM에 돌려주는 토큰 수를 줄임), text: 기존 표시용 문자열
+TOOL_OUTPUT_FORMAT = os.getenv("GSUITE_TOOL_OUTPUT", "json").lower()
+EMAIL_FIELDS = ["id", "from", "subject", "date", "snippet"]  # fields를 지정하지 않을 때 반환할 이메일 필드
+EVENT_FIELDS = ["id", "summary", "start", "location", "description"]  # fields를 지정하지 않을 때 반환할 일정 필드
+
+def _project(record, fields, default_fields):
+    """레코드에서 요청한 필드만 남깁니다. (fields는 쉼표 구분 문자열, id는 항상 포함, 없는 필드는 생략)"""
+    selected = [field.strip() for field in fields.split(',') if field.strip()] if fields else default_fields
+    if 'id' not in selected:
+        selected = ['id'] + selected
+    return {field: record[field] for field in selected if field in record}
+
+def _json_page(items, next_cursor=None, **extra):
+    """레코드 목록을 한 번의 직렬화로 압축 JSON 응답 문자열로 만듭니다."""
+    result = {"status": "success", **extra, "count": len(items), "items": items}
+    if next_cursor:
+        result["next_cursor"] = next_cursor
+    return json.dumps(result, ensure_ascii=False, separators=(',', ':'))
+# --- 도구 응답 형식 --- END
+
 # Gmail 관련 도구
+def _format_email_page(title, emails, next_cursor):
+    """이메일 한 페이지를 도구 응답 문자열로 만듭니다. (다음 페이지가 있으면 커서를 덧붙임)"""
+    parts = [title]
+    for email in emails:
+        formatted = format_email_for_display(email)
+        parts.append(
+            f"제목: {formatted['subject']}\n"
+            f"발신자: {formatted['from']}\n"
+            f"날짜: {formatted['date']}\n"
+            f"내용 미리보기: {formatted['snippet']}\n"
+            f"ID: {formatted['id']}\n"
+            + "-" * 50 + "\n"
+        )
+    if next_cursor:
+        parts.append(f"\n다음 페이지 커서: {next_cursor} (이어서 보려면 같은 인수와 함께 cursor로 전달)\n")
+    return "".join(parts)
+
 @mcp.tool()
-async def list_emails_tool(max_results: int = 10, label_ids: str = "INBOX") -> str:
+@instrument_tool()
+@traced(kind="tool")
+async def list_emails_tool(max_results: int = 10, label_ids: str = "INBOX", cursor: str = "", fields: str = "") -> str:
     """
     Gmail 받은편지함에서 최근 이메일 목록을 조회합니다.
+    결과는 JSON({"status", "count", "items", "next_cursor"})이며, next_cursor가 있으면 cursor로 전달해 다음 페이지를 조회할 수 있습니다.
     
     Args:
-        max_results: 조회할 최대 이메일 수 (기본값: 10)
+        max_results: 한 페이지에 조회할 최대 이메일 수 (기본값: 10, 최대 500)
         label_ids: 조회할 라벨 ID (기본값: "INBOX", 쉼표로 구분하여 여러 개 지정 가능)
+        cursor: 이전 응답의 next_cursor (첫 페이지는 비워 둠)
+        fields: 반환할 필드 (쉼표 구분, 기본값: id,from,subject,date,snippet / 그 밖에 to, threadId, labels)
         
     Returns:
         str: 이메일 목록 정보
     """
-    credentials = load_credentials()
-    if not credentials:
+    service = await get_gmail_service_async()
+    if not service:
         return "Google 계정 인증이 필요합니다."
-    
-    service = build_gmail_service(credentials)
     label_id_list = label_ids.split(',')
-    emails = list_emails(service, max_results=max_results, label_ids=label_id_list)
+    # Gmail API 호출과 인덱스 동기화는 블로킹 작업이므로 이벤트 루프 밖의 스레드에서 실행 (동시 도구 호출이 서로 기다리지 않도록)
+    emails, next_cursor = await asyncio.to_thread(
+        list_emails_page, service, page_size=max_results, page_token=cursor or None, label_ids=label_id_list
+    )
+    
+    if TOOL_OUTPUT_FORMAT == "json":
+        items = [_project(format_email_for_display(email), fields, EMAIL_FIELDS) for email in emails]
+        return _json_page(items, next_cursor, **({} if items else {"message": "조회된 이메일이 없습니다."}))
     
     if not emails:
         return "조회된 이메일이 없습니다."
     
-    result = "이메일 목록:\n\n"
-    for email in emails:
-        formatted = format_email_for_display(email)
-        result += f"제목: {formatted['subject']}\n"
-        result += f"발신자: {formatted['from']}\n"
-        result += f"날짜: {formatted['date']}\n"
-        result += f"내용 미리보기: {formatted['snippet']}\n"
-        result += f"ID: {formatted['id']}\n"
-        result += "-" * 50 + "\n"
-    
-    return result
+    return _format_email_page("이메일 목록:\n\n", emails, next_cursor)
 
 @mcp.tool()
-async def search_emails_tool(query: str, max_results: int = 10) -> str:
+@instrument_tool()
+@traced(kind="tool")
+async def search_emails_tool(query: str, max_results: int = 10, cursor: str = "", fields: str = "") -> str:
     """
     Gmail에서 특정 쿼리로 이메일을 검색합니다.
+    결과는 JSON({"status", "query", "count", "items", "next_cursor"})이며, next_cursor가 있으면 cursor로 전달해 다음 페이지를 조회할 수 있습니다.
     
     Args:
         query: 검색 쿼리 (예: "from:example@gmail.com", "subject:안녕")
-        max_results: 조회할 최대 이메일 수 (기본값: 10)
+        max_results: 한 페이지에 조회할 최대 이메일 수 (기본값: 10, 최대 500)
+        cursor: 이전 응답의 next_cursor (첫 페이지는 비워 둠)
+        fields: 반환할 필드 (쉼표 구분, 기본값: id,from,subject,date,snippet / 그 밖에 to, threadId, labels)
         
     Returns:
         str: 검색된 이메일 목록 정보
     """
-    credentials = load_credentials()
-    if not credentials:
+    service = await get_gmail_service_async()
+    if not service:
         return "Google 계정 인증이 필요합니다."
+    emails, next_cursor = await asyncio.to_thread(
+        list_emails_page, service, page_size=max_results, page_token=cursor or None, query=query
+    )
     
-    service = build_gmail_service(credentials)
-    emails = search_emails(service, query=query, max_results=max_results)
+    if TOOL_OUTPUT_FORMAT == "json":
+        items = [_project(format_email_for_display(email), fields, EMAIL_FIELDS) for email in emails]
+        return _json_page(items, next_cursor, query=query, **({} if items else {"message": f"'{query}' 검색 결과가 없습니다."}))
     
     if not emails:
         return f"'{query}' 검색 결과가 없습니다."
     
-    result = f"'{query}' 검색 결과:\n\n"
-    for email in emails:
-        formatted = format_email_for_display(email)
-        result += f"제목: {formatted['subject']}\n"
-        result += f"발신자: {formatted['from']}\n"
-        result += f"날짜: {formatted['date']}\n"
-        result += f"내용 미리보기: {formatted['snippet']}\n"
-        result += f"ID: {formatted['id']}\n"
-        result += "-" * 50 + "\n"
-    
-    return result
+    return _format_email_page(f"'{query}' 검색 결과:\n\n", emails, next_cursor)
 
 @mcp.tool()
+@instrument_tool()
+@traced(kind="tool")
 async def send_email_tool(to: str = None, subject: str = None, body: str = None, cc: str = "", bcc: str = "", html: bool = False) -> str:
     """
     Gmail을 통해 이메일을 전송합니다. 필수 정보(to, subject, body)가 없으면 폼 요청 신호를 반환합니다.
@@ -125,18 +169,16 @@ async def send_email_tool(to: str = None, subject: str = None, body: str = None,
         })
     # --- 인수 검사 추가 --- END
 
-    credentials = load_credentials()
-    if not credentials:
+    service = await get_gmail_service_async()
+    if not service:
         return "Google 계정 인증이 필요합니다."
     
-    service = build_gmail_service(credentials)
-    
     to_list = [email.strip() for email in to.split(',') if email.strip()]
     cc_list = [email.strip() for email in cc.split(',') if email.strip()] if cc else None
     bcc_list = [email.strip() for email in bcc.split(',') if email.strip()] if bcc else None
     
     try: # API 호출 오류 처리 추가
-        sent_message = send_email(service, to_list, subject, body, cc=cc_list, bcc=bcc_list, html=html)
+        sent_message = await asyncio.to_thread(send_email, service, to_list, subject, body, cc=cc_list, bcc=bcc_list, html=html)
         if sent_message:
             return json.dumps({ # 성공 시에도 JSON 반환 고려 (일관성)
                 "status": "success",
@@ -149,6 +191,8 @@ async def send_email_tool(to: str = None, subject: str = None, body: str = None,
         return json.dumps({"status": "error", "message": f"이메일 전송 중 오류 발생: {str(e)}"})
 
 @mcp.tool()
+@instrument_tool()
+@traced(kind="tool")
 async def modify_email_tool(msg_id: str, action: str) -> str:
     """
     Gmail 이메일의 라벨을 수정합니다.
@@ -160,12 +204,10 @@ async def modify_email_tool(msg_id: str, action: str) -> str:
     Returns:
         str: 라벨 수정 결과
     """
-    credentials = load_credentials()
-    if not credentials:
+    service = await get_gmail_service_async()
+    if not service:
         return "Google 계정 인증이 필요합니다."
     
-    service = build_gmail_service(credentials)
-    
     add_labels = []
     remove_labels = []
     
@@ -183,7 +225,9 @@ async def modify_email_tool(msg_id: str, action: str) -> str:
     else:
         return f"지원하지 않는 작업입니다: {action}"
     
-    modified_message = modify_email_labels(service, msg_id, add_labels=add_labels, remove_labels=remove_labels)
+    modified_message = await asyncio.to_thread(
+        modify_email_labels, service, msg_id, add_labels=add_labels, remove_labels=remove_labels
+    )
     
     if modified_message:
         return f"이메일 라벨이 성공적으로 수정되었습니다. (ID: {modified_message['id']})"
@@ -192,44 +236,57 @@ async def modify_email_tool(msg_id: str, action: str) -> str:
 
 # 캘린더 관련 도구
 @mcp.tool()
-async def list_events_tool(max_results: int = 10) -> str:
+@instrument_tool()
+@traced(kind="tool")
+async def list_events_tool(max_results: int = 10, cursor: str = "", fields: str = "") -> str:
     """
     Google 캘린더에서 다가오는 일정을 조회합니다.
+    결과는 JSON({"status", "count", "items", "next_cursor"})이며, next_cursor가 있으면 cursor로 전달해 다음 페이지를 조회할 수 있습니다.
     
     Args:
-        max_results: 조회할 최대 일정 수 (기본값: 10)
+        max_results: 한 페이지에 조회할 최대 일정 수 (기본값: 10, 최대 2500)
+        cursor: 이전 응답의 next_cursor (첫 페이지는 비워 둠)
+        fields: 반환할 필드 (쉼표 구분, 기본값: id,summary,start,location,description / 그 밖에 link, attendees)
         
     Returns:
         str: 일정 목록 정보
     """
-    credentials = load_credentials()
-    if not credentials:
+    service = await get_calendar_service_async()
+    if not service:
         return "Google 계정 인증이 필요합니다."
+    # Calendar API 호출과 저장소 동기화는 블로킹 작업이므로 이벤트 루프 밖의 스레드에서 실행
+    events, next_cursor = await asyncio.to_thread(list_events_page, service, page_size=max_results, page_token=cursor or None)
     
-    service = build_calendar_service(credentials)
-    events = list_upcoming_events(service, max_results=max_results)
+    if TOOL_OUTPUT_FORMAT == "json":
+        items = [_project(format_event_for_display(event), fields, EVENT_FIELDS) for event in events]
+        return _json_page(items, next_cursor, **({} if items else {"message": "다가오는 일정이 없습니다."}))
     
     if not events:
         return "다가오는 일정이 없습니다."
     
-    result = "다가오는 일정 목록:\n\n"
+    parts = ["다가오는 일정 목록:\n\n"]
     for event in events:
         formatted = format_event_for_display(event)
-        result += f"제목: {formatted['summary']}\n"
-        result += f"시작: {formatted['start']}\n"
+        part = f"제목: {formatted['summary']}\n"
+        part += f"시작: {formatted['start']}\n"
         
         if 'location' in formatted:
-            result += f"장소: {formatted['location']}\n"
+            part += f"장소: {formatted['location']}\n"
         
         if 'description' in formatted:
-            result += f"설명: {formatted['description']}\n"
+            part += f"설명: {formatted['description']}\n"
         
-        result += f"ID: {formatted['id']}\n"
-        result += "-" * 50 + "\n"
+        part += f"ID: {formatted['id']}\n"
+        part += "-" * 50 + "\n"
+        parts.append(part)
     
-    return result
+    if next_cursor:
+        parts.append(f"\n다음 페이지 커서: {next_cursor} (이어서 보려면 cursor로 전달)\n")
+    return "".join(parts)
 
 @mcp.tool()
+@instrument_tool()
+@traced(kind="tool")
 async def create_event_tool(summary: str = None, start_datetime: str = None, end_datetime: str = None, 
                            location: str = "", description: str = "", attendees: str = "") -> str:
     """
@@ -261,12 +318,10 @@ async def create_event_tool(summary: str = None, start_datetime: str = None, end
         })
     # --- 인수 검사 추가 --- END
 
-    credentials = load_credentials()
-    if not credentials:
+    service = await get_calendar_service_async()
+    if not service:
         return "Google 계정 인증이 필요합니다." # 이 경우는 JSON 아님
     
-    service = build_calendar_service(credentials)
-    
     try:
         start_time = datetime.strptime(start_datetime, "%Y-%m-%d %H:%M")
         end_time = datetime.strptime(end_datetime, "%Y-%m-%d %H:%M")
@@ -276,7 +331,8 @@ async def create_event_tool(summary: str = None, start_datetime: str = None, end
     attendee_list = [email.strip() for email in attendees.split(',') if email.strip()] if attendees else None
     
     try: # API 호출 오류 처리 추가
-        event = create_calendar_event(
+        event = await asyncio.to_thread(
+            create_calendar_event,
             service, 
             summary=summary, 
             location=location, 
@@ -296,9 +352,30 @@ async def create_event_tool(summary: str = None, start_datetime: str = None, end
         print(f"ERROR (create_event_tool): {e}")
         return json.dumps({"status": "error", "message": f"일정 추가 중 오류 발생: {str(e)}"})
 
+# 로컬 메일 인덱스 상태 확인용 리소스 (도구가 아니므로 에이전트의 도구 목록에는 나타나지 않음)
+@mcp.resource("gsuite://gmail/index/stats")
+def gmail_index_stats() -> str:
+    """Gmail 로컬 인덱스의 동기화/조회 통계를 JSON 문자열로 반환합니다."""
+    return json.dumps(get_index_stats(), ensure_ascii=False)
+
+# 로컬 일정 저장소 상태 확인용 리소스
+@mcp.resource("gsuite://calendar/store/stats")
+def calendar_store_stats() -> str:
+    """캘린더 로컬 일정 저장소의 동기화/조회 통계를 JSON 문자열로 반환합니다."""
+    return json.dumps(get_store_stats(), ensure_ascii=False)
+
+# 공유 서비스 레지스트리(인증 정보/서비스/디스커버리 문서 캐시) 상태 확인용 리소스
+@mcp.resource("gsuite://services/stats")
+def service_registry_stats() -> str:
+    """인증 정보/서비스 캐시 적중 횟수와 디스커버리 문서 로드 횟수를 JSON 문자열로 반환합니다."""
+    return json.dumps(get_cache_stats(), ensure_ascii=False)
+
 if __name__ == "__main__":
     # Print a message indicating the server is starting
     print("GSuite MCP 서버가 실행 중입니다...")
+
+    # 도구 호출 수/처리 시간, 캐시 적중률 등 지표를 /metrics로 노출
+    start_metrics_server(get_metrics_port("gsuite"))
     
-    # Start the MCP server with stdio transport for local development
-    mcp.run(transport="stdio")
+    # Start the MCP server (MCP_TRANSPORT: 로컬 개발용 stdio 또는 독립 실행용 sse)
+    mcp.run(transport=MCP_TRANSPORT)
@@ -0,0 +1,261 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+try:
+    from tokenizers import Tokenizer  # langchain-upstage 의존성으로 함께 설치됨
+except ImportError:
+    Tokenizer = None
+
+# 대화 기록 압축 설정
+TOKEN_BUDGET = int(os.getenv("AGENT_HISTORY_TOKEN_BUDGET", "6000"))  # 모델에 보낼 프롬프트의 목표 토큰 수
+TOOL_RESULT_TOKENS = int(os.getenv("AGENT_STALE_TOOL_RESULT_TOKENS", "200"))  # 지난 턴의 도구 결과를 줄일 토큰 수
+KEEP_TURNS = int(os.getenv("AGENT_HISTORY_KEEP_TURNS", "2"))  # 그대로 유지할 최근 턴 수 (현재 턴 포함)
+SUMMARY_TOKENS = int(os.getenv("AGENT_HISTORY_SUMMARY_TOKENS", "500"))  # 생략한 턴 요약의 최대 토큰 수
+TOKENIZER_NAME = os.getenv("AGENT_TOKENIZER", "upstage/solar-pro-tokenizer")
+
+TRUNCATED_MARKER = " …(이전 도구 결과 일부 생략)"
+TOKENS_PER_MESSAGE = 5  # solar 채팅 형식의 메시지당 추가 토큰 (<|im_start|>{role}\n ... <|im_end|>)
+
+
+def _message_text(message):
+    content = message.content
+    if isinstance(content, str):
+        return content
+    # 멀티모달 형식(content 블록 목록)은 텍스트 블록만 사용
+    return " ".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+
+
+class TokenCounter:
+    """
+    메시지 토큰 수를 세는 함수 객체.
+    solar 토크나이저를 한 번만 불러오고, 메시지 ID별 토큰 수를 캐시해 매 호출마다 전체 기록을 다시 토큰화하지 않습니다.
+    토크나이저는 Hugging Face Hub에서 내려받을 수 있어 백그라운드 스레드에서 불러오며(start_loading),
+    불러오는 중이거나 불러올 수 없으면(오프라인 등) count_tokens_approximately로 추정합니다.
+    (프롬프트 함수는 에이전트 이벤트 루프에서 바로 호출되므로 토큰 수를 셀 때 다운로드를 기다리지 않음)
+    """
+
+    def __init__(self, tokenizer_name=TOKENIZER_NAME, cache_size=10000):
+        self.tokenizer_name = tokenizer_name
+        self.cache_size = cache_size
+        self._tokenizer = None
+        self._tokenizer_failed = Tokenizer is None or not tokenizer_name
+        self._load_thread = None
+        self._cache = OrderedDict()  # (메시지 ID, 내용 길이) -> 토큰 수
+        self._lock = threading.Lock()
+
+    def load(self):
+        """토크나이저를 불러옵니다. (블로킹, 실패하면 이후 근사치로 계산)"""
+        if self._tokenizer is not None or self._tokenizer_failed:
+            return
+        try:
+            tokenizer = Tokenizer.from_pretrained(self.tokenizer_name)
+        except Exception as e:
+            print(f"ERROR (TokenCounter): 토크나이저 '{self.tokenizer_name}'를 불러올 수 없어 근사치로 계산합니다: {e}", file=sys.stderr)
+            self._tokenizer_failed = True
+            return
+        with self._lock:
+            self._tokenizer = tokenizer
+
+    def start_loading(self):
+        """토크나이저를 백그라운드 스레드에서 한 번만 불러오기 시작합니다."""
+        with self._lock:
+            self._start_loading()
+
+    def _start_loading(self):
+        # self._lock을 잡은 상태에서 호출
+        if self._load_thread is None and self._tokenizer is None and not self._tokenizer_failed:
+            self._load_thread = threading.Thread(target=self.load, name="tokenizer-loader", daemon=True)
+            self._load_thread.start()
+
+    def _get_tokenizer(self):
+        # 아직 불러오지 않았으면 불러오기만 시작하고, 불러올 때까지는 근사치로 계산
+        self._start_loading()
+        return self._tokenizer
+
+    def count_message(self, message):
+        text = _message_text(message)
+        key = (message.id, len(text)) if message.id else None
+        with self._lock:
+            if key is not None and key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            tokens = TOKENS_PER_MESSAGE + len(tokenizer.encode(text, add_special_tokens=False).ids)
+            for tool_call in getattr(message, "tool_calls", None) or []:
+                tokens += len(tokenizer.encode(f"{tool_call['name']}{tool_call['args']}", add_special_tokens=False).ids)
+        else:
+            tokens = count_tokens_approximately([message])
+            if not self._tokenizer_failed:
+                # 토크나이저를 불러오는 중의 근사치는 캐시하지 않음 (불러온 뒤 정확한 값으로 다시 계산)
+                key = None
+        if key is not None:
+            with self._lock:
+                self._cache[key] = tokens
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return tokens
+
+    def __call__(self, messages):
+        return sum(self.count_message(message) for message in messages)
+
+
+class HistoryCompactor:
+    """
+    create_react_agent의 prompt로 전달하는 호출 가능 객체.
+    모델을 호출할 때마다 체크포인터에 쌓인 대화 기록을 토큰 예산에 맞게 줄여 시스템 프롬프트와 함께 반환합니다.
+    (체크포인터에 저장된 기록은 그대로 두고, 모델에 보내는 메시지만 줄임)
+
+    1. 최근 keep_turns개 턴(사용자 메시지 하나부터 다음 사용자 메시지 전까지)은 그대로 유지합니다.
+    2. 그보다 오래된 턴의 도구 결과는 tool_result_tokens 토큰으로 줄입니다.
+    3. 그래도 예산을 넘으면 가장 오래된 턴부터 제외하고, 제외한 턴의 질문/답변 앞부분을 시스템 프롬프트 뒤에 요약으로 덧붙입니다.
+    """
+
+    def __init__(self, system_prompt, token_budget=TOKEN_BUDGET, tool_result_tokens=TOOL_RESULT_TOKENS,
+                 keep_turns=KEEP_TURNS, summary_tokens=SUMMARY_TOKENS, token_counter=None,
+                 max_threads=1000, max_records=50):
+        """
+        Args:
+            system_prompt: 에이전트 시스템 프롬프트
+            token_budget: 모델에 보낼 프롬프트의 목표 토큰 수
+            tool_result_tokens: 지난 턴의 도구 결과를 줄일 토큰 수
+            keep_turns: 그대로 유지할 최근 턴 수 (현재 턴 포함, 최소 1)
+            summary_tokens: 제외한 턴 요약의 최대 토큰 수
+            token_counter: 메시지 목록의 토큰 수를 반환하는 함수 (기본값: TokenCounter())
+            max_threads: 기록을 보관할 최대 대화(thread_id) 수
+            max_records: 대화별로 보관할 최근 모델 호출 기록 수
+        """
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.tool_result_tokens = tool_result_tokens
+        self.keep_turns = max(1, keep_turns)
+        self.summary_tokens = summary_tokens
+        self.count_tokens = token_counter or TokenCounter()
+        self.max_threads = max_threads
+        self.max_records = max_records
+        self._records = OrderedDict()  # thread_id -> deque(모델 호출 기록)
+        self._lock = threading.Lock()
+
+    def __call__(self, state, config=None):
+        messages = state["messages"]
+        started = time.perf_counter()
+
+        turns = []
+        for message in messages:
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(message)
+        old_turns, recent_turns = turns[:-self.keep_turns], turns[-self.keep_turns:]
+
+        # 지난 턴의 도구 결과 줄이기 (도구 호출과의 짝을 유지하도록 메시지는 남기고 내용만 줄임)
+        truncated_tools = 0
+        compacted_old = []
+        for turn in old_turns:
+            compacted_turn = []
+            for message in turn:
+                if isinstance(message, ToolMessage):
+                    shortened = self._truncate(message)
+                    if shortened is not message:
+                        truncated_tools += 1
+                    message = shortened
+                compacted_turn.append(message)
+            compacted_old.append(compacted_turn)
+
+        # 예산을 넘으면 오래된 턴부터 제외하고 요약으로 대체
+        recent_messages = [message for turn in recent_turns for message in turn]
+        recent_tokens = self.count_tokens(recent_messages)
+        old_tokens = [self.count_tokens(turn) for turn in compacted_old]
+        system_tokens = self.count_tokens([SystemMessage(content=self.system_prompt)])
+        summary_lines = []
+        evicted = 0
+        while compacted_old and system_tokens + self._summary_tokens(summary_lines) + sum(old_tokens) + recent_tokens > self.token_budget:
+            summary_lines = self._fit_summary(summary_lines + [self._summarize_turn(compacted_old.pop(0))])
+            old_tokens.pop(0)
+            evicted += 1
+
+        system_content = self.system_prompt
+        if summary_lines:
+            system_content += "\n\n**이전 대화 요약 (오래된 대화는 생략됨):**\n" + "\n".join(summary_lines)
+        prompt_messages = [SystemMessage(content=system_content)] + [message for turn in compacted_old for message in turn] + recent_messages
+
+        tokens_after = system_tokens + self._summary_tokens(summary_lines) + sum(old_tokens) + recent_tokens
+        self._record(config, {
+            "at": time.time(),
+            "turn": len(turns),
+            "messages_before": len(messages),
+            "messages_after": len(prompt_messages),
+            "tokens_before": system_tokens + self.count_tokens(messages),
+            "tokens_after": tokens_after,
+            "evicted_turns": evicted,
+            "truncated_tool_results": truncated_tools,
+            "over_budget": tokens_after > self.token_budget,
+            "elapsed_ms": (time.perf_counter() - started) * 1000,
+        })
+        return prompt_messages
+
+    # --- 압축 단계 --- START
+    def _truncate(self, message):
+        """도구 결과를 tool_result_tokens 토큰 안쪽으로 줄인 복사본을 반환합니다. (이미 짧으면 그대로 반환)"""
+        text = _message_text(message)
+        tokens = self.count_tokens([message])
+        if tokens <= self.tool_result_tokens:
+            return message
+        keep_chars = max(0, int(len(text) * self.tool_result_tokens / tokens) - len(TRUNCATED_MARKER))
+        # 같은 ID로 캐시된 토큰 수와 섞이지 않도록 ID 뒤에 표시를 붙임
+        return message.model_copy(update={
+            "content": text[:keep_chars] + TRUNCATED_MARKER,
+            "id": f"{message.id}:truncated" if message.id else None,
+        })
+
+    def _summarize_turn(self, turn):
+        """턴의 사용자 질문과 마지막 답변 앞부분으로 요약 항목을 만듭니다."""
+        lines = []
+        question = next((message for message in turn if isinstance(message, HumanMessage)), None)
+        answer = next((message for message in reversed(turn) if isinstance(message, AIMessage) and _message_text(message).strip()), None)
+        tools = [message.name for message in turn if isinstance(message, ToolMessage) and message.name]
+        if question is not None:
+            lines.append(f"- 사용자: {' '.join(_message_text(question).split())[:100]}")
+        if answer is not None:
+            used = f" (사용한 도구: {', '.join(dict.fromkeys(tools))})" if tools else ""
+            lines.append(f"  나비{used}: {' '.join(_message_text(answer).split())[:150]}")
+        return "\n".join(lines)
+
+    def _summary_tokens(self, lines):
+        return self.count_tokens([SystemMessage(content="\n".join(lines))]) if lines else 0
+
+    def _fit_summary(self, lines):
+        """요약이 summary_tokens를 넘으면 오래된 턴의 요약부터 제외합니다."""
+        while lines and self._summary_tokens(lines) > self.summary_tokens:
+            lines = lines[1:]
+        return lines
+    # --- 압축 단계 --- END
+
+    # --- 호출 기록 --- START
+    def _record(self, config, record):
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id", "default")
+        with self._lock:
+            records = self._records.get(thread_id)
+            if records is None:
+                records = self._records[thread_id] = deque(maxlen=self.max_records)
+            self._records.move_to_end(thread_id)
+            records.append(record)
+            while len(self._records) > self.max_threads:
+                self._records.popitem(last=False)
+        print(
+            f"DEBUG (HistoryCompactor): thread={thread_id} turn={record['turn']} "
+            f"tokens {record['tokens_before']} -> {record['tokens_after']} "
+            f"(evicted {record['evicted_turns']} turns, truncated {record['truncated_tool_results']} tool results)"
+        )
+
+    def recent_records(self, thread_id, limit=None):
+        """대화의 최근 모델 호출 기록(프롬프트 토큰 수 등)을 오래된 순으로 반환합니다."""
+        with self._lock:
+            records = list(self._records.get(thread_id, ()))
+        return records[-limit:] if limit else records
+    # --- 호출 기록 --- END
@@ -0,0 +1,69 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# MCP 전송 방식
+# - "stdio": 앱이 각 서버를 하위 프로세스로 실행하고 표준 입출력으로 통신 (기본값)
+# - "sse": 각 서버를 독립 HTTP(SSE) 서비스로 한 번만 실행해 두고 앱은 URL로 연결
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+
+# sse 모드에서 서버가 바인딩할 주소와 앱이 접속할 주소
+MCP_BIND_HOST = os.getenv("MCP_BIND_HOST", "127.0.0.1")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+
+# 서버 이름 -> 실행 스크립트, 포트, 지표(/metrics) 포트 (서버마다 포트가 겹치지 않아야 함)
+MCP_SERVERS = {
+    "weather": {
+        "script": "./mcp_server_local.py",
+        "port": int(os.getenv("WEATHER_MCP_PORT", "8005")),
+        "metrics_port": int(os.getenv("WEATHER_METRICS_PORT", "9101")),
+    },
+    "gsuite": {
+        "script": "./gsuite_mcp_server.py",
+        "port": int(os.getenv("GSUITE_MCP_PORT", "8006")),
+        "metrics_port": int(os.getenv("GSUITE_METRICS_PORT", "9102")),
+    },
+    "pplx_search": {
+        "script": "./pplx_search_mcp_server.py",
+        "port": int(os.getenv("PPLX_MCP_PORT", "8007")),
+        "metrics_port": int(os.getenv("PPLX_METRICS_PORT", "9103")),
+    },
+}
+
+
+def get_server_port(name):
+    """MCP 서버 포트 반환"""
+    return MCP_SERVERS[name]["port"]
+
+
+def get_metrics_port(name):
+    """MCP 서버의 지표(/metrics) 포트 반환"""
+    return MCP_SERVERS[name]["metrics_port"]
+
+
+def build_client_config(transport=None):
+    """
+    MultiServerMCPClient에 넘길 서버 설정을 만듭니다.
+
+    Args:
+        transport: "stdio" 또는 "sse" (기본값: MCP_TRANSPORT 환경 변수)
+
+    Returns:
+        dict: 서버 이름별 연결 설정
+    """
+    transport = transport or MCP_TRANSPORT
+    config = {}
+    for name, server in MCP_SERVERS.items():
+        if transport == "sse":
+            config[name] = {
+                "url": f"http://{MCP_HOST}:{server['port']}/sse",
+                "transport": "sse",
+            }
+        else:
+            config[name] = {
+                "command": "python",
+                "args": [server["script"]],
+                "transport": "stdio",
+            }
+    return config
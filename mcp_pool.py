@@ -0,0 +1,201 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+
+class MCPClientPool:
+    """
+    프로세스 전체에서 하나의 MCP 클라이언트와 에이전트를 공유하는 풀.
+
+    - 첫 세션이 acquire할 때 MCP 서버(클라이언트)를 띄웁니다. (lazy startup)
+    - 세션별 임대(lease)를 참조 카운트로 관리합니다. 세션은 스크립트 실행마다 touch로 임대를 연장하고,
+      session_ttl 동안 touch가 없으면 임대가 만료됩니다.
+    - 임대한 세션이 하나도 없는 상태가 idle_timeout 동안 이어지면 MCP 클라이언트를 종료합니다. (idle shutdown)
+      Streamlit은 브라우저를 닫아도 알려 주지 않아 release가 호출되지 않으므로, 실제 유휴 종료는
+      마지막 touch 후 session_ttl + idle_timeout(+ reap_interval) 뒤에 일어납니다.
+    - MCP stdio 세션은 생성된 이벤트 루프에 묶이므로, 모든 비동기 작업은 전용 스레드에서 도는
+      이벤트 루프 하나에서 실행합니다. (submit/run 사용)
+    """
+
+    def __init__(self, client_factory, agent_factory=None, idle_timeout=300.0, session_ttl=300.0, reap_interval=30.0):
+        """
+        Args:
+            client_factory: MultiServerMCPClient(비동기 컨텍스트 매니저)를 만드는 함수
+            agent_factory: 도구 목록을 받아 (agent, model)을 반환하는 함수 (선택)
+            idle_timeout: 임대 세션이 없을 때 클라이언트를 종료하기까지 기다리는 시간(초)
+            session_ttl: touch 없이 세션 임대가 유지되는 시간(초, 만료된 세션은 다음 실행에서 다시 acquire)
+            reap_interval: 만료 세션/유휴 상태 점검 주기(초)
+        """
+        self._client_factory = client_factory
+        self._agent_factory = agent_factory
+        self.idle_timeout = idle_timeout
+        self.session_ttl = session_ttl
+        self.reap_interval = reap_interval
+
+        self._thread_lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+        # 아래 상태는 풀 이벤트 루프 안에서만 변경
+        self._sessions = {}  # session_id -> 마지막 touch 시각(monotonic)
+        self._start_lock = None
+        self._owner_task = None
+        self._stop_event = None
+        self._reaper_task = None
+        self._client = None
+        self._agent = None
+        self._model = None
+        self._idle_since = None
+        self._stats = {"starts": 0, "shutdowns": 0, "acquires": 0, "expired_sessions": 0, "startup_seconds": None}
+
+    # --- 이벤트 루프 --- START
+    def _ensure_loop(self):
+        with self._thread_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="mcp-pool-loop", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+            return self._loop
+
+    def submit(self, coro):
+        """코루틴을 풀 이벤트 루프에서 실행하고 concurrent.futures.Future를 반환합니다."""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def run(self, coro, timeout=None):
+        """코루틴을 풀 이벤트 루프에서 실행하고 결과를 기다립니다."""
+        return self.submit(coro).result(timeout)
+    # --- 이벤트 루프 --- END
+
+    # --- 세션 임대 --- START
+    def acquire(self, session_id):
+        """
+        세션을 풀에 등록하고 공유 (client, agent, model)을 반환합니다. 필요하면 MCP 클라이언트를 시작합니다.
+        """
+        return self.run(self._acquire(session_id))
+
+    def touch(self, session_id):
+        """
+        세션 임대를 연장합니다.
+
+        Returns:
+            bool: 세션이 아직 풀에 등록되어 있으면 True. 만료되었거나 풀이 종료된 경우 False (다시 acquire 필요)
+        """
+        return self.run(self._touch(session_id))
+
+    def release(self, session_id):
+        """세션 임대를 반납합니다."""
+        self.run(self._release(session_id))
+
+    def stats(self, timeout=None):
+        """풀 상태 통계를 반환합니다. (timeout초 안에 풀 이벤트 루프가 응답하지 않으면 TimeoutError)"""
+        return self.run(self._snapshot(), timeout)
+
+    def shutdown(self):
+        """세션 임대와 상관없이 MCP 클라이언트를 즉시 종료합니다."""
+        self.run(self._shutdown())
+
+    async def _acquire(self, session_id):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._client is None:
+                await self._start()
+            self._sessions[session_id] = time.monotonic()
+            self._idle_since = None
+            self._stats["acquires"] += 1
+            return self._client, self._agent, self._model
+
+    async def _touch(self, session_id):
+        if self._client is None or session_id not in self._sessions:
+            return False
+        self._sessions[session_id] = time.monotonic()
+        return True
+
+    async def _release(self, session_id):
+        self._sessions.pop(session_id, None)
+        if not self._sessions and self._idle_since is None:
+            self._idle_since = time.monotonic()
+
+    async def _snapshot(self):
+        return {
+            **self._stats,
+            "running": self._client is not None,
+            "active_sessions": len(self._sessions),
+            "idle_seconds": None if self._idle_since is None else time.monotonic() - self._idle_since,
+        }
+    # --- 세션 임대 --- END
+
+    # --- 클라이언트 수명 관리 --- START
+    async def _start(self):
+        started_at = time.perf_counter()
+        ready = asyncio.get_running_loop().create_future()
+        self._stop_event = asyncio.Event()
+        # anyio 취소 범위 때문에 클라이언트 진입/종료는 같은 태스크에서 해야 하므로 전용 태스크가 소유
+        self._owner_task = asyncio.create_task(self._own_client(ready))
+        await ready
+        self._stats["starts"] += 1
+        self._stats["startup_seconds"] = time.perf_counter() - started_at
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_forever())
+        print(f"DEBUG (MCPClientPool): MCP client started in {self._stats['startup_seconds']:.2f}s")
+
+    async def _own_client(self, ready):
+        try:
+            async with self._client_factory() as client:
+                tools = client.get_tools()
+                agent, model = (None, None)
+                if self._agent_factory is not None:
+                    agent, model = self._agent_factory(tools)
+                self._client, self._agent, self._model = client, agent, model
+                ready.set_result(None)
+                await self._stop_event.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"ERROR (MCPClientPool): MCP client stopped unexpectedly: {e}")
+        finally:
+            self._client, self._agent, self._model = None, None, None
+            self._sessions.clear()
+
+    async def _shutdown(self):
+        if self._owner_task is None:
+            return
+        self._stop_event.set()
+        await asyncio.gather(self._owner_task, return_exceptions=True)
+        self._owner_task = None
+        self._idle_since = None
+        self._stats["shutdowns"] += 1
+        print("DEBUG (MCPClientPool): MCP client shut down.")
+
+    async def _reap_forever(self):
+        while self._client is not None:
+            await asyncio.sleep(self.reap_interval)
+            await self._reap()
+
+    async def _reap(self):
+        now = time.monotonic()
+        expired = [sid for sid, last_seen in self._sessions.items() if now - last_seen > self.session_ttl]
+        for session_id in expired:
+            del self._sessions[session_id]
+        self._stats["expired_sessions"] += len(expired)
+        if not self._sessions:
+            if self._idle_since is None:
+                self._idle_since = now
+            elif now - self._idle_since >= self.idle_timeout:
+                await self._shutdown()
+    # --- 클라이언트 수명 관리 --- END
+
+
+def wait_with_updates(future, on_update=None, poll_interval=0.05):
+    """
+    concurrent.futures.Future가 끝날 때까지 기다리면서 on_update를 주기적으로 호출합니다.
+    (Streamlit 스크립트 스레드에서 스트리밍 중인 결과를 화면에 반영할 때 사용)
+    """
+    if on_update is not None:
+        while not concurrent.futures.wait([future], timeout=poll_interval).done:
+            on_update()
+        on_update()
+    return future.result()
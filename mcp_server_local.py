@@ -1,69 +1,189 @@
 from mcp.server.fastmcp import FastMCP
-import requests
+import asyncio
+import httpx
 import os
+import json
+from collections import Counter
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from cache_utils import TTLCache
+from mcp_config import MCP_BIND_HOST, MCP_TRANSPORT, get_metrics_port, get_server_port
+from metrics import instrument_tool, start_metrics_server
+from tracing import TracingTransport, traced
+
+# .env 파일 로드 (서버 시작 시 한 번)
+load_dotenv()
+
+# 위치/날씨 응답 캐시 설정
+LOCATION_TTL = float(os.getenv("WEATHER_LOCATION_TTL", "21600"))  # IP 기반 위치 캐시 유지 시간(초)
+WEATHER_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))  # 날씨 캐시 유지 시간(초)
+FORECAST_TTL = float(os.getenv("WEATHER_FORECAST_TTL", "1800"))  # 5일 예보 캐시 유지 시간(초, 예보는 3시간마다 갱신됨)
+COORD_PRECISION = int(os.getenv("WEATHER_COORD_PRECISION", "2"))  # 날씨 캐시 키로 쓸 위도/경도 소수점 자리 수 (2자리 ≈ 1km)
+# 외부 API 요청 제한 시간(초): 연결, 응답 읽기
+CONNECT_TIMEOUT = float(os.getenv("WEATHER_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("WEATHER_READ_TIMEOUT", "5"))
+
+# 외부 API 주소 (벤치마크에서는 로컬 스텁 서버 주소로 바꿔 실행)
+LOCATION_URL = os.getenv("WEATHER_LOCATION_URL", "https://ipinfo.io/json")
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "http://api.openweathermap.org/data/2.5")
+WEATHER_URLS = {
+    "current": f"{WEATHER_API_URL}/weather",
+    "forecast": f"{WEATHER_API_URL}/forecast",  # 5일/3시간 간격 예보
+}
+
+_location_cache = TTLCache(maxsize=1, ttl=LOCATION_TTL, name="weather_location")
+_weather_cache = TTLCache(maxsize=64, ttl=WEATHER_TTL, name="weather")
+
+# 진행 중인 조회 (같은 키의 동시 요청은 하나의 외부 API 호출 결과를 함께 사용)
+_in_flight = {}  # 캐시 키 -> asyncio.Task
+_fetch_stats = {"upstream_requests": 0, "coalesced": 0}
+
+# 공유 비동기 클라이언트 (클라이언트를 만든 이벤트 루프에서만 재사용)
+_async_client = None
+_async_client_loop = None
 
 # Initialize FastMCP server with configuration
 mcp = FastMCP(
     "Weather",  # Name of the MCP server
-    instructions="You are a weather assistant that can provide the current weather based on the user's automatically detected location.",
-    host="0.0.0.0",  # Host address (0.0.0.0 allows connections from any IP)
-    port=8005,  # Port number for the server
+    instructions="You are a weather assistant that can provide the current weather or a 5-day forecast based on the user's automatically detected location.",
+    host=MCP_BIND_HOST,  # Host address (sse 모드에서 바인딩할 주소, 0.0.0.0이면 모든 IP 허용)
+    port=get_server_port("weather"),  # Port number for the server
 )
 
+
+def get_async_client() -> httpx.AsyncClient:
+    """연결을 재사용하는 httpx.AsyncClient를 반환합니다. (ipinfo.io, OpenWeatherMap 공용)"""
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            # 외부 HTTP 호출마다 추적 구간 기록
+            transport=TracingTransport(httpx.AsyncHTTPTransport(
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=4),
+            )),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def _coalesced(key, fetch):
+    """
+    같은 키로 진행 중인 조회가 있으면 그 결과를 기다리고, 없으면 fetch()를 시작합니다.
+    기다리던 호출이 취소(시간 초과 등)되어도 공유 조회는 끝까지 진행되어 다른 호출과 캐시에 결과를 남깁니다.
+    """
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(fetch())
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    else:
+        _fetch_stats["coalesced"] += 1
+    return await asyncio.shield(task)
+
+
 # --- test_weather.py에서 가져온 함수들 --- START
-def get_location():
+def weather_cache_key(kind, lat, lon):
+    """날씨 캐시 키: 종류와 COORD_PRECISION 자리로 반올림한 위도/경도"""
+    return f"{kind}:{round(lat, COORD_PRECISION)},{round(lon, COORD_PRECISION)}"
+
+async def get_location():
     """
     IP 기반으로 위치 정보를 가져옵니다.
-    https://ipinfo.io/json 을 호출하여 위도와 경도를 추출합니다.
+    https://ipinfo.io/json (WEATHER_LOCATION_URL) 을 호출하여 위도와 경도를 추출합니다. (WEATHER_LOCATION_TTL 동안 캐시)
     """
-    try:
-        response = requests.get("https://ipinfo.io/json")
-        response.raise_for_status()
-        data = response.json()
-        loc = data.get("loc")
-        if loc:
-            lat_str, lon_str = loc.split(',')
-            return float(lat_str), float(lon_str)
-    except Exception as e:
-        print("(MCP Server) 위치 정보를 가져오는 중 오류 발생:", e)
-    return None, None
-
-def get_weather_data(lat, lon, api_key):
+    cached = _location_cache.get("location")
+    if cached is not None:
+        return tuple(cached)
+
+    async def fetch():
+        try:
+            _fetch_stats["upstream_requests"] += 1
+            response = await get_async_client().get(LOCATION_URL)
+            response.raise_for_status()
+            data = response.json()
+            loc = data.get("loc")
+            if loc:
+                lat_str, lon_str = loc.split(',')
+                location = (float(lat_str), float(lon_str))
+                _location_cache.set("location", location)
+                return location
+        except Exception as e:
+            print("(MCP Server) 위치 정보를 가져오는 중 오류 발생:", e)
+        return None, None
+
+    return await _coalesced("location", fetch)
+
+async def get_weather_data(lat, lon, api_key, kind="current"):
     """
     OpenWeatherMap API를 사용하여 주어진 위도와 경도의 날씨 정보를 가져옵니다.
     'units' 파라미터는 섭씨 온도를 반환하도록 설정합니다.
+    반올림한 위도/경도별로 캐시합니다. (current: WEATHER_CACHE_TTL, forecast: WEATHER_FORECAST_TTL, 실패한 응답은 캐시하지 않음)
+
+    Args:
+        kind: "current" (현재 날씨) 또는 "forecast" (5일/3시간 간격 예보)
     """
-    try:
-        url = "http://api.openweathermap.org/data/2.5/weather"
-        params = {
-            "lat": lat,
-            "lon": lon,
-            "appid": api_key,
-            "units": "metric"  # 섭씨 온도
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print("(MCP Server) 날씨 정보를 가져오는 중 오류 발생:", e)
-    return None
+    key = weather_cache_key(kind, lat, lon)
+    cached = _weather_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        try:
+            params = {
+                "lat": lat,
+                "lon": lon,
+                "appid": api_key,
+                "units": "metric"  # 섭씨 온도
+            }
+            _fetch_stats["upstream_requests"] += 1
+            response = await get_async_client().get(WEATHER_URLS[kind], params=params)
+            response.raise_for_status()
+            data = response.json()
+            _weather_cache.set(key, data, ttl=FORECAST_TTL if kind == "forecast" else WEATHER_TTL)
+            return data
+        except Exception as e:
+            print("(MCP Server) 날씨 정보를 가져오는 중 오류 발생:", e)
+        return None
+
+    return await _coalesced(key, fetch)
 # --- test_weather.py에서 가져온 함수들 --- END
 
 
+def format_forecast(forecast_data):
+    """3시간 간격 예보를 (현지 시간 기준) 날짜별 최저/최고 온도와 가장 잦은 날씨로 요약합니다."""
+    city = forecast_data.get("city", {})
+    offset = timezone(timedelta(seconds=city.get("timezone", 0)))
+    days = {}
+    for entry in forecast_data["list"]:
+        day = datetime.fromtimestamp(entry["dt"], offset).strftime("%m/%d")
+        days.setdefault(day, []).append(entry)
+    lines = [f"{city.get('name') or '알 수 없는 도시'} 5일 예보:"]
+    for day, entries in days.items():
+        temperatures = [entry["main"]["temp"] for entry in entries]
+        description = Counter(entry["weather"][0]["description"] for entry in entries).most_common(1)[0][0]
+        lines.append(f"- {day}: {description}, 최저 {min(temperatures):.1f}°C / 최고 {max(temperatures):.1f}°C")
+    return "\n".join(lines)
+
+
 @mcp.tool()
-def get_weather() -> str:
+@instrument_tool()
+@traced(kind="tool")
+async def get_weather(mode: str = "current") -> str:
     """
-    Get current weather information based on the user's IP address location.
+    Get weather information based on the user's IP address location.
     Automatically detects location via IP and fetches weather using OpenWeatherMap.
 
+    Args:
+        mode (str): "current" for the current weather (default), "forecast" for a 5-day daily forecast.
+
     Returns:
-        str: A string containing the current weather information or an error message.
+        str: A string containing the weather information or an error message.
     """
-    # .env 파일 로드 (도구 호출 시마다 로드하는 것이 안전할 수 있음)
-    load_dotenv()
+    if mode not in WEATHER_URLS:
+        return f"지원하지 않는 mode입니다: {mode} (current 또는 forecast)"
 
-    lat, lon = get_location()
+    lat, lon = await get_location()
     if lat is None or lon is None:
         return "위치 정보를 자동으로 가져올 수 없습니다."
 
@@ -72,10 +192,12 @@ def get_weather() -> str:
     if not api_key:
         print("(MCP Server) 오류: WEATHERMAP_API_KEY 환경 변수가 설정되지 않았습니다.")
         return "날씨 정보를 가져오기 위한 설정(API 키)이 누락되었습니다."
-    
-    weather_data = get_weather_data(lat, lon, api_key)
+
+    weather_data = await get_weather_data(lat, lon, api_key, kind=mode)
     if weather_data:
         try:
+            if mode == "forecast":
+                return format_forecast(weather_data)
             city = weather_data.get("name", "알 수 없는 도시")
             description = weather_data["weather"][0]["description"]
             temperature = weather_data["main"]["temp"]
@@ -87,6 +209,19 @@ def get_weather() -> str:
         return "날씨 정보를 가져오는 데 실패했습니다."
 
 
+# 위치/날씨 캐시 상태 확인용 리소스
+@mcp.resource("weather://cache/stats")
+def weather_cache_stats() -> str:
+    """위치/날씨 캐시의 적중률 통계와 외부 API 호출/합쳐진 요청 수를 JSON 문자열로 반환합니다."""
+    return json.dumps(
+        {"location": _location_cache.stats(), "weather": _weather_cache.stats(), **_fetch_stats},
+        ensure_ascii=False,
+    )
+
+
 if __name__ == "__main__":
-    # Start the MCP server with stdio transport
-    mcp.run(transport="stdio")
+    # 도구 호출 수/처리 시간, 캐시 적중률 등 지표를 /metrics로 노출
+    start_metrics_server(get_metrics_port("weather"))
+
+    # Start the MCP server (MCP_TRANSPORT: stdio 또는 sse)
+    mcp.run(transport=MCP_TRANSPORT)
@@ -0,0 +1,496 @@
+"""
+Prometheus 형식 지표(metrics)
+
+앱과 각 MCP 서버 프로세스가 자기 지표를 텍스트 형식(Prometheus exposition format 0.0.4)으로 노출합니다.
+외부 라이브러리 없이 동작하며, start_metrics_server()가 띄운 HTTP 서버의 /metrics 경로로 수집(scrape)합니다.
+
+- 앱(METRICS_PORT, 기본 9100): 활성 세션, MCP 하위 프로세스 수, 처리 중인 질문 수, 질문 처리 시간, LLM 토큰 사용량
+- MCP 서버(WEATHER/GSUITE/PPLX_METRICS_PORT, 기본 9101~9103): 도구 호출 수와 처리 시간
+- 공통: 캐시 적중/실패 수와 적중률, 프로세스 메모리(RSS)
+
+사용법:
+    curl http://127.0.0.1:9100/metrics
+"""
+import asyncio
+import contextlib
+import functools
+import math
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+from cache_utils import all_caches
+
+try:
+    import resource  # 리눅스/macOS 전용
+except ImportError:
+    resource = None
+
+load_dotenv()
+
+# 지표 설정
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # 로컬에서만 수집하도록 기본값은 루프백 주소
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))  # 앱(Streamlit) 프로세스의 지표 포트
+METRICS_PREFIX = "nabee_"
+
+# 히스토그램 구간 경계(초)
+TOOL_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def process_rss_bytes():
+    """현재 프로세스의 상주 메모리(RSS) 크기를 반환합니다. (/proc이 없으면 최대 RSS, 알 수 없으면 None)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    return None
+
+
+def count_child_processes(markers=None):
+    """
+    현재 프로세스의 살아 있는 하위 프로세스 수를 셉니다. (리눅스 /proc 기준, 알 수 없으면 None)
+
+    Args:
+        markers: 주면 명령줄에 이 문자열 중 하나가 들어 있는 프로세스만 셈 (예: MCP 서버 스크립트 이름)
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    parent = os.getpid()
+    count = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                stat = f.read()
+            # 프로세스 이름에 공백/괄호가 있을 수 있으므로 마지막 ')' 뒤에서 상태와 부모 PID를 읽음
+            state, ppid = stat[stat.rindex(")") + 2:].split()[:2]
+            if int(ppid) != parent or state == "Z":
+                continue
+            if markers:
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+                if not any(marker in cmdline for marker in markers):
+                    continue
+            count += 1
+        except (OSError, ValueError):
+            continue  # 조회 중에 끝난 프로세스
+    return count
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    return repr(float(value))
+
+
+def _escape(value):
+    """레이블 값 이스케이프 (역슬래시, 큰따옴표, 줄바꿈)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    """지표 하나 (레이블 값 조합별로 값을 가짐). 한 번도 기록하지 않은 지표는 노출하지 않습니다."""
+
+    type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 레이블 값 튜플 -> 값
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: 레이블 {self.labelnames}이 필요합니다. (받은 레이블: {tuple(labels)})")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _add(self, amount, labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _set(self, value, labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels):
+        """현재 값 (기록한 적이 없으면 0)"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labelnames, key, None, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        samples = self.samples()
+        if not samples:
+            return []
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labelnames, key, extra, value in samples:
+            lines.append(f"{name}{_format_labels(labelnames, key, extra)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """늘어나기만 하는 누적값"""
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError(f"{self.name}: counter는 줄어들 수 없습니다.")
+        self._add(amount, labels)
+
+    def set_total(self, value, **labels):
+        """다른 곳에서 집계한 누적값을 그대로 반영합니다. (수집기에서 캐시 통계 등을 옮길 때 사용)"""
+        self._set(value, labels)
+
+
+class Gauge(_Metric):
+    """오르내리는 현재값"""
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self._set(value, labels)
+
+    def inc(self, amount=1, **labels):
+        self._add(amount, labels)
+
+    def dec(self, amount=1, **labels):
+        self._add(-amount, labels)
+
+    def remove(self, **labels):
+        """레이블 조합 하나를 지표에서 제거합니다."""
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+
+class Histogram(_Metric):
+    """관측값 분포 (구간별 누적 개수, 합계, 개수)"""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TOOL_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+
+    def value(self, **labels):
+        """관측 개수와 합계 ({"count", "sum"})"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return {"count": sum(state["counts"]), "sum": state["sum"]} if state else {"count": 0, "sum": 0.0}
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", self.labelnames, key, ("le", _format_value(bound)), cumulative))
+                samples.append((f"{self.name}_sum", self.labelnames, key, None, state["sum"]))
+                samples.append((f"{self.name}_count", self.labelnames, key, None, cumulative))
+        return samples
+
+
+class Registry:
+    """
+    프로세스의 지표 모음.
+
+    - 같은 이름으로 다시 만들면 기존 지표를 돌려줍니다. (Streamlit 스크립트가 다시 실행되어도 안전)
+    - 수집기(collector)는 render() 직전에 호출되어, 다른 모듈의 통계(캐시, 세션 수 등)를 지표로 옮깁니다.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        name = METRICS_PREFIX + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"지표 {name}이(가) 다른 종류/레이블로 이미 등록되어 있습니다.")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=TOOL_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, name, collect):
+        """
+        수집기를 등록합니다. 같은 이름으로 다시 등록하면 교체됩니다.
+
+        Args:
+            name: 수집기 이름
+            collect: 인자 없이 호출되어 지표 값을 갱신하는 함수
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def render(self):
+        """모든 지표를 Prometheus 텍스트 형식으로 반환합니다."""
+        with self._lock:
+            collectors = list(self._collectors.items())
+        for name, collect in collectors:
+            try:
+                collect()
+            except Exception as e:  # 수집기 하나가 실패해도 나머지 지표는 노출
+                print(f"ERROR (metrics): 수집기 {name} 실패: {e}", file=sys.stderr)
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- 공통 지표 --- START
+PROCESS_RSS = REGISTRY.gauge("process_resident_memory_bytes", "Resident memory size of this process in bytes.")
+CACHE_HITS = REGISTRY.counter("cache_hits_total", "Cache lookups served from the cache.", ("cache",))
+CACHE_MISSES = REGISTRY.counter("cache_misses_total", "Cache lookups that missed.", ("cache",))
+CACHE_HIT_RATIO = REGISTRY.gauge("cache_hit_ratio", "Cache hits divided by lookups since process start.", ("cache",))
+
+# MCP 서버: 도구 호출
+TOOL_CALLS = REGISTRY.counter("mcp_tool_calls_total", "MCP tool calls by tool and outcome.", ("tool", "status"))
+TOOL_DURATION = REGISTRY.histogram("mcp_tool_duration_seconds", "MCP tool call latency in seconds.", ("tool",), TOOL_BUCKETS)
+TOOL_IN_FLIGHT = REGISTRY.gauge("mcp_tool_in_flight", "MCP tool calls currently running.", ("tool",))
+
+# 앱: 세션, MCP 하위 프로세스, 질문, LLM
+ACTIVE_SESSIONS = REGISTRY.gauge("active_sessions", "Browser sessions holding a lease on the shared MCP client pool.")
+MCP_POOL_RUNNING = REGISTRY.gauge("mcp_pool_running", "1 if the shared MCP client (and its servers) is running, else 0.")
+MCP_SUBPROCESSES = REGISTRY.gauge("mcp_subprocesses", "Live MCP server subprocesses started by this process (stdio transport).")
+SESSIONS_INITIALIZED = REGISTRY.counter("sessions_initialized_total", "Session initializations by result.", ("result",))
+QUERIES = REGISTRY.counter("queries_total", "User queries processed by outcome.", ("status",))
+QUERY_DURATION = REGISTRY.histogram("query_duration_seconds", "End-to-end user query latency in seconds.", (), QUERY_BUCKETS)
+QUERIES_IN_FLIGHT = REGISTRY.gauge("queries_in_flight", "User queries currently being processed.")
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "LLM calls by model and outcome.", ("model", "status"))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "LLM tokens used by model and type (prompt, completion).", ("model", "type"))
+# --- 공통 지표 --- END
+
+_cache_sources = {}  # 캐시 이름 -> 적중 통계를 반환하는 함수
+
+
+def register_cache_stats(name, stats):
+    """
+    TTLCache가 아닌 캐시의 적중 통계를 지표에 추가합니다. (TTLCache는 자동으로 포함)
+
+    Args:
+        name: 지표 레이블로 쓸 캐시 이름
+        stats: {"hits", "misses"}를 반환하는 함수
+    """
+    _cache_sources[name] = stats
+
+
+def _collect_process_and_caches():
+    rss = process_rss_bytes()
+    if rss is not None:
+        PROCESS_RSS.set(rss)
+    sources = {cache.name: cache.stats for cache in all_caches()}
+    sources.update(_cache_sources)
+    for name, stats in sources.items():
+        values = stats()
+        hits, misses = values.get("hits", 0), values.get("misses", 0)
+        CACHE_HITS.set_total(hits, cache=name)
+        CACHE_MISSES.set_total(misses, cache=name)
+        if hits + misses:
+            CACHE_HIT_RATIO.set(hits / (hits + misses), cache=name)
+
+
+REGISTRY.register_collector("process_and_caches", _collect_process_and_caches)
+
+
+@contextlib.contextmanager
+def _track(in_flight, calls, duration, labels):
+    """처리 중 개수를 올렸다 내리고, 끝나면 결과별 호출 수와 소요 시간을 기록합니다. (outcome["status"]로 결과 지정)"""
+    outcome = {"status": "ok"}
+    in_flight.inc(**labels)
+    started = time.perf_counter()
+    try:
+        yield outcome
+    except BaseException as e:
+        outcome["status"] = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        raise
+    finally:
+        in_flight.dec(**labels)
+        calls.inc(**labels, status=outcome["status"])
+        duration.observe(time.perf_counter() - started, **labels)
+
+
+def track_query():
+    """
+    사용자 질문 하나의 처리 중 개수/결과/소요 시간을 기록하는 컨텍스트 매니저.
+    오류를 예외 대신 결과로 돌려주는 경우에는 yield된 dict의 "status"를 "error"로 바꿉니다.
+    """
+    return _track(QUERIES_IN_FLIGHT, QUERIES, QUERY_DURATION, {})
+
+
+def instrument_tool(name=None):
+    """
+    MCP 도구의 호출 수/오류/처리 시간/처리 중 개수를 기록하는 데코레이터. (동기/비동기 함수 모두 지원, 시그니처는 유지)
+    @mcp.tool() 아래에 둡니다.
+    """
+    def decorator(fn):
+        labels = {"tool": name or fn.__name__}
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with _track(TOOL_IN_FLIGHT, TOOL_CALLS, TOOL_DURATION, labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _track(TOOL_IN_FLIGHT, TOOL_CALLS, TOOL_DURATION, labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# --- LangChain 콜백 (LLM 토큰 사용량) --- START
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:  # MCP 서버 프로세스처럼 langchain이 필요 없는 곳에서도 이 모듈을 쓸 수 있도록
+    BaseCallbackHandler = None
+
+if BaseCallbackHandler is not None:
+    class MetricsCallbackHandler(BaseCallbackHandler):
+        """
+        모델 호출 수와 토큰 사용량을 지표로 기록하는 콜백. RunnableConfig(callbacks=[...])로 전달합니다.
+        스트리밍 응답은 메시지의 usage_metadata를, 그 밖에는 llm_output["token_usage"]를 사용합니다.
+        """
+
+        def __init__(self):
+            self._models = {}  # run_id -> 모델 이름
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+            self._models[run_id] = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "chat_model")
+
+        def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+            self._models[run_id] = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "llm")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            model = self._models.pop(run_id, "unknown")
+            LLM_REQUESTS.inc(model=model, status="ok")
+            prompt_tokens, completion_tokens = _token_usage(response)
+            if prompt_tokens:
+                LLM_TOKENS.inc(prompt_tokens, model=model, type="prompt")
+            if completion_tokens:
+                LLM_TOKENS.inc(completion_tokens, model=model, type="completion")
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            LLM_REQUESTS.inc(model=self._models.pop(run_id, "unknown"), status="error")
+else:
+    MetricsCallbackHandler = None
+
+
+def _token_usage(response):
+    """LLMResult에서 (프롬프트 토큰 수, 생성 토큰 수)를 꺼냅니다."""
+    prompt_tokens = completion_tokens = 0
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not (prompt_tokens or completion_tokens):
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+# --- LangChain 콜백 (LLM 토큰 사용량) --- END
+
+
+# --- /metrics HTTP 서버 --- START
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 수집 요청마다 로그를 남기지 않음
+
+
+_servers = {}  # 포트 -> ThreadingHTTPServer
+_servers_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    /metrics를 제공하는 HTTP 서버를 백그라운드 스레드에서 시작합니다. (같은 포트로 다시 호출하면 기존 서버 반환)
+    MCP stdio 서버는 표준 출력을 프로토콜에 쓰므로 로그는 표준 오류로 남깁니다.
+
+    Returns:
+        ThreadingHTTPServer | None: 지표가 꺼져 있거나 포트를 열 수 없으면 None
+    """
+    if not METRICS_ENABLED:
+        return None
+    with _servers_lock:
+        server = _servers.get(port)
+        if server is not None:
+            return server
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            print(f"ERROR (metrics): {host}:{port}에서 지표 서버를 시작할 수 없습니다: {e}", file=sys.stderr)
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"metrics-{port}", daemon=True).start()
+        _servers[port] = server
+        print(f"DEBUG (metrics): serving http://{host}:{port}/metrics", file=sys.stderr)
+        return server
+# --- /metrics HTTP 서버 --- END
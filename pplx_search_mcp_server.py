@@ -1,17 +1,23 @@
-from mcp.server.fastmcp import FastMCP
-from pplx_utils import ask_perplexity
+import json
+from mcp.server.fastmcp import Context, FastMCP
+from pplx_utils import PerplexityError, get_cache_stats, stream_perplexity_async
+from mcp_config import MCP_BIND_HOST, MCP_TRANSPORT, get_metrics_port, get_server_port
+from metrics import instrument_tool, start_metrics_server
+from tracing import traced
 
 # MCP 서버 초기화
 mcp = FastMCP(
     "PerplexitySearch",  # MCP 서버 이름
     instructions="You are a Perplexity search assistant. Use this tool **only** when the user explicitly asks to 'search for', 'find information about', 'look up', or similar phrases indicating a clear web search intent. Do **not** use this tool for simple greetings, everyday conversation, or requests that can be handled by other available tools (like weather, email, calendar).",
-    host="0.0.0.0",
-    port=8006,
+    host=MCP_BIND_HOST,
+    port=get_server_port("pplx_search"),
 )
 
 # MCP 도구로 등록된 함수
 @mcp.tool()
-async def perplexity_search(query: str) -> str:
+@instrument_tool()
+@traced(kind="tool")
+async def perplexity_search(query: str, ctx: Context) -> str:
     """
     Perplexity에 검색 질의를 보내고 결과를 반환합니다.
 
@@ -20,9 +26,34 @@ async def perplexity_search(query: str) -> str:
     Returns:
         str: Perplexity AI의 응답
     """
-    return ask_perplexity(query)
+    # 클라이언트가 progressToken을 보낸 경우에만 스트리밍 중간 결과를 알림으로 전달
+    # (진행률 알림에는 지금까지 받은 글자 수, 로그 알림에는 새로 받은 텍스트 조각)
+    meta = ctx.request_context.meta
+    stream_to_client = meta is not None and meta.progressToken is not None
+
+    answer = ""
+    try:
+        async for delta in stream_perplexity_async(query):
+            answer += delta
+            if stream_to_client:
+                await ctx.report_progress(len(answer))
+                await ctx.log("info", delta, logger_name="perplexity_search.partial")
+    except PerplexityError as e:
+        # 중간에 실패하면 잘린 응답 대신 오류 메시지만 반환
+        return str(e)
+    return answer
+
+
+# 캐시 적중률 확인용 리소스 (도구가 아니므로 에이전트의 도구 목록에는 나타나지 않음)
+@mcp.resource("pplx://cache/stats")
+def perplexity_cache_stats() -> str:
+    """Perplexity 응답 캐시의 적중률 통계를 JSON 문자열로 반환합니다."""
+    return json.dumps(get_cache_stats(), ensure_ascii=False)
 
 
 if __name__ == "__main__":
-    # stdio를 통해 MCP 서버 실행 (CLI나 다른 MCP 시스템에서 사용 가능)
-    mcp.run(transport="stdio")
+    # 도구 호출 수/처리 시간, 캐시 적중률 등 지표를 /metrics로 노출
+    start_metrics_server(get_metrics_port("pplx_search"))
+
+    # MCP 서버 실행 (MCP_TRANSPORT: CLI나 다른 MCP 시스템용 stdio 또는 독립 실행용 sse)
+    mcp.run(transport=MCP_TRANSPORT)
@@ -1,7 +1,13 @@
+import asyncio
+import json
 import os
+import sys
 import httpx
 from dotenv import load_dotenv
 
+from cache_utils import TTLCache, normalize_text
+from tracing import TracingTransport
+
 # .env 파일에서 API 키 로드
 load_dotenv()
 api_key = os.getenv("PERPLEXITY_API_KEY")
@@ -13,35 +19,241 @@ HEADERS = {
     "Authorization": f"Bearer {api_key}",
     "Content-Type": "application/json"
 }
-API_URL = "https://api.perplexity.ai/chat/completions"
+API_URL = os.getenv("PERPLEXITY_API_URL", "https://api.perplexity.ai/chat/completions")
 MODEL = "sonar"  # 가장 저렴한 온라인 모델
+TIMEOUT = 30.0
+
+# 비동기 클라이언트 연결 풀 설정
+MAX_CONNECTIONS = int(os.getenv("PPLX_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("PPLX_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("PPLX_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("PPLX_HTTP2", "true").lower() == "true"
+
+# 응답 캐시 설정 (같은 질의가 반복될 때 API 호출 생략)
+CACHE_ENABLED = os.getenv("PPLX_CACHE_ENABLED", "true").lower() == "true"
+CACHE_SIZE = int(os.getenv("PPLX_CACHE_SIZE", "256"))
+CACHE_TTL = float(os.getenv("PPLX_CACHE_TTL", "1800"))
+CACHE_DB_PATH = os.getenv("PPLX_CACHE_DB") or None  # 지정하면 SQLite 파일에 저장해 재시작 후에도 유지
+
+_response_cache = TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL, db_path=CACHE_DB_PATH, name="pplx_cache")
+
+# 공유 비동기 클라이언트 (클라이언트를 만든 이벤트 루프에서만 재사용)
+_async_client = None
+_async_client_loop = None
+
+
+class PerplexityError(Exception):
+    """스트리밍 응답이 실패했을 때 발생하는 예외 (메시지는 ask_perplexity_async의 오류 메시지와 같은 형식)"""
+
+
+def _build_payload(question: str, system_prompt: str, stream: bool = False) -> dict:
+    payload = {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": question}
+        ]
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def make_cache_key(question: str, system_prompt: str, model: str = MODEL) -> str:
+    """정규화한 질의, 모델, 시스템 프롬프트로 캐시 키를 만듭니다."""
+    return "\x1f".join([model, normalize_text(system_prompt), normalize_text(question)])
+
+
+def get_cache_stats() -> dict:
+    """Perplexity 응답 캐시의 적중률 통계를 반환합니다."""
+    return _response_cache.stats()
+
+
+def clear_cache():
+    """Perplexity 응답 캐시를 비웁니다."""
+    _response_cache.clear()
+
+
+def _get_cached(question: str, system_prompt: str, use_cache: bool):
+    if not (use_cache and CACHE_ENABLED):
+        return None, None
+    key = make_cache_key(question, system_prompt)
+    cached = _response_cache.get(key)
+    if cached is not None:
+        # stdio MCP 서버의 표준 출력은 JSON-RPC 통신에 쓰이므로 로그는 표준 오류로 기록
+        print(f"DEBUG (pplx_utils): cache hit (hit_ratio={_response_cache.stats()['hit_ratio']:.2f})", file=sys.stderr)
+    return key, cached
+
+
+def _store_cached(key, answer: str):
+    # 오류 메시지는 캐시하지 않음
+    if key is not None and not answer.startswith("❌"):
+        _response_cache.set(key, answer)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    연결 풀을 공유하는 httpx.AsyncClient를 반환합니다.
+    HTTP/2 keep-alive를 사용하며, h2 패키지가 없으면 HTTP/1.1 keep-alive로 동작합니다.
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        http2 = HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+        _async_client = httpx.AsyncClient(
+            headers=HEADERS,
+            timeout=TIMEOUT,
+            # 연결 풀 설정은 전송 계층에 지정하고, 요청마다 추적 구간을 기록
+            transport=TracingTransport(httpx.AsyncHTTPTransport(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY,
+                ),
+            )),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def ask_perplexity_async(question: str, system_prompt: str = "You are an AI assistant.", use_cache: bool = True) -> str:
+    """
+    Perplexity API에 비동기로 질문을 보내고 응답을 문자열로 반환합니다.
+    공유 연결 풀을 사용하므로 이벤트 루프를 막지 않고 여러 검색을 동시에 처리할 수 있습니다.
+
+    Args:
+        question (str): 사용자 질문
+        system_prompt (str): 시스템 역할 정의 메시지 (기본값: 일반 어시스턴트)
+        use_cache (bool): 응답 캐시 사용 여부 (기본값: True)
+
+    Returns:
+        str: Perplexity AI의 응답 텍스트
+    """
+    key, cached = _get_cached(question, system_prompt, use_cache)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await get_async_client().post(API_URL, json=_build_payload(question, system_prompt))
+        response.raise_for_status()
+        result = response.json()
+        answer = result["choices"][0]["message"]["content"]
+    except httpx.HTTPStatusError as http_err:
+        return f"❌ HTTP 오류 발생: {http_err.response.status_code} - {http_err.response.text}"
+    except Exception as e:
+        return f"❌ 예외 발생: {str(e)}"
+
+    _store_cached(key, answer)
+    return answer
 
 
-def ask_perplexity(question: str, system_prompt: str = "You are an AI assistant.") -> str:
+def _parse_sse_line(line: str):
+    """
+    SSE 한 줄을 해석합니다.
+
+    Returns:
+        None: 데이터가 아닌 줄 / "[DONE]": 스트림 종료 / dict: 청크 JSON
+    """
+    if not line.startswith("data:"):
+        return None
+    data = line[len("data:"):].strip()
+    if not data:
+        return None
+    if data == "[DONE]":
+        return data
+    return json.loads(data)
+
+
+async def stream_perplexity_async(question: str, system_prompt: str = "You are an AI assistant.", use_cache: bool = True):
+    """
+    Perplexity API에 stream: true로 질문을 보내고, 응답 텍스트를 도착하는 대로 조각(str)으로 내보내는 비동기 제너레이터.
+    캐시에 있으면 전체 응답을 한 조각으로 내보내고, [DONE]으로 스트림이 정상 종료된 경우에만 전체 응답을 캐시에 저장합니다.
+    오류가 나면 이미 내보낸 조각과 섞이지 않도록 오류 메시지를 조각으로 내보내지 않고 PerplexityError를 발생시킵니다.
+
+    Args:
+        question (str): 사용자 질문
+        system_prompt (str): 시스템 역할 정의 메시지 (기본값: 일반 어시스턴트)
+        use_cache (bool): 응답 캐시 사용 여부 (기본값: True)
+
+    Yields:
+        str: 응답 텍스트 조각
+
+    Raises:
+        PerplexityError: HTTP 오류나 연결 오류 등으로 응답을 끝까지 받지 못한 경우
+    """
+    key, cached = _get_cached(question, system_prompt, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    answer = ""
+    done = False
+    try:
+        payload = _build_payload(question, system_prompt, stream=True)
+        async with get_async_client().stream("POST", API_URL, json=payload) as response:
+            if response.is_error:
+                await response.aread()
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                chunk = _parse_sse_line(line)
+                if chunk is None:
+                    continue
+                if chunk == "[DONE]":
+                    done = True
+                    break
+                choice = (chunk.get("choices") or [{}])[0]
+                delta = (choice.get("delta") or {}).get("content")
+                if delta is None:
+                    # 누적 message만 보내는 경우 새로 추가된 부분만 계산
+                    content = (choice.get("message") or {}).get("content") or ""
+                    delta = content[len(answer):] if content.startswith(answer) else ""
+                if delta:
+                    answer += delta
+                    yield delta
+    except httpx.HTTPStatusError as http_err:
+        raise PerplexityError(f"❌ HTTP 오류 발생: {http_err.response.status_code} - {http_err.response.text}") from http_err
+    except Exception as e:
+        raise PerplexityError(f"❌ 예외 발생: {str(e)}") from e
+
+    # [DONE] 없이 끊긴 스트림은 잘린 응답일 수 있으므로 캐시하지 않음
+    if answer and done:
+        _store_cached(key, answer)
+
+
+def ask_perplexity(question: str, system_prompt: str = "You are an AI assistant.", use_cache: bool = True) -> str:
     """
     Perplexity API에 질문을 보내고 응답을 문자열로 반환합니다.
+    (동기 버전. 이벤트 루프 안에서는 ask_perplexity_async를 사용하세요.)
 
     Args:
         question (str): 사용자 질문
         system_prompt (str): 시스템 역할 정의 메시지 (기본값: 일반 어시스턴트)
+        use_cache (bool): 응답 캐시 사용 여부 (기본값: True)
 
     Returns:
         str: Perplexity AI의 응답 텍스트
     """
-    data = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": question}
-        ]
-    }
+    key, cached = _get_cached(question, system_prompt, use_cache)
+    if cached is not None:
+        return cached
+
+    data = _build_payload(question, system_prompt)
 
     try:
-        response = httpx.post(API_URL, headers=HEADERS, json=data, timeout=30.0)
+        response = httpx.post(API_URL, headers=HEADERS, json=data, timeout=TIMEOUT)
         response.raise_for_status()
         result = response.json()
-        return result["choices"][0]["message"]["content"]
+        answer = result["choices"][0]["message"]["content"]
     except httpx.HTTPStatusError as http_err:
         return f"❌ HTTP 오류 발생: {http_err.response.status_code} - {http_err.response.text}"
     except Exception as e:
         return f"❌ 예외 발생: {str(e)}"
+
+    _store_cached(key, answer)
+    return answer
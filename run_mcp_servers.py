@@ -0,0 +1,35 @@
+"""
+모든 MCP 서버를 독립 SSE(HTTP) 서비스로 실행합니다.
+
+앱을 MCP_TRANSPORT=sse 로 실행하기 전에 이 스크립트로 서버들을 한 번 띄워 두면,
+세션 초기화 시 Python 인터프리터를 새로 시작하지 않고 HTTP로 바로 연결합니다.
+
+사용법:
+    python run_mcp_servers.py
+"""
+import os
+import subprocess
+import sys
+
+from mcp_config import MCP_SERVERS
+
+
+def main():
+    env = {**os.environ, "MCP_TRANSPORT": "sse"}
+    processes = []
+    for name, server in MCP_SERVERS.items():
+        print(f"{name} MCP 서버 시작 (port {server['port']})")
+        processes.append(subprocess.Popen([sys.executable, server["script"]], env=env))
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
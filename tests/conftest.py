@@ -0,0 +1,11 @@
+"""
+테스트 공통 설정
+
+저장소 루트의 모듈과 benchmarks/의 가짜 Google 서비스(fake_gmail.py, fake_calendar.py)를 불러올 수 있게 경로를 추가합니다.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "benchmarks"))
@@ -0,0 +1,145 @@
+"""로컬 일정 저장소: 전체/syncToken 증분 동기화, syncToken 만료 시 재동기화, 취소/수정된 일정을 가짜 캘린더 서비스로 확인합니다."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import calendar_utils
+from fake_calendar import KST, FakeCalendarService, _event_time
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # list_events_page 등이 get_event_store()로 같은 저장소를 쓰도록 경로를 임시 파일로 지정
+    monkeypatch.setattr(calendar_utils, "STORE_PATH", str(tmp_path / "calendar_store.sqlite3"))
+    return calendar_utils.get_event_store()
+
+
+@pytest.fixture
+def base():
+    return datetime.now(KST).replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def now_rfc3339():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def summaries(service, max_results=20):
+    return [event["summary"] for event in calendar_utils.list_upcoming_events(service, max_results, now_rfc3339())]
+
+
+def test_full_sync_stores_events(store, base):
+    service = FakeCalendarService()
+    for i in range(3):
+        service.add_event(f"일정 {i}", base + timedelta(hours=i), record=False)
+
+    assert calendar_utils.sync_events(service, store)
+
+    assert store.counts()["events"] == 3
+    assert store.get_state("sync_token") is not None
+    assert store.stats["full_syncs"] == 1
+    assert summaries(service) == ["일정 0", "일정 1", "일정 2"]
+
+
+def test_sync_token_delta_applies_added_updated_and_cancelled_events(store, base):
+    service = FakeCalendarService()
+    first = service.add_event("첫 일정", base)
+    second = service.add_event("둘째 일정", base + timedelta(hours=1))
+    calendar_utils.sync_events(service, store)
+    service.reset_calls()
+
+    service.add_event("새 일정", base + timedelta(hours=2))
+    service.update_event(first, summary="바뀐 일정", start=_event_time(base + timedelta(hours=3)),
+                         end=_event_time(base + timedelta(hours=4)))
+    service.cancel_event(second)
+
+    assert calendar_utils.sync_events(service, store, force=True)
+
+    # 변경분만 한 번 조회하고, 수정된 일정은 새 시간 순서로, 취소된 일정은 빠짐
+    assert service.calls["list"] == 1
+    assert store.stats["incremental_syncs"] == 1
+    assert store.stats["changed_events"] == 3
+    assert summaries(service) == ["새 일정", "바뀐 일정"]
+
+
+def test_cancelled_instance_of_recurring_event_is_removed(store, base):
+    service = FakeCalendarService()
+    master = service.add_event("주간 회의", base, recurrence="RRULE:FREQ=WEEKLY;COUNT=3")
+    calendar_utils.sync_events(service, store)
+    assert summaries(service) == ["주간 회의"] * 3
+
+    service.cancel_instance(master, base + timedelta(days=7))
+    calendar_utils.sync_events(service, store, force=True)
+
+    events = calendar_utils.list_upcoming_events(service, 10, now_rfc3339())
+    assert [event["start"]["dateTime"] for event in events] == [
+        (base + timedelta(days=days)).isoformat() for days in (0, 14)
+    ]
+
+
+def test_expired_sync_token_falls_back_to_full_sync(store, base):
+    service = FakeCalendarService()
+    kept = service.add_event("남는 일정", base)
+    calendar_utils.sync_events(service, store)
+    service.add_event("만료 후 일정", base + timedelta(hours=1), record=False)
+    service.cancel_event(kept)
+    service.sync_expired = True
+
+    assert calendar_utils.sync_events(service, store, force=True)
+
+    assert store.stats["full_syncs"] == 2
+    assert store.get_state("calendar_id") == service.calendar_id
+    service.sync_expired = False
+    assert summaries(service) == ["만료 후 일정"]
+
+
+def test_first_listing_uses_api_while_store_syncs_in_background(store, base):
+    service = FakeCalendarService()
+    for i in range(5):
+        service.add_event(f"일정 {i}", base + timedelta(hours=i), record=False)
+
+    events, cursor = calendar_utils.list_events_page(service, page_size=3)
+
+    # 첫 조회는 전체 동기화를 기다리지 않고 Calendar API 결과를 반환
+    assert [event["summary"] for event in events] == ["일정 0", "일정 1", "일정 2"]
+    assert cursor is not None and "|o:" not in cursor
+    assert store.stats["local_queries"] == 0
+
+    store.sync_thread.join(timeout=5)
+    assert store.get_state("sync_token") is not None
+
+    events, cursor = calendar_utils.list_events_page(service, page_size=3)
+    assert [event["summary"] for event in events] == ["일정 0", "일정 1", "일정 2"]
+    assert cursor.endswith("|o:3")
+    events, cursor = calendar_utils.list_events_page(service, page_size=3, page_token=cursor)
+    assert [event["summary"] for event in events] == ["일정 3", "일정 4"]
+    assert cursor is None
+
+
+def test_moving_window_expands_only_the_missing_tail(store, base, monkeypatch):
+    service = FakeCalendarService()
+    service.add_event("매일 회의", base, recurrence="RRULE:FREQ=DAILY")
+    calendar_utils.sync_events(service, store)
+    requested = []
+    instances = service.instances
+
+    def spy(calendarId, eventId, timeMin=None, timeMax=None, **kwargs):
+        requested.append((timeMin, timeMax))
+        return instances(calendarId, eventId, timeMin=timeMin, timeMax=timeMax, **kwargs)
+
+    monkeypatch.setattr(service, "instances", spy)
+    day = 86400
+    start = base.timestamp() // day * day
+
+    calendar_utils._expand_recurring(service, store, start, start + 7 * day)
+    # 이미 펼친 구간 안쪽은 다시 조회하지 않음
+    calendar_utils._expand_recurring(service, store, start + day, start + 7 * day)
+    assert len(requested) == 1
+
+    # 구간이 이틀 뒤로 밀리면 모자란 이틀만 조회하고, 구간 시작 전에 끝난 회차는 지움
+    calendar_utils._expand_recurring(service, store, start + 2 * day, start + 9 * day)
+    assert requested[-1] == (calendar_utils._to_rfc3339(start + 7 * day), calendar_utils._to_rfc3339(start + 9 * day))
+    assert store.counts()["instances"] == 7
+    events = store.query(start + 2 * day, start + 9 * day)
+    assert [event["start"]["dateTime"] for event in events] == [
+        (base + timedelta(days=days)).isoformat() for days in range(2, 9)
+    ]
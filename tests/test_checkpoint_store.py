@@ -0,0 +1,55 @@
+"""저장된 대화 이어가기: 대화 소유자와 같은 계정일 때만 불러오는지 확인합니다."""
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.graph import END, START, MessagesState, StateGraph
+
+from checkpoint_store import create_checkpointer, get_thread_owner, load_conversation, set_thread_owner
+
+
+def reply(state):
+    return {"messages": [AIMessage(content="답변")]}
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def checkpointer(request, tmp_path):
+    if request.param == "memory":
+        return create_checkpointer("memory")
+    return create_checkpointer("sqlite", db_path=str(tmp_path / "checkpoints.sqlite3"))
+
+
+@pytest.fixture
+def thread(checkpointer):
+    builder = StateGraph(MessagesState)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    graph = builder.compile(checkpointer=checkpointer)
+    graph.invoke({"messages": [HumanMessage(content="질문")]}, {"configurable": {"thread_id": "t1"}})
+    return "t1"
+
+
+def test_owner_can_resume_conversation(checkpointer, thread):
+    set_thread_owner(checkpointer, thread, "me@example.com")
+
+    assert load_conversation(checkpointer, thread, "me@example.com") == [
+        {"role": "user", "content": "질문"},
+        {"role": "assistant", "content": "답변"},
+    ]
+
+
+def test_other_account_or_anonymous_session_cannot_resume(checkpointer, thread):
+    set_thread_owner(checkpointer, thread, "me@example.com")
+
+    assert load_conversation(checkpointer, thread, "other@example.com") == []
+    assert load_conversation(checkpointer, thread, None) == []
+
+
+def test_thread_without_owner_is_not_resumed(checkpointer, thread):
+    assert load_conversation(checkpointer, thread, "me@example.com") == []
+
+
+def test_first_owner_is_kept(checkpointer, thread):
+    set_thread_owner(checkpointer, thread, "me@example.com")
+    set_thread_owner(checkpointer, thread, "other@example.com")
+
+    assert get_thread_owner(checkpointer, thread) == "me@example.com"
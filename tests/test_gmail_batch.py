@@ -0,0 +1,50 @@
+"""batch_get_messages: 메시지 N개를 batch 요청 하나로 조회하는지 가짜 Gmail 서비스로 확인합니다."""
+import gmail_utils
+from fake_gmail import FakeGmailService
+
+
+def test_one_batch_replaces_n_get_calls():
+    service = FakeGmailService(10)
+    ids = sorted(service.messages_by_id)
+
+    messages = gmail_utils.batch_get_messages(service, ids)
+
+    assert service.calls["batch"] == 1
+    assert [message["id"] for message in messages] == ids
+
+
+def test_order_follows_requested_ids():
+    service = FakeGmailService(10)
+    ids = sorted(service.messages_by_id, reverse=True)[:7] + ["m000000"]
+
+    messages = gmail_utils.batch_get_messages(service, ids)
+
+    assert [message["id"] for message in messages] == ids
+
+
+def test_failed_message_is_skipped_without_failing_others():
+    service = FakeGmailService(5)
+    ids = ["m000000", "missing", "m000002", "m000004"]
+
+    messages = gmail_utils.batch_get_messages(service, ids)
+
+    assert service.calls["batch"] == 1
+    assert [message["id"] for message in messages] == ["m000000", "m000002", "m000004"]
+
+
+def test_large_requests_are_split_by_batch_size():
+    service = FakeGmailService(gmail_utils.BATCH_SIZE * 2 + 1)
+    ids = sorted(service.messages_by_id)
+
+    messages = gmail_utils.batch_get_messages(service, ids)
+
+    assert service.calls["batch"] == 3
+    assert len(messages) == len(ids)
+
+
+def test_metadata_headers_are_requested():
+    service = FakeGmailService(1)
+
+    message = gmail_utils.batch_get_messages(service, ["m000000"], metadata_headers=["Subject"])[0]
+
+    assert [header["name"] for header in message["payload"]["headers"]] == ["Subject"]
@@ -0,0 +1,119 @@
+"""로컬 메일 인덱스: 전체/증분 동기화, historyId 만료 시 재동기화, 인덱스 기반 페이지 조회를 가짜 Gmail 서비스로 확인합니다."""
+import pytest
+
+import gmail_utils
+from fake_gmail import FakeGmailService
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    # list_emails_page 등이 get_mail_index()로 같은 인덱스를 쓰도록 경로를 임시 파일로 지정
+    monkeypatch.setattr(gmail_utils, "INDEX_PATH", str(tmp_path / "gmail_index.sqlite3"))
+    return gmail_utils.get_mail_index()
+
+
+def inbox_ids(index, max_results=100):
+    return [message["id"] for message in index.list_messages(["INBOX"], max_results)]
+
+
+def newest_first(service):
+    return sorted(service.messages_by_id, reverse=True)
+
+
+def test_full_sync_indexes_recent_messages(index):
+    service = FakeGmailService(30)
+
+    assert gmail_utils.sync_mailbox(service, index)
+
+    assert index.count() == 30
+    assert index.get_state("history_id") == str(service.history_id)
+    assert index.get_state("complete") == "1"
+    assert inbox_ids(index) == newest_first(service)
+    assert index.stats["full_syncs"] == 1
+
+
+def test_incremental_sync_applies_history_deltas(index):
+    service = FakeGmailService(10)
+    gmail_utils.sync_mailbox(service, index)
+    service.reset_calls()
+
+    added = service.add_message(subject="새 메일")
+    service.delete_message("m000003")
+    service.change_labels("m000005", remove=["INBOX"])
+    service.change_labels("m000006", remove=["UNREAD"])
+
+    assert gmail_utils.sync_mailbox(service, index, force=True)
+
+    ids = inbox_ids(index)
+    assert ids[0] == added
+    assert "m000003" not in ids
+    assert "m000005" not in ids
+    unread = [message["id"] for message in index.list_messages(["UNREAD"], 100)]
+    assert "m000006" not in unread
+    assert index.count() == 10
+    # 새 메시지만 조회하고 라벨 변경은 API 호출 없이 반영
+    assert service.calls["history"] == 1
+    assert service.calls["get"] == 1
+    assert service.calls["list"] == 0
+    assert index.get_state("history_id") == str(service.history_id)
+
+
+def test_sync_is_skipped_within_interval(index):
+    service = FakeGmailService(5)
+    gmail_utils.sync_mailbox(service, index)
+    service.reset_calls()
+
+    assert gmail_utils.sync_mailbox(service, index)
+
+    assert service.calls["history"] == 0
+
+
+def test_expired_history_id_falls_back_to_full_sync(index):
+    service = FakeGmailService(5)
+    gmail_utils.sync_mailbox(service, index)
+    service.add_message(subject="만료 후 메일", record_history=False)
+    service.history_expired = True
+
+    assert gmail_utils.sync_mailbox(service, index, force=True)
+
+    assert index.stats["full_syncs"] == 2
+    assert index.count() == 6
+    assert inbox_ids(index) == newest_first(service)
+
+
+def test_index_pagination_walks_all_pages(index):
+    service = FakeGmailService(25)
+    gmail_utils.sync_mailbox(service, index)
+    service.reset_calls()
+
+    pages, cursor = [], None
+    while True:
+        messages, cursor = gmail_utils.list_emails_page(service, page_size=10, page_token=cursor)
+        pages.append([message["id"] for message in messages])
+        if cursor is None:
+            break
+        assert cursor.startswith("o:")
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert sum(pages, []) == newest_first(service)
+    assert service.calls["list"] == 0
+    assert service.calls["batch"] == 0
+
+
+def test_first_listing_uses_api_while_index_syncs_in_background(index):
+    service = FakeGmailService(15)
+
+    messages, cursor = gmail_utils.list_emails_page(service, page_size=10)
+
+    # 첫 조회는 전체 동기화를 기다리지 않고 Gmail API 결과를 반환
+    assert [message["id"] for message in messages] == newest_first(service)[:10]
+    assert cursor is not None and not cursor.startswith("o:")
+    assert index.stats["remote_queries"] == 1
+
+    index.sync_thread.join(timeout=5)
+    assert index.get_state("history_id") == str(service.history_id)
+
+    messages, cursor = gmail_utils.list_emails_page(service, page_size=10)
+    assert [message["id"] for message in messages] == newest_first(service)[:10]
+    assert cursor == "o:10"
+    assert index.stats["local_queries"] == 1
@@ -0,0 +1,55 @@
+"""한국어 검색 토큰화와 로컬 전문 검색을 확인합니다. (한글과 숫자/영문이 붙은 제목 포함)"""
+import pytest
+
+import gmail_utils
+from fake_gmail import FakeGmailService
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("회의록 Update", ["회의", "의록", "update"]),
+    ("3월회의 안내", ["3", "월회", "회의", "안내"]),
+    ("Zoom회의록", ["zoom", "회의", "의록"]),
+    ("회의2차", ["회의", "2", "차"]),
+    ("a_b", ["a", "b"]),
+])
+def test_tokenize_splits_where_script_changes(text, tokens):
+    assert gmail_utils.tokenize_for_search(text) == tokens
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(gmail_utils, "INDEX_PATH", str(tmp_path / "gmail_index.sqlite3"))
+    service = FakeGmailService()
+    service.add_message(subject="3월회의 안내", record_history=False)
+    service.add_message(subject="Zoom회의록 공유", record_history=False)
+    service.add_message(subject="점심 메뉴", body="다음 회의는 금요일", record_history=False)
+    service.add_message(subject="주간 보고", record_history=False)
+    gmail_utils.sync_mailbox(service, gmail_utils.get_mail_index())
+    service.reset_calls()
+    return service
+
+
+def subjects(messages):
+    return sorted(gmail_utils.format_email_for_display(message)["subject"] for message in messages)
+
+
+def test_local_search_finds_mixed_script_subjects(service):
+    messages = gmail_utils.search_emails(service, "회의")
+
+    assert subjects(messages) == ["3월회의 안내", "Zoom회의록 공유", "점심 메뉴"]
+    assert service.calls["list"] == 0
+
+
+def test_local_search_matches_latin_part_of_mixed_word(service):
+    assert subjects(gmail_utils.search_emails(service, "zoom")) == ["Zoom회의록 공유"]
+    assert subjects(gmail_utils.search_emails(service, "subject:회의록")) == ["Zoom회의록 공유"]
+
+
+def test_index_built_with_old_tokenizer_is_rebuilt(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    index = gmail_utils.MailIndex(path)
+    index.set_state(history_id="1000")  # 토큰화 방식 버전이 기록되지 않은 예전 인덱스
+
+    reopened = gmail_utils.MailIndex(path)
+
+    assert reopened.get_state("history_id") is None
@@ -0,0 +1,52 @@
+"""토큰 카운터: 토크나이저를 백그라운드에서 불러오는 동안 근사치로 세고, 불러온 뒤 정확한 값으로 세는지 확인합니다."""
+import threading
+
+from langchain_core.messages import HumanMessage
+
+import history_compactor
+
+
+class SlowTokenizer:
+    """from_pretrained가 release 이벤트까지 기다리는 가짜 토크나이저 (글자 하나를 토큰 하나로 셈)"""
+
+    release = None
+
+    @classmethod
+    def from_pretrained(cls, name):
+        cls.release.wait(timeout=5)
+        return cls()
+
+    def encode(self, text, add_special_tokens=False):
+        return type("Encoding", (), {"ids": list(text)})()
+
+
+def test_counts_approximately_until_background_load_finishes(monkeypatch):
+    SlowTokenizer.release = threading.Event()
+    monkeypatch.setattr(history_compactor, "Tokenizer", SlowTokenizer)
+    counter = history_compactor.TokenCounter("fake-tokenizer")
+    message = HumanMessage(content="안녕하세요 반갑습니다", id="m1")
+
+    # 다운로드를 기다리지 않고 근사치로 계산하며, 근사치는 캐시하지 않음
+    approximate = counter([message])
+    assert approximate == history_compactor.count_tokens_approximately([message])
+
+    SlowTokenizer.release.set()
+    counter._load_thread.join(timeout=5)
+
+    assert counter([message]) == history_compactor.TOKENS_PER_MESSAGE + len(message.content)
+
+
+def test_failed_load_falls_back_to_approximation(monkeypatch):
+    class Offline:
+        @classmethod
+        def from_pretrained(cls, name):
+            raise OSError("offline")
+
+    monkeypatch.setattr(history_compactor, "Tokenizer", Offline)
+    counter = history_compactor.TokenCounter("fake-tokenizer")
+    counter.start_loading()
+    counter._load_thread.join(timeout=5)
+    message = HumanMessage(content="hello", id="m1")
+
+    assert counter([message]) == history_compactor.count_tokens_approximately([message])
+    assert counter._tokenizer_failed
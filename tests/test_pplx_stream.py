@@ -0,0 +1,91 @@
+"""Perplexity 스트리밍: 정상 종료 시에만 캐시하고, 중간 실패는 텍스트 조각이 아닌 PerplexityError로 알리는지 확인합니다."""
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+os.environ.setdefault("PERPLEXITY_API_KEY", "test-key")
+import pplx_utils  # noqa: E402
+
+
+def sse(*deltas, done=True):
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}\n\n" for delta in deltas]
+    if done:
+        lines.append("data: [DONE]\n\n")
+    return lines
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    """응답 본문 스트림을 만드는 함수 또는 httpx.Response를 돌려주는 가짜 API로 공유 클라이언트를 바꿉니다."""
+    pplx_utils.clear_cache()
+
+    def install(body):
+        def handler(request):
+            if isinstance(body, httpx.Response):
+                return body
+            return httpx.Response(200, content=body(), headers={"content-type": "text/event-stream"})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(pplx_utils, "get_async_client", lambda: client)
+
+    yield install
+    pplx_utils.clear_cache()
+
+
+def body(*lines):
+    async def stream():
+        for line in lines:
+            yield line.encode()
+    return stream
+
+
+def collect(question):
+    async def run():
+        return [delta async for delta in pplx_utils.stream_perplexity_async(question)]
+    return asyncio.run(run())
+
+
+def test_completed_stream_is_cached(serve):
+    serve(body(*sse("안녕", "하세요")))
+
+    assert collect("질문") == ["안녕", "하세요"]
+    assert pplx_utils.get_cache_stats()["size"] == 1
+    # 캐시 적중 시 전체 응답을 한 조각으로 반환
+    assert collect("질문") == ["안녕하세요"]
+
+
+def test_stream_without_done_is_not_cached(serve):
+    serve(body(*sse("잘린", " 응답", done=False)))
+
+    assert collect("질문") == ["잘린", " 응답"]
+    assert pplx_utils.get_cache_stats()["size"] == 0
+
+
+def test_failure_after_partial_text_raises(serve):
+    async def broken():
+        yield sse("부분")[0].encode()
+        raise httpx.ReadError("connection reset")
+
+    serve(broken)
+
+    received = []
+
+    async def run():
+        async for delta in pplx_utils.stream_perplexity_async("질문"):
+            received.append(delta)
+
+    with pytest.raises(pplx_utils.PerplexityError, match="^❌ 예외 발생"):
+        asyncio.run(run())
+    # 오류 메시지가 응답 조각으로 섞이지 않고, 잘린 응답은 캐시되지 않음
+    assert received == ["부분"]
+    assert pplx_utils.get_cache_stats()["size"] == 0
+
+
+def test_http_error_raises(serve):
+    serve(httpx.Response(429, text="rate limited"))
+
+    with pytest.raises(pplx_utils.PerplexityError, match="^❌ HTTP 오류 발생: 429"):
+        collect("질문")
@@ -0,0 +1,450 @@
+"""
+요청 지연 시간 추적(tracing)
+
+앱(process_query, LangGraph 노드, 모델/도구 호출)과 MCP 서버(도구 실행, 외부 HTTP 호출)의 구간(span)을 기록합니다.
+외부 서비스 없이 동작하며, 구간은 프로세스 안의 최근 구간 버퍼에 보관하고 TRACE_FILE을 지정한 경우에만 JSONL 파일에도 기록합니다.
+여러 프로세스(앱, MCP 서버)가 같은 파일에 한 줄씩 추가하므로, 파일을 요약하면 전체 도구별 p50/p95/p99를 볼 수 있습니다.
+(파일은 자동으로 정리하지 않으므로 측정할 때만 지정하세요)
+
+사용법 (저장소 루트에서):
+    python tracing.py traces.jsonl            # 이름별 p50/p95/p99 요약
+    python tracing.py traces.jsonl --kind tool
+"""
+import argparse
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 추적 설정
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "")  # 지정하면 JSONL 파일에도 기록 (기본값: 프로세스 안에만 보관)
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))  # 프로세스 안에 보관할 최근 구간 수
+TRACE_HISTOGRAM_SIZE = int(os.getenv("TRACE_HISTOGRAM_SIZE", "1000"))  # 이름별로 백분위 계산에 쓸 최근 소요 시간 수
+SERVICE_NAME = os.getenv("TRACE_SERVICE") or os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def percentile(sorted_values, q):
+    """정렬된 값 목록의 q 백분위수 (nearest-rank, 값이 없으면 None)"""
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), int(-(-q * len(sorted_values) // 100))))
+    return sorted_values[rank - 1]
+
+
+def summarize_durations(durations):
+    """소요 시간(ms) 목록의 count/p50/p95/p99/max 요약"""
+    values = sorted(durations)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": values[-1] if values else None,
+    }
+
+
+class Span:
+    """추적 구간 하나. end()를 호출하면 tracer에 기록됩니다."""
+
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_time", "_started", "duration_ms", "status", "error", "_token")
+
+    def __init__(self, tracer, name, kind="internal", parent=None, attributes=None):
+        self.tracer = tracer
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+        self.error = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_error(self, error):
+        self.status = "error"
+        self.error = str(error)[:500]
+
+    def end(self, error=None):
+        if self.duration_ms is not None:
+            return
+        if error is not None:
+            self.set_error(error)
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        self.tracer._record(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.tracer.service,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    # with / async with 로 사용하면 현재 구간으로 설정되어 안쪽 구간의 부모가 됨
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current_span.reset(self._token)
+            self._token = None
+        self.end(error=exc if exc is not None and not isinstance(exc, GeneratorExit) else None)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class _NoopSpan:
+    """추적이 꺼져 있을 때 쓰는 빈 구간"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, error):
+        pass
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class Tracer:
+    """
+    구간을 기록하는 추적기.
+
+    - 최근 buffer_size개 구간을 메모리에 보관합니다. (recent_spans / recent_traces)
+    - (kind, name)별 최근 histogram_size개 소요 시간으로 p50/p95/p99를 계산합니다. (latency_summary)
+    - trace_file이 있으면 끝난 구간을 JSONL 한 줄로 추가합니다.
+    """
+
+    def __init__(self, service=SERVICE_NAME, trace_file=TRACE_FILE, enabled=TRACING_ENABLED,
+                 buffer_size=TRACE_BUFFER_SIZE, histogram_size=TRACE_HISTOGRAM_SIZE):
+        """
+        Args:
+            service: 구간에 기록할 프로세스 이름 (app, gsuite_mcp_server 등)
+            trace_file: 구간을 추가할 JSONL 파일 경로 (None/빈 문자열이면 기록하지 않음)
+            enabled: False이면 구간을 만들지 않음
+            buffer_size: 메모리에 보관할 최근 구간 수
+            histogram_size: (kind, name)별 백분위 계산에 쓸 최근 소요 시간 수
+        """
+        self.service = service
+        self.trace_file = trace_file or None
+        self.enabled = enabled
+        self.histogram_size = histogram_size
+        self._spans = deque(maxlen=buffer_size)
+        self._durations = {}  # (kind, name) -> deque(소요 시간 ms)
+        self._errors = {}  # (kind, name) -> 오류 수
+        self._lock = threading.Lock()
+        self._file = None
+
+    def start_span(self, name, kind="internal", parent=None, **attributes):
+        """
+        구간을 시작합니다. parent를 주지 않으면 현재 구간(with 블록)의 하위 구간이 됩니다.
+        끝낼 때는 end()를 호출하거나 with / async with 블록으로 사용합니다.
+        """
+        if not self.enabled:
+            return _NoopSpan()
+        if parent is None:
+            parent = _current_span.get()
+        return Span(self, name, kind, parent if isinstance(parent, Span) else None, attributes)
+
+    def span(self, name, kind="internal", **attributes):
+        """with / async with 블록으로 쓰는 구간 (start_span과 같음)"""
+        return self.start_span(name, kind, **attributes)
+
+    def _record(self, span):
+        record = span.to_dict()
+        key = (span.kind, span.name)
+        with self._lock:
+            self._spans.append(record)
+            durations = self._durations.get(key)
+            if durations is None:
+                durations = self._durations[key] = deque(maxlen=self.histogram_size)
+            durations.append(span.duration_ms)
+            if span.status == "error":
+                self._errors[key] = self._errors.get(key, 0) + 1
+            if self.trace_file:
+                self._write(record)
+
+    def _write(self, record):
+        try:
+            if self._file is None:
+                # 줄 단위 버퍼링: 구간 하나가 끝날 때마다 한 줄씩 기록 (여러 프로세스가 같은 파일에 추가)
+                self._file = open(self.trace_file, "a", encoding="utf-8", buffering=1)
+            self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"ERROR (Tracer): 추적 파일 {self.trace_file}에 기록할 수 없어 파일 기록을 중단합니다: {e}", file=sys.stderr)
+            self.trace_file = None
+
+    # --- 조회 --- START
+    def recent_spans(self, limit=None):
+        """최근 끝난 구간을 오래된 순으로 반환합니다."""
+        with self._lock:
+            spans = list(self._spans)
+        return spans[-limit:] if limit else spans
+
+    def recent_traces(self, limit=10):
+        """최근 요청(trace)별로 구간을 묶어 최신순으로 반환합니다. ([{"trace_id", "spans"}])"""
+        traces = {}
+        for record in self.recent_spans():
+            traces.setdefault(record["trace_id"], []).append(record)
+        ordered = sorted(traces.items(), key=lambda item: max(span["start_time"] for span in item[1]), reverse=True)
+        return [{"trace_id": trace_id, "spans": spans} for trace_id, spans in ordered[:limit]]
+
+    def latency_summary(self, kind=None):
+        """
+        이름별 지연 시간 요약을 반환합니다.
+
+        Returns:
+            dict: {"kind:name": {"count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}
+        """
+        with self._lock:
+            items = [(key, list(durations), self._errors.get(key, 0)) for key, durations in self._durations.items()]
+        return {
+            f"{key[0]}:{key[1]}": {**summarize_durations(durations), "errors": errors}
+            for key, durations, errors in sorted(items)
+            if kind is None or key[0] == kind
+        }
+
+    def export_json(self, path):
+        """메모리에 있는 최근 구간을 trace별로 묶어 JSON 파일로 저장합니다."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.recent_traces(limit=None), f, ensure_ascii=False, default=str)
+        return path
+    # --- 조회 --- END
+
+    def traced(self, name=None, kind="internal"):
+        """
+        함수 실행을 구간으로 기록하는 데코레이터. (동기/비동기 함수 모두 지원, 시그니처는 유지)
+        MCP 도구에 쓸 때는 @mcp.tool() 아래에 둡니다.
+        """
+        def decorator(fn):
+            span_name = name or fn.__name__
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with self.start_span(span_name, kind):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.start_span(span_name, kind):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+class TracingTransport(httpx.AsyncBaseTransport):
+    """
+    httpx 요청마다 http 구간을 기록하는 전송 계층. (응답 헤더를 받을 때까지의 시간)
+    예: httpx.AsyncClient(transport=TracingTransport(httpx.AsyncHTTPTransport(http2=True)))
+    """
+
+    def __init__(self, transport=None, tracer=None):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+        self._tracer = tracer
+
+    async def handle_async_request(self, request):
+        tracer = self._tracer or get_tracer()
+        with tracer.start_span(f"{request.method} {request.url.host}", "http", path=request.url.path) as span:
+            response = await self._transport.handle_async_request(request)
+            span.set_attribute("status_code", response.status_code)
+            if response.status_code >= 500:
+                span.set_error(f"HTTP {response.status_code}")
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+# --- LangGraph / LangChain 콜백 --- START
+try:
+    from langchain_core.callbacks import BaseCallbackHandler
+except ImportError:  # MCP 서버 프로세스처럼 langchain이 필요 없는 곳에서도 이 모듈을 쓸 수 있도록
+    BaseCallbackHandler = None
+
+if BaseCallbackHandler is not None:
+    class TracingCallbackHandler(BaseCallbackHandler):
+        """
+        에이전트 실행 중 LangGraph 노드(agent, tools), 모델 호출, 도구 호출을 구간으로 기록하는 콜백.
+        RunnableConfig(callbacks=[TracingCallbackHandler()])로 전달하며, 실행을 감싼 구간(process_query)의 하위 구간이 됩니다.
+        노드가 아닌 내부 체인은 기록하지 않고, 그 안의 구간은 가장 가까운 기록된 상위 구간에 붙입니다.
+        """
+
+        run_inline = True  # 비동기 실행에서도 같은 태스크에서 순서대로 호출 (현재 구간 컨텍스트 유지)
+
+        def __init__(self, tracer=None):
+            self.tracer = tracer or get_tracer()
+            self._spans = {}  # run_id -> 기록 중인 구간
+            self._parents = {}  # run_id -> 구간을 붙일 상위 구간 (기록하지 않는 run 포함)
+
+        def _parent(self, parent_run_id):
+            if parent_run_id is None:
+                return _current_span.get()
+            return self._parents.get(parent_run_id) or _current_span.get()
+
+        def _start(self, run_id, parent_run_id, name, kind, **attributes):
+            span = self.tracer.start_span(name, kind, parent=self._parent(parent_run_id), **attributes)
+            self._spans[run_id] = span
+            self._parents[run_id] = span
+            return span
+
+        def _end(self, run_id, error=None):
+            self._parents.pop(run_id, None)
+            span = self._spans.pop(run_id, None)
+            if span is not None:
+                span.end(error=error)
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, name=None, **kwargs):
+            node = (metadata or {}).get("langgraph_node")
+            if parent_run_id is None:
+                self._start(run_id, parent_run_id, name or "graph", "graph")
+            elif node and name == node:
+                self._start(run_id, parent_run_id, node, "node", step=(metadata or {}).get("langgraph_step"))
+            else:
+                self._parents[run_id] = self._parent(parent_run_id)
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+            model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "chat_model")
+            self._start(run_id, parent_run_id, model, "llm", messages=sum(len(batch) for batch in messages))
+
+        def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+            model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "llm")
+            self._start(run_id, parent_run_id, model, "llm")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            span = self._spans.get(run_id)
+            usage = (response.llm_output or {}).get("token_usage") if response is not None else None
+            if span is not None and usage:
+                span.set_attribute("token_usage", usage)
+            self._end(run_id)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+
+        def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+            self._start(run_id, parent_run_id, (serialized or {}).get("name", "tool"), "tool")
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error=error)
+else:
+    TracingCallbackHandler = None
+# --- LangGraph / LangChain 콜백 --- END
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """프로세스에서 공유하는 추적기를 반환합니다."""
+    global _tracer
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer()
+    return _tracer
+
+
+def span(name, kind="internal", **attributes):
+    """공유 추적기의 구간 (with / async with)"""
+    return get_tracer().span(name, kind, **attributes)
+
+
+def traced(name=None, kind="internal"):
+    """공유 추적기로 함수 실행을 기록하는 데코레이터"""
+    def decorator(fn):
+        return get_tracer().traced(name, kind)(fn)
+    return decorator
+
+
+def summarize_trace_file(path, kind=None):
+    """
+    JSONL 추적 파일(여러 프로세스가 기록)을 읽어 (kind, name)별 지연 시간 요약을 반환합니다.
+
+    Returns:
+        dict: {"kind:name": {"count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms", "services"}}
+    """
+    durations, errors, services = {}, {}, {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # 쓰는 중이던 마지막 줄 등
+            if kind is not None and record.get("kind") != kind:
+                continue
+            key = f"{record.get('kind')}:{record.get('name')}"
+            durations.setdefault(key, []).append(record.get("duration_ms") or 0.0)
+            errors[key] = errors.get(key, 0) + (record.get("status") == "error")
+            services.setdefault(key, set()).add(record.get("service"))
+    return {
+        key: {**summarize_durations(values), "errors": errors[key], "services": sorted(map(str, services[key]))}
+        for key, values in sorted(durations.items())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace_file", nargs="?", default=TRACE_FILE or "traces.jsonl", help="JSONL 추적 파일")
+    parser.add_argument("--kind", default=None, help="요약할 구간 종류 (request, graph, node, llm, tool, http)")
+    args = parser.parse_args()
+    print(json.dumps(summarize_trace_file(args.trace_file, args.kind), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()